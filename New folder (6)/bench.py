@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# Offline checks and benchmarks for the bot's vision pipeline.
+#
+#   python bench.py ssim [photos...]     fast_ssim vs skimage's structural_similarity: agreement and speed
+#   python bench.py ocr CROPS_DIR        glyph-atlas OCR vs pytesseract on labelled nameplate crops (see build_glyph_atlas.py)
+#   python bench.py webhook              WebhookDispatcher against a local stand-in server (slow and failing endpoints)
+#   python bench.py detect RECORDING --model detector.onnx [--model detector.int8.onnx]
+#                                        template matching vs the ONNX detector on recorded frames: ms per frame and agreement
+#   python bench.py quantize MODEL [RECORDING]
+#                                        int8 copy of an exported detector, calibrated on recorded frames when given
+import argparse
+import collections
+import csv
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import botsruntest as bot
+
+def timed(fn, repeat):
+    fn(); start = time.perf_counter()
+    for _ in range(repeat): fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def load_gray(path): return cv2.cvtColor(np.array(Image.open(path).convert("RGB")), cv2.COLOR_RGB2GRAY)
+
+def default_photos(): return sorted(glob.glob(os.path.join(bot.SCRIPT_DIR, "photos_data", "**", "*.png"), recursive=True))
+
+def bench_ssim(args):
+    from skimage.metrics import structural_similarity as ssim
+    paths = args.photos or default_photos()
+    if not paths: sys.exit("No photos to compare; pass image paths or add photos under photos_data/.")
+    rng = np.random.default_rng(0); worst = 0.0; rows = []
+    for path in paths:
+        template = cv2.resize(load_gray(path), (args.width, args.height)); stats = bot.SsimStats(template)
+        frames = {"identical": template, "noise": np.clip(template + rng.normal(0, 12, template.shape), 0, 255).astype(np.uint8),
+                  "shifted": np.roll(template, (9, -14), axis=(0, 1)), "random": rng.integers(0, 256, template.shape, dtype=np.uint8),
+                  "inverted": 255 - template}
+        for label, frame in frames.items():
+            ref, fast = ssim(template, frame), bot.fast_ssim(stats, frame); worst = max(worst, abs(ref - fast))
+            rows.append((os.path.basename(path), label, ref, fast))
+        ref_ms = timed(lambda: ssim(template, frames["noise"]), args.repeat); fast_ms = timed(lambda: bot.fast_ssim(stats, frames["noise"]), args.repeat)
+        print(f"{os.path.basename(path)} @ {args.width}x{args.height}: skimage {ref_ms:.2f} ms, fast_ssim {fast_ms:.2f} ms ({ref_ms / fast_ms:.1f}x)")
+    for name, label, ref, fast in rows: print(f"  {name:<30} {label:<10} skimage={ref:.6f} fast={fast:.6f} diff={abs(ref - fast):.2e}")
+    print(f"Max abs difference: {worst:.2e} (tolerance {args.tolerance:.0e})")
+    if worst > args.tolerance: sys.exit(1)
+
+def bench_ocr(args):
+    with open(os.path.join(args.crops, "labels.tsv"), encoding="utf-8", newline="") as f: rows = [r for r in csv.reader(f, delimiter="\t") if len(r) > 1 and r[1]]
+    if not rows: sys.exit(f"No labelled crops in '{args.crops}'.")
+    atlas = bot.GlyphAtlas.load(args.atlas); crops = [(bot.nameplate_threshold(Image.open(os.path.join(args.crops, name)).convert("RGB")), label) for name, label in rows]
+    engines = {"glyph": lambda t: atlas.read(t)[0], "pytesseract": lambda t: bot.pytesseract.image_to_string(t, config=r'--oem 3 --psm 7').replace('_', '').strip()}
+    if args.tesseract: bot.pytesseract.pytesseract.tesseract_cmd = args.tesseract
+    for name, read in engines.items():
+        try:
+            correct, start = 0, time.perf_counter()
+            for thresh, label in crops: correct += read(thresh).lower() == label.lower()
+            ms = (time.perf_counter() - start) / len(crops) * 1000
+            print(f"{name:<12} accuracy {correct}/{len(crops)} ({correct / len(crops):.1%}), {ms:.2f} ms per crop")
+        except Exception as e: print(f"{name:<12} unavailable: {e}")
+    confidences = [atlas.read(t)[1] for t, _ in crops]
+    print(f"glyph confidence: min {min(confidences):.3f}, median {float(np.median(confidences)):.3f} (Tesseract fallback below {bot.DEFAULTS['glyph_min_confidence']})")
+
+def stand_in_server(delay, fail_first):
+    # Local webhook endpoint: every request waits `delay` seconds and the first `fail_first` requests per path get a 503.
+    seen = collections.Counter(); received = collections.Counter(); lock = threading.Lock()
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0))); time.sleep(delay)
+            with lock: seen[self.path] += 1; ok = seen[self.path] > fail_first; received[self.path] += ok
+            self.send_response(204 if ok else 503); self.send_header("Retry-After", "0"); self.end_headers()
+        def log_message(self, *args): pass
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler); threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received
+
+def bench_webhook(args):
+    server, received = stand_in_server(args.delay, args.fail_first)
+    urls = [f"http://127.0.0.1:{server.server_address[1]}/hook{i}" for i in range(args.urls)]
+    image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (1080, 1920, 3), dtype=np.uint8))
+    dispatcher = bot.WebhookDispatcher(max_pending=args.messages, retries=args.fail_first + 1, backoff=0.05)
+    enqueue, start = [], time.perf_counter()
+    for i in range(args.messages):
+        t = time.perf_counter(); dispatcher.send(urls, f"bench message {i}", image, fmt=args.format, scale=args.scale); enqueue.append((time.perf_counter() - t) * 1000)
+    dispatcher.flush(); total = time.perf_counter() - start; dispatcher.close(); server.shutdown()
+    name, mime, data = bot.encode_attachment(image, fmt=args.format, scale=args.scale)
+    print(f"{args.messages} messages x {args.urls} URLs ({mime}, {len(data) / 1024:.0f} KiB each), endpoint delay {args.delay * 1000:.0f} ms, first {args.fail_first} request(s) per URL fail")
+    print(f"  send() on the caller: mean {np.mean(enqueue):.3f} ms, max {max(enqueue):.3f} ms")
+    print(f"  delivered {sum(received.values())}/{args.messages * args.urls} in {total:.2f} s; dispatcher stats {dict(dispatcher.stats)}")
+    print(f"  serial posting would block the caller for at least {args.messages * args.urls * args.delay:.2f} s")
+
+def recorded_frames(recording, limit=0):
+    with open(os.path.join(recording, "index.jsonl"), encoding="utf-8") as f: entries = [json.loads(line) for line in f if line.strip()]
+    step = max(1, len(entries) // limit) if limit else 1
+    for entry in entries[::step]: yield bot.CapturedFrame([(tuple(t["box"]), Image.open(os.path.join(recording, t["file"])).convert("RGB")) for t in entry["tiles"]], timestamp=entry["t"])
+
+def recorded_regions(recording):
+    # The scan regions saved with the session, else the ones in the loaded settings.
+    try: return {name: tuple(box) for name, box in json.load(open(os.path.join(recording, "session.json"), encoding="utf-8"))["regions"].items()}
+    except (OSError, KeyError, ValueError): return {name: bot.get_region(prefix) for name, prefix in bot.CAPTURE_REGIONS.items()}
+
+def clip_to_frame(frame, box):
+    # The largest part of box inside one recorded tile (ROI-only recordings rarely hold a whole action region).
+    parts = [(max(box[0], t[0]), max(box[1], t[1]), min(box[2], t[2]), min(box[3], t[3])) for t, _ in frame.tiles]
+    parts = [p for p in parts if p[2] > p[0] and p[3] > p[1]]
+    return max(parts, key=lambda p: (p[2] - p[0]) * (p[3] - p[1]), default=None)
+
+def load_settings(app_data):
+    bot.APP_DATA_FILE = os.path.abspath(app_data); bot.settings = bot.load_app_data()[0]
+    bot.SCALES.configure(bot.template_scales(bot.settings), int(bot.settings.get("scale_miss_limit", 12)))
+
+def bench_detect(args):
+    load_settings(args.app_data); regions = recorded_regions(args.recording)
+    targets = [("header", "header", bot.settings["ITEMS_HEADER_PATH"], bot.HEADER_THRESHOLD)]
+    targets += [("action", bot.DETECTOR_CLASSES[key], bot.settings[key], bot.BUTTON_THRESHOLD) for _, key in bot.BUTTON_TEMPLATES if bot.settings.get(key)]
+    targets += [("photo", bot.SPRITE_CLASS, None, None)]
+    detectors = [bot.OnnxDetector(path, args.conf, args.iou, args.threads) for path in args.model]
+    times = collections.defaultdict(list); found = {d.path: collections.defaultdict(collections.Counter) for d in detectors}; frames = 0
+    for frame in recorded_frames(args.recording, args.frames):
+        rois = {name: clip_to_frame(frame, box) for name, box in regions.items()}; frames += 1
+        start = time.perf_counter(); seen = {}
+        for region, cls, path, threshold in targets:
+            if path and rois.get(region): seen[cls] = bot.template_match(frame, path, rois[region], threshold)[0] >= threshold
+        times["template"].append((time.perf_counter() - start) * 1000)
+        unique = list(dict.fromkeys(rois[r] for r, *_ in targets if rois.get(r)))
+        for detector in detectors:
+            start = time.perf_counter(); detections = detector.detect(frame, unique); times[detector.path].append((time.perf_counter() - start) * 1000)
+            for region, cls, _, _ in targets:
+                roi = rois.get(region); hit = bool(roi) and any(c == cls and roi[0] <= (b[0] + b[2]) / 2 <= roi[2] and roi[1] <= (b[1] + b[3]) / 2 <= roi[3] for c, _, b in detections)
+                found[detector.path][cls][seen.get(cls), hit] += 1
+    if not frames: sys.exit(f"No frames in '{args.recording}'.")
+    print(f"{frames} frames from '{args.recording}'")
+    labels = {"template": "template matching", **{d.path: f"{os.path.basename(d.path)} ({d.size}px, batch {d.batch or 'dynamic'})" for d in detectors}}
+    for name, ms in times.items(): print(f"  {labels[name]:<40} mean {np.mean(ms):7.2f} ms, p95 {np.percentile(ms, 95):7.2f} ms per frame")
+    for path, classes in found.items():
+        print(f"  agreement with templates, {os.path.basename(path)}:")
+        for cls, c in classes.items():
+            if cls == bot.SPRITE_CLASS: print(f"    {cls:<12} detected in {c[None, True]}/{frames} frames (no template equivalent)"); continue
+            print(f"    {cls:<12} both {c[True, True]}, template only {c[True, False]}, detector only {c[False, True]}, neither {c[False, False]}, not in frame {c[None, False] + c[None, True]}")
+
+def bench_quantize(args):
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    out = args.out or os.path.splitext(args.model)[0] + ".int8.onnx"
+    if not args.recording:
+        quantize_dynamic(args.model, out, weight_type=QuantType.QInt8); print(f"Wrote '{out}' (dynamic int8: weights quantized, activations at run time)."); return
+    load_settings(args.app_data); regions = recorded_regions(args.recording); detector = bot.OnnxDetector(args.model)
+    crops = [bot.letterbox(frame.crop(roi), detector.size)[0] for frame in recorded_frames(args.recording, args.frames) for roi in dict.fromkeys(clip_to_frame(frame, box) for box in regions.values()) if roi]
+    if not crops: sys.exit(f"No calibration crops in '{args.recording}'.")
+    class Reader(CalibrationDataReader):
+        def __init__(self): self.items = iter(crops)
+        def get_next(self):
+            crop = next(self.items, None); return None if crop is None else {detector.input_name: (crop[None].astype(np.float32) / 255)}
+    quantize_static(args.model, out, Reader(), quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    print(f"Wrote '{out}' (static int8, calibrated on {len(crops)} crops).")
+
+def main():
+    parser = argparse.ArgumentParser(description="Vision pipeline checks and benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("ssim", help="check fast_ssim against skimage and compare speed")
+    p.add_argument("photos", nargs="*"); p.add_argument("--width", type=int, default=910); p.add_argument("--height", type=int, default=750)
+    p.add_argument("--repeat", type=int, default=10); p.add_argument("--tolerance", type=float, default=1e-4); p.set_defaults(func=bench_ssim)
+    p = sub.add_parser("ocr", help="compare glyph-atlas OCR with pytesseract on labelled crops")
+    p.add_argument("crops"); p.add_argument("--atlas", default=bot.DEFAULTS["glyph_atlas_path"]); p.add_argument("--tesseract", default="")
+    p.set_defaults(func=bench_ocr)
+    p = sub.add_parser("webhook", help="exercise the webhook dispatcher against a local stand-in server")
+    p.add_argument("--urls", type=int, default=3); p.add_argument("--messages", type=int, default=5); p.add_argument("--delay", type=float, default=0.3)
+    p.add_argument("--fail-first", type=int, default=1); p.add_argument("--format", choices=["png", "jpeg"], default="png"); p.add_argument("--scale", type=float, default=1.0)
+    p.set_defaults(func=bench_webhook)
+    p = sub.add_parser("detect", help="compare template matching with ONNX detector models on recorded frames")
+    p.add_argument("recording"); p.add_argument("--model", action="append", required=True, help="exported ONNX detector (repeat to compare, e.g. fp32 and int8)")
+    p.add_argument("--app-data", default=bot.APP_DATA_FILE); p.add_argument("--frames", type=int, default=200, help="frames to sample (0 = all)")
+    p.add_argument("--conf", type=float, default=bot.DEFAULTS["detector_conf"]); p.add_argument("--iou", type=float, default=bot.DEFAULTS["detector_iou"])
+    p.add_argument("--threads", type=int, default=bot.DEFAULTS["detector_threads"], help="ONNX Runtime intra-op threads (0 = runtime default)"); p.set_defaults(func=bench_detect)
+    p = sub.add_parser("quantize", help="write an int8 copy of an exported ONNX detector")
+    p.add_argument("model"); p.add_argument("recording", nargs="?", help="recorded session to calibrate activations on (static QDQ); without it weights only (dynamic)")
+    p.add_argument("--out", default=""); p.add_argument("--app-data", default=bot.APP_DATA_FILE); p.add_argument("--frames", type=int, default=100)
+    p.set_defaults(func=bench_quantize)
+    args = parser.parse_args(); args.func(args)
+
+if __name__ == "__main__":
+    main()
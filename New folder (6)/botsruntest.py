@@ -6,10 +6,12 @@ import ttkbootstrap as bstrap
 from ttkbootstrap.constants import *
 from ttkbootstrap.scrolled import ScrolledText
 import os
+import ntpath
 import sys
 import json
+import sqlite3
 import uuid
-from PIL import Image, ImageTk
+from PIL import Image, ImageTk, ImageDraw
 import shutil
 
 # --- Bot Logic Imports ---
@@ -23,11 +25,26 @@ import threading
 import keyboard
 import requests
 from io import BytesIO
-from skimage.metrics import structural_similarity as ssim
 import random
-import pyautogui
 import queue
+import bisect
+import contextlib
+import collections
+import hashlib
+import glob
+import multiprocessing
+import mmap
+import gzip
+import logging
+import logging.handlers
+import ast
+import difflib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, Future
+try: import pyautogui
+except Exception: pyautogui = None  # no display (headless replay): input goes through stubs instead
 from enum import Enum, auto
+from types import MappingProxyType
 
 # ===================================================================================
 # SECTION 1: SHARED UTILITIES & DATA HANDLING
@@ -36,7 +53,7 @@ from enum import Enum, auto
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 BOT_ASSETS_DIR = os.path.join(SCRIPT_DIR, "bot_assets")
 os.makedirs(BOT_ASSETS_DIR, exist_ok=True)
-APP_DATA_FILE = os.path.join(SCRIPT_DIR, "app_data.json")
+APP_DATA_FILE = os.path.join(SCRIPT_DIR, "app_data.db")  # a .json path here still reads/writes the old single-file format
 
 DEFAULTS = {
     "mouse_x": 100, "mouse_y": 100, "capture_x": 200, "capture_y": 200,
@@ -54,26 +71,138 @@ DEFAULTS = {
     "USE_IMAGE_PATH": os.path.join(BOT_ASSETS_DIR, "use_button.png"),
     "NO_BUTTON_IMAGE_PATH": os.path.join(BOT_ASSETS_DIR, "no_button.png"),
     "special_capture_forms": ["gamma", "alpha"],
-    "run_away_forms": ["dull", "frail"]
+    "run_away_forms": ["dull", "frail"],
+    "capture_backend": "pil", "capture_mode": "union", "capture_replay_path": "",
+    "record_frames": False, "record_roi_only": True, "record_dir": os.path.join(SCRIPT_DIR, "recordings"),
+    "trace_dir": os.path.join(SCRIPT_DIR, "traces"), "trace_jsonl_max_mb": 20, "profiler_interval_ms": 5,
+    "cascade_top_k": 3, "cascade_size": 48, "ssim_cache_size": 32,
+    "phash_max_distance": 10, "phash_shortlist": 5,
+    "ocr_engine": "auto", "ocr_workers": 2, "ocr_cache_size": 256,
+    "glyph_atlas_path": os.path.join(SCRIPT_DIR, "glyph_atlas.npz"), "glyph_min_confidence": 0.85,
+    "change_thumb_side": 64, "change_threshold": 6, "poll_min_ms": 50, "poll_max_ms": 300, "poll_backoff": 1.5,
+    "capture_thread": True, "capture_fps": 30, "frame_ring_size": 8,
+    "webhook_format": "png", "webhook_scale": 1.0, "webhook_jpeg_quality": 85, "webhook_region": "screen", "webhook_retries": 3, "webhook_queue_size": 16,
+    "input_backend": "ahk", "instances": [], "template_pack_dir": os.path.join(SCRIPT_DIR, "template_pack"),
+    "decision_reload_ms": 1000,
+    "log_dir": os.path.join(SCRIPT_DIR, "logs"), "log_file_max_mb": 10, "log_file_backups": 10, "log_view_lines": 5000,
+    "show_live_vision": True, "live_vision_fps": 4, "live_vision_scale": 0.5,
+    "thumb_cache_dir": os.path.join(SCRIPT_DIR, "thumb_cache"),
+    "scale_search": True, "scale_min": 0.6, "scale_max": 1.6, "scale_steps": 21, "scale_miss_limit": 12,
+    "search_window_margin": 40, "search_window_widen_every": 4, "calibration_margin": 12,
+    "detector_backend": "template", "detector_model_path": os.path.join(BOT_ASSETS_DIR, "detector.onnx"), "detector_conf": 0.5, "detector_iou": 0.45, "detector_threads": 0,
+    "record_dataset": False, "dataset_dir": os.path.join(SCRIPT_DIR, "datasets"), "dataset_shard_frames": 500, "dataset_val_fraction": 0.1, "dataset_dedup_distance": 4, "dataset_format": "png"
 }
 
-def save_app_data(settings_data, names_data, name_order_list):
+def save_json_data(path, settings_data, names_data, name_order_list):
     combined_data = {"settings": settings_data, "names_data": {"data": names_data, "name_order": name_order_list}}
-    with open(APP_DATA_FILE, 'w', encoding='utf-8') as f: json.dump(combined_data, f, indent=4)
+    with open(path, 'w', encoding='utf-8') as f: json.dump(combined_data, f, indent=4)
 
-def load_app_data():
-    if os.path.exists(APP_DATA_FILE):
+def load_json_data(path):
+    if os.path.exists(path):
         try:
-            with open(APP_DATA_FILE, 'r', encoding='utf-8') as f: combined_data = json.load(f)
+            with open(path, 'r', encoding='utf-8') as f: combined_data = json.load(f)
             settings_data = DEFAULTS.copy(); settings_data.update(combined_data.get("settings", {}))
             names_section = combined_data.get("names_data", {}); names_data = names_section.get("data", {}); name_order_list = names_section.get("name_order", [])
             return settings_data, names_data, name_order_list
         except (json.JSONDecodeError, IOError):
-            print(f"WARNING: '{APP_DATA_FILE}' is corrupt. A new file will be created.")
-    print(f"INFO: '{APP_DATA_FILE}' not found. Creating a new one with default values.")
-    save_app_data(DEFAULTS.copy(), {}, [])
+            print(f"WARNING: '{path}' is corrupt. A new file will be created.")
+    print(f"INFO: '{path}' not found. Creating a new one with default values.")
+    save_json_data(path, DEFAULTS.copy(), {}, [])
     return DEFAULTS.copy(), {}, []
 
+# Settings holding file paths; like photo paths they are stored relative to SCRIPT_DIR when they point inside it.
+PATH_SETTINGS = {"ITEMS_HEADER_PATH", "ACE_DISC_PATH", "USE_IMAGE_PATH", "NO_BUTTON_IMAGE_PATH", "AHK_SCRIPT", "AHK_RUNAWAY_SCRIPT", "TESSERACT_PATH",
+                 "record_dir", "trace_dir", "log_dir", "thumb_cache_dir", "template_pack_dir", "glyph_atlas_path", "capture_replay_path", "detector_model_path", "dataset_dir"}
+
+def to_stored_path(path):
+    # Relative (with "/") for files inside SCRIPT_DIR, also rescuing absolute paths written on another machine or folder.
+    if not path: return path
+    if os.path.isabs(path) or not ntpath.isabs(path):  # a Windows drive/UNC path read on POSIX would look relative to the cwd
+        try:
+            rel = os.path.relpath(path, SCRIPT_DIR)
+            if not rel.startswith(".."): return rel.replace(os.sep, "/")
+        except ValueError: pass  # different drive
+    parts = path.replace("\\", "/").split("/")
+    for anchor in ("photos_data", "bot_assets"):
+        if anchor in parts and os.path.exists(os.path.join(SCRIPT_DIR, *parts[parts.index(anchor):])): return "/".join(parts[parts.index(anchor):])
+    return path
+
+def from_stored_path(path):
+    if not path or os.path.isabs(path) or ":" in path[:3]: return path  # ":" catches drive paths read back on another OS
+    return os.path.normpath(os.path.join(SCRIPT_DIR, path))
+
+class AppStore:
+    # SQLite store for settings, names and photos (WAL journal). save() takes the same full state as the JSON file did,
+    # diffs it against the stored rows and writes only what changed, in one transaction, so a crash mid-save leaves the
+    # previous state intact. A missing database is created from the sibling .json file once.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS names (name TEXT PRIMARY KEY, position INTEGER);
+        CREATE TABLE IF NOT EXISTS photos (id TEXT PRIMARY KEY, name TEXT NOT NULL, form TEXT NOT NULL, path TEXT NOT NULL, position INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS photos_by_name ON photos (name, position);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"""
+    def __init__(self, path):
+        self.path = path; self._lock = threading.Lock(); legacy = os.path.splitext(path)[0] + ".json"; fresh = not os.path.exists(path)
+        try: self.conn = self._connect()
+        except sqlite3.DatabaseError as e:
+            print(f"WARNING: '{path}' is corrupt ({e}); it was moved aside and a new one will be created."); os.replace(path, path + ".corrupt"); self.conn = self._connect(); fresh = True
+        if fresh and os.path.exists(legacy):
+            self.save(*load_json_data(legacy)); self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('migrated_from', ?)", (legacy,)); self.conn.commit()
+            print(f"INFO: Migrated '{legacy}' into '{path}'.")
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False); conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self.SCHEMA); return conn
+    def load(self):
+        with self._lock:
+            settings_rows = self.conn.execute("SELECT key, value FROM settings").fetchall(); name_rows = self.conn.execute("SELECT name, position FROM names").fetchall()
+            photo_rows = self.conn.execute("SELECT id, name, form, path FROM photos ORDER BY name, position").fetchall()
+        settings_data = DEFAULTS.copy()
+        for key, value in settings_rows: value = json.loads(value); settings_data[key] = from_stored_path(value) if key in PATH_SETTINGS else value
+        names_data = {name: {"photos": {}, "photo_order": []} for name, _ in name_rows}
+        for photo_id, name, form, path in photo_rows:
+            entry = names_data.setdefault(name, {"photos": {}, "photo_order": []}); entry["photos"][photo_id] = (form, from_stored_path(path)); entry["photo_order"].append(photo_id)
+        return settings_data, names_data, [name for name, pos in sorted((r for r in name_rows if r[1] is not None), key=lambda r: r[1])]
+    def save(self, settings_data, names_data, name_order_list):
+        order = {name: i for i, name in enumerate(name_order_list)}
+        new_settings = {k: json.dumps(to_stored_path(v) if k in PATH_SETTINGS and isinstance(v, str) else v) for k, v in settings_data.items()}
+        new_names = {name: order.get(name) for name in names_data}
+        new_photos = {}
+        for name, entry in names_data.items():
+            positions = {pid: i for i, pid in enumerate(entry.get("photo_order", []))}
+            for pid, (form, path) in entry.get("photos", {}).items(): new_photos[pid] = (name, form, to_stored_path(path) or "", positions.get(pid, len(positions)))
+        with self._lock, self.conn:
+            changes = 0
+            for table, key, columns, new in (("settings", "key", "value", new_settings), ("names", "name", "position", new_names), ("photos", "id", "name, form, path, position", new_photos)):
+                old = {row[0]: (row[1:] if len(row) > 2 else row[1]) for row in self.conn.execute(f"SELECT {key}, {columns} FROM {table}")}
+                upserts = [(k,) + (v if isinstance(v, tuple) else (v,)) for k, v in new.items() if old.get(k, object()) != v]; removed = [(k,) for k in old.keys() - new.keys()]
+                self.conn.executemany(f"INSERT OR REPLACE INTO {table} ({key}, {columns}) VALUES ({', '.join('?' * (columns.count(',') + 2))})", upserts)
+                self.conn.executemany(f"DELETE FROM {table} WHERE {key} = ?", removed); changes += len(upserts) + len(removed)
+            if changes: self.conn.execute("INSERT INTO meta VALUES ('revision', 1) ON CONFLICT (key) DO UPDATE SET value = value + 1")
+        return changes
+    def revision(self):
+        # Bumped by every save that changed something, so other processes (and the reloader) can poll it cheaply.
+        with self._lock: row = self.conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        return int(row[0]) if row else 0
+
+APP_STORES = {}; APP_STORES_LOCK = threading.Lock()
+
+def get_app_store(path):
+    with APP_STORES_LOCK:
+        if path not in APP_STORES: APP_STORES[path] = AppStore(path)
+        return APP_STORES[path]
+
+def save_app_data(settings_data, names_data, name_order_list):
+    if APP_DATA_FILE.lower().endswith(".json"): save_json_data(APP_DATA_FILE, settings_data, names_data, name_order_list)
+    else: get_app_store(APP_DATA_FILE).save(settings_data, names_data, name_order_list)
+
+def load_app_data():
+    if APP_DATA_FILE.lower().endswith(".json"): return load_json_data(APP_DATA_FILE)
+    return get_app_store(APP_DATA_FILE).load()
+
+def app_data_revision():
+    if APP_DATA_FILE.lower().endswith(".json"): return os.stat(APP_DATA_FILE).st_mtime_ns if os.path.exists(APP_DATA_FILE) else 0
+    return get_app_store(APP_DATA_FILE).revision()
+
 def add_placeholder(entry, placeholder_text):
     entry.insert(0, placeholder_text); entry.config(foreground="grey")
     def on_focus_in(e):
@@ -91,6 +220,61 @@ def save_image_as_png(source_path, name, photo_name, photo_id):
         with Image.open(source_path) as img: img.save(new_path, "PNG"); return new_path
     except Exception as e: messagebox.showerror("Image Error", f"Could not save image: {e}"); return None
 
+class ThumbnailCache:
+    # Preview thumbnails (at most `size`, PNG) on disk under a key of path + mtime + size, so an edited photo gets a new
+    # one, plus an LRU of decoded ones in memory. Misses are generated by a background worker; load() returns a Future.
+    def __init__(self, cache_dir, size=(400, 400), memory=256, workers=2):
+        self.dir = cache_dir; self.size = size; self.memory = memory; self._lru = collections.OrderedDict(); self._lock = threading.Lock()
+        self._pending = {}; self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail"); os.makedirs(cache_dir, exist_ok=True)
+    def _key(self, path):
+        st = os.stat(path); return hashlib.blake2b(f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{self.size}".encode(), digest_size=16).hexdigest()
+    def get(self, path):
+        # The thumbnail if it is already in memory, else None (never touches the disk).
+        try: key = self._key(path)
+        except OSError: return None
+        with self._lock:
+            img = self._lru.get(key)
+            if img is not None: self._lru.move_to_end(key)
+            return img
+    def load(self, path):
+        try: key = self._key(path)
+        except OSError as e: future = Future(); future.set_exception(e); return future
+        with self._lock:
+            if key in self._lru: future = Future(); future.set_result(self._lru[key]); return future
+            if key not in self._pending: self._pending[key] = self._pool.submit(self._make, path, key)
+            return self._pending[key]
+    def prefetch(self, paths):
+        for path in paths:
+            if path: self.load(path)
+    def _make(self, path, key):
+        cached = os.path.join(self.dir, key[:2], key + ".png")
+        try:
+            if os.path.exists(cached):
+                with Image.open(cached) as img: img.load(); thumb = img.copy()
+            else:
+                with Image.open(path) as img: img.draft("RGB", self.size); thumb = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+                thumb.thumbnail(self.size, Image.Resampling.LANCZOS); os.makedirs(os.path.dirname(cached), exist_ok=True)
+                thumb.save(cached + ".tmp", "PNG"); os.replace(cached + ".tmp", cached)
+            with self._lock:
+                self._lru[key] = thumb
+                while len(self._lru) > self.memory: self._lru.popitem(last=False)
+            return thumb
+        finally:
+            with self._lock: self._pending.pop(key, None)
+
+def when_done(widget, futures, callback, interval=50):
+    # Calls callback(futures) on the Tk thread once the future (or every future in a list) is done.
+    if all(f.done() for f in (futures if isinstance(futures, list) else [futures])): callback(futures)
+    else: widget.after(interval, when_done, widget, futures, callback, interval)
+
+def run_in_background(widget, title, work, show):
+    # work() runs on the diagnostics pool; show(result), or an error box, follows on the Tk thread.
+    def done(future):
+        try: result = future.result()
+        except Exception as e: messagebox.showerror(title, f"Test failed: {e}", parent=widget); return
+        show(result)
+    when_done(widget, get_diagnostics().submit(work), done)
+
 # ===================================================================================
 # --- Helper Classes for UI Interaction ---
 # ===================================================================================
@@ -169,6 +353,20 @@ class SetupSelectionDialog(bstrap.Toplevel):
         self.destroy()
     def on_cancel(self): self.selected_keys = []; self.destroy()
 
+class DiagnosticsDialog(bstrap.Toplevel):
+    def __init__(self, parent, checks, elapsed):
+        super().__init__(parent); self.title("Diagnostics"); self.transient(parent); self.geometry("800x500")
+        main_frame = bstrap.Frame(self, padding=10); main_frame.pack(fill="both", expand=True); main_frame.rowconfigure(0, weight=1); main_frame.columnconfigure(0, weight=1)
+        columns = {"check": 80, "target": 250, "result": 190, "threshold": 80, "passed": 60, "ms": 70}
+        tree = ttk.Treeview(main_frame, columns=list(columns), show="headings"); tree.grid(row=0, column=0, sticky="nsew")
+        for col, width in columns.items(): tree.heading(col, text=col.title()); tree.column(col, width=width, anchor="w")
+        scroll = bstrap.Scrollbar(main_frame, orient="vertical", command=tree.yview, bootstyle="round"); scroll.grid(row=0, column=1, sticky="ns"); tree.config(yscrollcommand=scroll.set)
+        style = bstrap.Style.get_instance(); tree.tag_configure("passed", foreground=style.colors.success); tree.tag_configure("failed", foreground=style.colors.danger)
+        results = [(check, target, threshold) + future.result() for check, target, threshold, future in checks]
+        for check, target, threshold, value, passed, ms in results: tree.insert("", tk.END, values=(check, target, value, threshold, "yes" if passed else "no", f"{ms:.1f}"), tags=("passed" if passed else "failed",))
+        bstrap.Label(main_frame, text=f"{len(results)} checks on one frame in {elapsed * 1000:.0f} ms (checks took {sum(r[5] for r in results):.0f} ms in total).").grid(row=1, column=0, columnspan=2, sticky="w", pady=(8, 0))
+        bstrap.Button(main_frame, text="Close", command=self.destroy, bootstyle="secondary").grid(row=2, column=0, columnspan=2, sticky="e", pady=(8, 0))
+
 class HotkeyRecorder:
     def __init__(self, parent, callback):
         self.callback = callback; self.window = bstrap.Toplevel(parent); self.window.title("Record Hotkey"); self.window.transient(parent); self.window.grab_set(); self.window.geometry("300x100")
@@ -183,154 +381,1402 @@ class HotkeyRecorder:
 # SECTION 2: BOT LOGIC
 # ===================================================================================
 settings = {}; scan_active = False; exit_program = threading.Event()
-RARE_PHOTOS = {}; RARE_NAMES = []
+BOT_STATUS = {"state": "SEARCHING", "encounters": 0, "decisions": collections.Counter()}
+VISION = {}  # latest scores and OCR text by region, written by the scan thread and only read by the live-vision renderer
+INPUT_LOCK = threading.RLock()  # replaced by a cross-process lock in supervised instances
+
+class RealClock:
+    def time(self): return time.time()
+    def sleep(self, seconds): time.sleep(seconds)
+
+CLOCK = RealClock()  # replay swaps in a virtual clock so sleeps cost nothing
+
+# --- Tracing & Profiling ---
+class Tracer:
+    # Records timed spans (tagged with the current tick and encounter) into a bounded buffer; a background thread
+    # appends them to a rolling JSONL file and stop() exports the buffer as Chrome trace-event JSON.
+    def __init__(self, max_events=200000):
+        self.enabled = False; self.events = collections.deque(maxlen=max_events); self.pending = collections.deque()
+        self.thread_names = {}; self.tick = 0; self.encounter = 0; self._encounter_start = None; self._epoch = time.perf_counter(); self._stop = threading.Event(); self._flusher = None
+    @contextlib.contextmanager
+    def _span(self, name, cat, args):
+        start = time.perf_counter()
+        try: yield args
+        finally: self._record(name, cat, start, time.perf_counter(), args)
+    def span(self, name, cat="bot", **args): return self._span(name, cat, args) if self.enabled else contextlib.nullcontext(args)
+    def _record(self, name, cat, start, end, args):
+        event = {"name": name, "cat": cat, "ph": "X", "ts": round((start - self._epoch) * 1e6, 1), "dur": round((end - start) * 1e6, 1), "pid": os.getpid(), "tid": threading.get_ident(),
+                 "args": dict(args, tick=self.tick, encounter=self.encounter)}
+        self.thread_names[event["tid"]] = threading.current_thread().name; self.events.append(event); self.pending.append(event)
+    def next_tick(self): self.tick += 1
+    def begin_encounter(self): self.encounter += 1; self._encounter_start = time.perf_counter()
+    def end_encounter(self, decision):
+        if self.enabled and self._encounter_start is not None: self._record("encounter", "encounter", self._encounter_start, time.perf_counter(), {"decision": decision})
+        self._encounter_start = None
+    def start(self, trace_dir, jsonl_max_bytes):
+        if self.enabled: return
+        os.makedirs(trace_dir, exist_ok=True); self.trace_dir, self.jsonl_max_bytes = trace_dir, jsonl_max_bytes; self.jsonl_path = os.path.join(trace_dir, "spans.jsonl")
+        self.events.clear(); self.pending.clear(); self._stop.clear(); self.enabled = True
+        self._flusher = threading.Thread(target=self._flush_loop, name="trace_flusher", daemon=True); self._flusher.start()
+        print(f"[INFO] Tracing enabled, writing spans to '{self.jsonl_path}'.")
+    def _flush_loop(self):
+        while not self._stop.wait(1.0): self._flush()
+        self._flush()
+    def _flush(self):
+        if not self.pending: return
+        if os.path.exists(self.jsonl_path) and os.path.getsize(self.jsonl_path) > self.jsonl_max_bytes: os.replace(self.jsonl_path, self.jsonl_path + ".1")
+        with open(self.jsonl_path, "a", encoding="utf-8") as f:
+            while self.pending: f.write(json.dumps(self.pending.popleft()) + "\n")
+    def stop(self):
+        if not self.enabled: return None
+        self.enabled = False; self._stop.set(); self._flusher.join(timeout=5)
+        path = os.path.join(self.trace_dir, time.strftime("trace_%Y%m%d_%H%M%S.json"))
+        names = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}} for tid, name in self.thread_names.items()]
+        with open(path, "w", encoding="utf-8") as f: json.dump({"traceEvents": names + list(self.events), "displayTimeUnit": "ms"}, f)
+        print(f"[INFO] Chrome trace with {len(self.events)} spans written to '{path}'."); return path
+
+TRACER = Tracer()
+
+class SamplingProfiler:
+    # Periodically samples every other thread's Python stack and writes collapsed stacks (flamegraph.pl / speedscope format).
+    def __init__(self): self.counts = collections.Counter(); self._stop = threading.Event(); self._thread = None
+    def start(self, interval_seconds):
+        if self._thread: return
+        self.counts.clear(); self._stop.clear(); self.interval = interval_seconds
+        self._thread = threading.Thread(target=self._run, name="sampling_profiler", daemon=True); self._thread.start(); print(f"[INFO] Sampling profiler started ({interval_seconds * 1000:.0f} ms interval).")
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own: continue
+                stack = []
+                while frame is not None: stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})"); frame = frame.f_back
+                self.counts[";".join([names.get(ident, str(ident))] + stack[::-1])] += 1
+    def stop(self, out_dir):
+        if not self._thread: return None
+        self._stop.set(); self._thread.join(timeout=5); self._thread = None; os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, time.strftime("profile_%Y%m%d_%H%M%S.folded"))
+        with open(path, "w", encoding="utf-8") as f: f.writelines(f"{stack} {n}\n" for stack, n in self.counts.most_common())
+        print(f"[INFO] Profiler wrote {sum(self.counts.values())} samples to '{path}'."); return path
+
+PROFILER = SamplingProfiler()
 
 class BotState(Enum):
     SEARCHING = auto(); ANALYZING = auto(); ACTION_RUN = auto(); ACTION_CAPTURE = auto(); COOLDOWN = auto()
 
-def load_bot_data_from_gui_file():
-    global RARE_PHOTOS, RARE_NAMES, settings; settings_data, names_data, name_order = load_app_data(); settings = settings_data.copy()
-    new_rare_photos = {name: {p_name: p_path for _, (p_name, p_path) in data.get("photos", {}).items()} for name, data in names_data.items() if name in name_order}
-    RARE_PHOTOS = new_rare_photos; RARE_NAMES = name_order; print(f"[INFO] Loaded: {len(RARE_NAMES)} names, {sum(len(v) for v in RARE_PHOTOS.values())} photos.")
+def coarse_vector(gray, side):
+    # Downsampled, zero-mean, unit-norm copy of an image: the dot product of two of these is their normalized correlation.
+    h, w = gray.shape[:2]; scale = side / max(h, w)
+    vec = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    vec -= vec.mean(); norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
 
-def items_header_detected(screen_image):
-    header_region = (settings["header_topleft_x"], settings["header_topleft_y"], settings["header_bottomright_x"], settings["header_bottomright_y"])
+# Same constants as skimage.metrics.structural_similarity's defaults for uint8 images (7x7 uniform window, sample covariance).
+SSIM_WIN = 7; SSIM_C1 = (0.01 * 255) ** 2; SSIM_C2 = (0.03 * 255) ** 2; SSIM_COV_NORM = SSIM_WIN ** 2 / (SSIM_WIN ** 2 - 1)
+
+class SsimStats:
+    # Template-side SSIM terms (local mean and variance), computed once so each comparison only filters the frame side.
+    # mu and b2 (the blurred terms) can be passed in precomputed, e.g. mapped from a TemplatePack.
+    def __init__(self, gray, mu=None, b2=None):
+        k = (SSIM_WIN, SSIM_WIN); self.x = gray.astype(np.float32); self.mu = cv2.blur(self.x, k) if mu is None else mu
+        self.b1 = self.mu * self.mu + SSIM_C1; self.b2 = SSIM_COV_NORM * (cv2.blur(self.x * self.x, k) - self.mu * self.mu) + SSIM_C2 if b2 is None else b2
+        for a in (self.x, self.mu, self.b1, self.b2): a.flags.writeable = False
+
+def fast_ssim(stats, frame_gray):
+    # float32 SSIM against precomputed template statistics; matches skimage's ssim() on the same uint8 inputs.
+    k = (SSIM_WIN, SSIM_WIN); y = frame_gray.astype(np.float32); mu_y = cv2.blur(y, k)
+    var_y = SSIM_COV_NORM * (cv2.blur(y * y, k) - mu_y * mu_y); cov = SSIM_COV_NORM * (cv2.blur(stats.x * y, k) - stats.mu * mu_y)
+    s = ((2 * stats.mu * mu_y + SSIM_C1) * (2 * cov + SSIM_C2)) / ((stats.b1 + mu_y * mu_y) * (stats.b2 + var_y))
+    pad = (SSIM_WIN - 1) // 2
+    return float(s[pad:-pad, pad:-pad].mean(dtype=np.float64))
+
+class TemplateStore:
+    # Decoded grayscale templates kept in memory, keyed by path and invalidated on file mtime/size (and target size for photos).
+    def __init__(self, ssim_cache_size=32): self._gray = {}; self._photo = {}; self._coarse = {}; self._ssim = collections.OrderedDict(); self._ssim_parts = {}; self._scaled = {}; self.ssim_cache_size = ssim_cache_size; self._lock = threading.Lock()
+    @staticmethod
+    def _stamp(path): st = os.stat(path); return st.st_mtime_ns, st.st_size
+    def gray(self, path):
+        stamp = self._stamp(path)
+        with self._lock: entry = self._gray.get(path)
+        if entry and entry[0] == stamp: return entry[1]
+        gray = decode_gray(path); gray.flags.writeable = False
+        with self._lock: self._gray[path] = (stamp, gray); self._photo.pop(path, None)
+        return gray
+    def scaled(self, path, scale):
+        gray = self.gray(path)
+        if scale == 1.0: return gray
+        with self._lock: entry = self._scaled.get((path, scale))
+        if entry and entry[0] is gray: return entry[1]
+        resized = cv2.resize(gray, (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale))), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        resized.flags.writeable = False
+        with self._lock: self._scaled[(path, scale)] = (gray, resized)
+        return resized
+    def photo(self, path, size):
+        gray = self.gray(path)
+        with self._lock: entry = self._photo.get(path)
+        if entry and entry[0] is gray and entry[1] == size: return entry[2]
+        resized = cv2.resize(gray, size); resized.flags.writeable = False
+        with self._lock: self._photo[path] = (gray, size, resized)
+        return resized
+    def coarse(self, path, size, side):
+        photo = self.photo(path, size)
+        with self._lock: entry = self._coarse.get(path)
+        if entry and entry[0] is photo and entry[1] == side: return entry[2]
+        vec = coarse_vector(photo, side); vec.flags.writeable = False
+        with self._lock: self._coarse[path] = (photo, side, vec)
+        return vec
+    def ssim_stats(self, path, size):
+        # Bounded LRU: full-resolution float32 statistics are several MB per photo, so only recently confirmed ones stay.
+        photo = self.photo(path, size)
+        with self._lock:
+            entry = self._ssim.get(path)
+            if entry and entry[0] is photo: self._ssim.move_to_end(path); return entry[1]
+            parts = self._ssim_parts.get(path)
+        stats = SsimStats(photo, *parts[1:]) if parts and parts[0] is photo else SsimStats(photo)
+        with self._lock:
+            self._ssim[path] = (photo, stats); self._ssim.move_to_end(path)
+            while len(self._ssim) > max(1, self.ssim_cache_size): self._ssim.popitem(last=False)
+        return stats
+    def adopt(self, views):
+        # Seeds the caches with arrays mapped from a TemplatePack; they are still checked against the file stamps.
+        with self._lock:
+            for v in views:
+                path, photo = v["path"], v.get("photo"); self._gray[path] = (v["stamp"], v["gray"])
+                if photo is None: continue
+                self._photo[path] = (v["gray"], v["size"], photo)
+                if v.get("coarse") is not None: self._coarse[path] = (photo, v["side"], v["coarse"])
+                if v.get("ssim_mu") is not None: self._ssim_parts[path] = (photo, v["ssim_mu"], v["ssim_b2"])
+    def preload(self, template_paths, photo_paths, photo_size, coarse_side=None):
+        loaded = 0
+        for path in template_paths:
+            try: self.gray(path); loaded += 1
+            except Exception as e: print(f"[WARNING] Could not preload template '{path}': {e}")
+        for path in photo_paths:
+            try: self.coarse(path, photo_size, coarse_side) if coarse_side else self.photo(path, photo_size); loaded += 1
+            except Exception as e: print(f"[WARNING] Could not preload photo '{path}': {e}")
+        keep = set(template_paths) | set(photo_paths)
+        with self._lock:
+            for cache in (self._gray, self._photo, self._coarse, self._ssim, self._ssim_parts): [cache.pop(p) for p in list(cache) if p not in keep]
+        return loaded
+
+TEMPLATES = TemplateStore()
+
+def decode_gray(path): return cv2.cvtColor(np.array(Image.open(path).convert("RGB")), cv2.COLOR_RGB2GRAY)
+
+def phash(gray):
+    # 64-bit DCT perceptual hash: low-frequency 8x8 block of a 32x32 thumbnail, thresholded at its median.
+    dct = cv2.dct(cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32))[:8, :8].ravel()
+    return int.from_bytes(np.packbits(dct > np.median(dct[1:])).tobytes(), "big")
+
+class PhotoHashIndex:
+    # pHash of every form photo (at the photo region size) for a Hamming-distance lookup across the whole library.
+    def __init__(self, entries, hashes): self.entries = entries; self.hashes = np.array(hashes, dtype=">u8")
+    @classmethod
+    def build(cls, rare_photos, size, known=None):
+        # known: {path: hash} for photos already hashed (from the template pack); only the rest are hashed here.
+        entries, hashes = [], []; known = known or {}
+        for name, photos in rare_photos.items():
+            for form, path in photos.items():
+                try: hashes.append(known[path] if path in known else phash(TEMPLATES.photo(path, size))); entries.append((name, form, path))
+                except Exception as e: print(f"[WARNING] Could not hash photo '{path}': {e}")
+        return cls(entries, hashes)
+    def lookup(self, h, max_distance, limit):
+        if not self.entries: return []
+        distances = np.unpackbits((self.hashes ^ np.array(h, dtype=">u8")).view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        order = [i for i in np.argsort(distances, kind="stable")[:limit] if distances[i] <= max_distance]
+        return [(self.entries[i], int(distances[i])) for i in order]
+    def known(self): return {path: int(h) for (_, _, path), h in zip(self.entries, self.hashes)}
+
+# --- Decision Table ---
+class DecisionTable:
+    # The name -> form -> action rules and the photo hash index built from them, compiled once from the app data and
+    # never modified afterwards. Handlers read DECISIONS once per encounter; a reload builds a new table on the reloader
+    # thread and swaps the reference, so the scan thread never waits for it or sees half of an update.
+    def __init__(self, revision, name_order, rare_photos, actions, index):
+        self.revision = revision; self.names = tuple(name_order); self.index = index
+        self.photos = MappingProxyType({name: tuple(photos.items()) for name, photos in rare_photos.items()})
+        self._names = MappingProxyType({n.lower(): n for n in reversed(self.names)}); self._actions = MappingProxyType(actions)
+    def match_name(self, text): return self._names.get(text.lower())
+    def candidates(self, name): return list(self.photos.get(name, ()))
+    def action(self, form): return self._actions.get(form.lower())
+    def summary(self): return f"{len(self.names)} names, {sum(len(p) for p in self.photos.values())} photos, {len(self._actions)} form rules"
+
+def rare_photos_of(names_data, name_order): return {name: {form: path for _, (form, path) in data.get("photos", {}).items()} for name, data in names_data.items() if name in name_order}
+
+def compile_decisions(settings_data, names_data, name_order, revision, photo_size, known=None):
+    rare_photos = rare_photos_of(names_data, name_order)
+    actions = {f.lower(): BotState.ACTION_RUN for f in settings_data.get("run_away_forms", [])}
+    actions.update({f.lower(): BotState.ACTION_CAPTURE for f in settings_data.get("special_capture_forms", [])})  # capture wins, as before
+    return DecisionTable(revision, name_order, rare_photos, actions, PhotoHashIndex.build(rare_photos, photo_size, known))
+
+DECISIONS = DecisionTable(None, [], {}, {}, PhotoHashIndex([], []))
+RELOAD_LOCK = threading.Lock()
+
+def reload_decisions(force=False):
+    # Recompiles the table when the app data changed since it was built; photos hashed before are not hashed again.
+    global DECISIONS
+    with RELOAD_LOCK:
+        revision = app_data_revision()
+        if not force and revision == DECISIONS.revision: return False
+        settings_data, names_data, name_order = load_app_data(); start = time.perf_counter()
+        DECISIONS = compile_decisions(settings_data, names_data, name_order, revision, library_paths(settings, {})[2], DECISIONS.index.known())
+        print(f"[INFO] Decision table reloaded: {DECISIONS.summary()} in {(time.perf_counter() - start) * 1000:.0f} ms.")
+        return True
+
+class DecisionReloader:
+    # Polls the app data revision (a counter in app_data.db, the file time for JSON) and reloads the decision table.
+    def __init__(self, interval):
+        self.interval = interval; self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="decision_reload", daemon=True); self.thread.start()
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try: reload_decisions()
+            except Exception as e: print(f"[WARNING] Could not reload the decision table: {e}")
+    def stop(self): self._stop.set(); self.thread.join(timeout=2)
+
+RELOADER = None
+
+def start_decision_reloader():
+    global RELOADER; stop_decision_reloader(); interval = float(settings.get("decision_reload_ms", 1000)) / 1000
+    if interval > 0: RELOADER = DecisionReloader(interval)
+    return RELOADER
+
+def stop_decision_reloader():
+    global RELOADER
+    if RELOADER: reloader, RELOADER = RELOADER, None; reloader.stop()
+
+def get_region(prefix): return (settings[f"{prefix}_topleft_x"], settings[f"{prefix}_topleft_y"], settings[f"{prefix}_bottomright_x"], settings[f"{prefix}_bottomright_y"])
+
+# --- Screen Capture ---
+CAPTURE_REGIONS = {"header": "header", "ocr": "ocr", "photo": "photo", "action": "action_scan"}
+CAPTURE_BACKENDS = ["pil", "mss", "x11", "replay"]
+
+class CapturedFrame:
+    # One or more grabbed screen rectangles; crop() takes absolute screen coordinates like a full-screen PIL image.
+    # labels/meta: boxes and facts the checks noted on this frame for the dataset recorder (see label_frame).
+    def __init__(self, tiles, timestamp=None): self.tiles = tiles; self.timestamp = CLOCK.time() if timestamp is None else timestamp; self.seq = 0; self.labels = []; self.meta = {}
+    def _tile(self, box): return next(((t_box, img) for t_box, img in self.tiles if t_box[0] <= box[0] and t_box[1] <= box[1] and box[2] <= t_box[2] and box[3] <= t_box[3]), None)
+    def covers(self, box): return self._tile(box) is not None
+    def crop(self, box):
+        tile = self._tile(box)
+        if tile: (x1, y1, _, _), img = tile; return img.crop((box[0] - x1, box[1] - y1, box[2] - x1, box[3] - y1))
+        raise ValueError(f"Region {box} is outside the captured area {[t[0] for t in self.tiles]}")
+    @property
+    def image(self): return self.tiles[0][1]
+
+class PilCaptureBackend:
+    def grab(self, box=None): return ImageGrab.grab(bbox=box).convert("RGB")
+
+class MssCaptureBackend:
+    # mss handles are not thread-safe on Windows, so each thread gets its own.
+    def __init__(self, **mss_kwargs):
+        import mss; self._mss, self._kwargs, self._local = mss, mss_kwargs, threading.local()
+    def _handle(self):
+        if not hasattr(self._local, "sct"): self._local.sct = self._mss.mss(**self._kwargs)
+        return self._local.sct
+    def grab(self, box=None):
+        sct = self._handle(); mon = sct.monitors[1] if box is None else {"left": box[0], "top": box[1], "width": box[2] - box[0], "height": box[3] - box[1]}
+        shot = sct.grab(mon); return Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+
+class X11CaptureBackend(MssCaptureBackend):
+    # Linux only: mss' XCB backend with MIT-SHM (XShmGetImage), falling back to plain mss on older releases.
+    def __init__(self):
+        if not sys.platform.startswith("linux"): raise RuntimeError("the x11 capture backend is only available on Linux")
+        super().__init__(backend="xshmgetimage")
+    def _handle(self):
+        try: return super()._handle()
+        except TypeError: self._kwargs = {}; return super()._handle()
+
+class ReplayCaptureBackend:
+    # Serves frames from an image file or a directory of images (in name order, looping), or from a FrameRecorder
+    # session (a directory with index.jsonl), where the frame shown is the last one recorded at or before CLOCK.time().
+    def __init__(self, path):
+        self._lock = threading.Lock(); self.index = -1; self.entries = None; self._cached = (None, None)
+        if os.path.isdir(path) and os.path.exists(os.path.join(path, "index.jsonl")):
+            with open(os.path.join(path, "index.jsonl"), encoding="utf-8") as f: self.entries = [json.loads(line) for line in f if line.strip()]
+            if not self.entries: raise FileNotFoundError(f"Recording '{path}' has no frames")
+            self.root = path; self.times = [e["t"] for e in self.entries]; self.start_time, self.end_time = self.times[0], self.times[-1]; return
+        exts = (".png", ".jpg", ".jpeg", ".bmp")
+        self.paths = sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(exts)) if os.path.isdir(path) else [path]
+        if not self.paths or not os.path.exists(self.paths[0]): raise FileNotFoundError(f"No replay frames found at '{path}'")
+    def _load(self, path):
+        with Image.open(path) as img: return img.convert("RGB")
+    def grab_frame(self, boxes=None):
+        if self.entries is None:
+            with self._lock: self.index = (self.index + 1) % len(self.paths); path = self.paths[self.index]
+            img = self._load(path); return CapturedFrame([((0, 0) + img.size, img)])
+        with self._lock:
+            self.index = max(0, bisect.bisect_right(self.times, CLOCK.time()) - 1); entry = self.entries[self.index]
+            if self._cached[0] != self.index: self._cached = (self.index, [(tuple(t["box"]), self._load(os.path.join(self.root, t["file"]))) for t in entry["tiles"]])
+            return CapturedFrame(self._cached[1], timestamp=entry["t"])
+    def grab(self, box=None):
+        frame = self.grab_frame(); full = frame.image
+        return full if box is None else frame.crop(box)
+
+def make_capture_backend(name, replay_path=""):
     try:
-        screen_crop = screen_image.crop(header_region)
-        screen_gray = cv2.cvtColor(np.array(screen_crop), cv2.COLOR_RGB2GRAY)
-        ref_gray = cv2.cvtColor(np.array(Image.open(settings["ITEMS_HEADER_PATH"]).convert("RGB")), cv2.COLOR_RGB2GRAY)
-        found = cv2.minMaxLoc(cv2.matchTemplate(screen_gray, ref_gray, cv2.TM_CCOEFF_NORMED))[1] > 0.90
+        if name == "mss": return MssCaptureBackend()
+        if name == "x11": return X11CaptureBackend()
+        if name == "replay": return ReplayCaptureBackend(replay_path)
+        if name != "pil": print(f"[WARNING] Unknown capture backend '{name}'.")
+    except Exception as e: print(f"[ERROR] Could not start '{name}' capture backend, falling back to PIL: {e}")
+    return PilCaptureBackend()
+
+class ScreenCapture:
+    # Grabs only the requested regions: their bounding union in one call ("union") or each rectangle separately ("regions").
+    def __init__(self, backend, mode="union"): self.backend = backend; self.mode = mode
+    def grab(self, boxes):
+        with TRACER.span("capture", "capture", regions=len(boxes)): return self._grab(boxes)
+    def _grab(self, boxes):
+        if hasattr(self.backend, "grab_frame"): return self.backend.grab_frame(boxes)
+        boxes = [b for b in boxes if b[2] > b[0] and b[3] > b[1]]
+        if RECORDER and not RECORDER.roi_only: full = self.backend.grab(); frame = CapturedFrame([((0, 0) + full.size, full)])
+        elif self.mode == "regions": frame = CapturedFrame([(box, self.backend.grab(box)) for box in boxes])
+        else:
+            union = (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+            frame = CapturedFrame([(union, self.backend.grab(union))])
+        if RECORDER: RECORDER.add(frame)
+        return frame
+    def grab_screen(self):
+        with TRACER.span("capture_screen", "capture"): full = self.backend.grab()
+        if RECORDER and not hasattr(self.backend, "grab_frame"): RECORDER.add(CapturedFrame([((0, 0) + full.size, full)]))
+        return full
+
+# --- Frame Recording ---
+class FrameRecorder:
+    # Writes captured frames as PNG tiles plus a timestamped index.jsonl on a background thread; frames are dropped
+    # (and counted) rather than blocking the scan thread when the writer falls behind.
+    def __init__(self, root_dir, roi_only=True, max_pending=64):
+        self.roi_only = roi_only; self.session_dir = os.path.join(root_dir, time.strftime("session_%Y%m%d_%H%M%S"))
+        os.makedirs(os.path.join(self.session_dir, "frames"), exist_ok=True)
+        with open(os.path.join(self.session_dir, "session.json"), "w", encoding="utf-8") as f: json.dump({"roi_only": roi_only, "regions": {n: get_region(k) for n, k in CAPTURE_REGIONS.items()}}, f, indent=4)
+        self.queue = queue.Queue(maxsize=max_pending); self.seq = 0; self.dropped = 0
+        self.thread = threading.Thread(target=self._writer, daemon=True); self.thread.start()
+    def add(self, frame):
+        try: self.queue.put_nowait(frame)
+        except queue.Full: self.dropped += 1
+    def _writer(self):
+        with open(os.path.join(self.session_dir, "index.jsonl"), "a", encoding="utf-8") as index:
+            while True:
+                frame = self.queue.get()
+                if frame is None: break
+                try:
+                    self.seq += 1; tiles = []
+                    for i, (box, img) in enumerate(frame.tiles):
+                        name = os.path.join("frames", f"{self.seq:07d}_{i}.png"); img.save(os.path.join(self.session_dir, name), "PNG", compress_level=6); tiles.append({"box": list(box), "file": name.replace(os.sep, "/")})
+                    index.write(json.dumps({"seq": self.seq, "t": frame.timestamp, "tiles": tiles}) + "\n"); index.flush()
+                except Exception as e: print(f"[ERROR] Frame recorder failed to write frame {self.seq}: {e}")
+    def close(self):
+        self.queue.put(None); self.thread.join(timeout=30)
+        print(f"[INFO] Recorded {self.seq} frames to '{self.session_dir}' ({self.dropped} dropped).")
+
+RECORDER = None
+
+def stop_recorder():
+    global RECORDER
+    if RECORDER: recorder, RECORDER = RECORDER, None; recorder.close()
+
+CAPTURE = None
+
+def get_capture():
+    global CAPTURE
+    if CAPTURE is None: CAPTURE = ScreenCapture(make_capture_backend(settings.get("capture_backend", "pil"), settings.get("capture_replay_path", "")), settings.get("capture_mode", "union"))
+    return CAPTURE
+
+# --- Frame Pipeline ---
+class FramePipeline:
+    # A capture thread keeps grabbing the regions the scan thread last asked for into a small ring buffer, so capture
+    # overlaps matching and input actions. frame() returns the newest frame the calling thread has not seen yet that
+    # covers the requested regions; right after a switch of regions it waits up to `timeout` for one, then grabs directly.
+    # Grabs follow the reader: each is timed to finish just before its next expected frame() call (never faster than
+    # `fps`), and they stop altogether while the bot is paused or once no call has come for two of the reader's
+    # intervals, so the poller's back-off, cooldowns and clicks cost no captures. The next frame() call restarts them.
+    # Only frames finished at most one capture interval before the request are handed out, and the ring is emptied when
+    # the regions change or reading stops, so a frame from before a cooldown or a click is never mistaken for the screen.
+    def __init__(self, capture, fps=30, size=8, timeout=0.5):
+        self.capture = capture; self.interval = 1 / max(1, fps); self.timeout = timeout; self.ring = collections.deque(maxlen=max(1, size))
+        self.seq = 0; self.wanted = (); self.needed = False; self.reading = 0; self.returned = 0.0; self.work = self.interval; self.grabs = 0
+        self.cond = threading.Condition(); self._stop = threading.Event(); self._wake = threading.Event(); self._seen = threading.local()
+        self.thread = threading.Thread(target=self._run, name="capture", daemon=True); self.thread.start()
+    def _idle(self, now): return not scan_active or (not self.reading and now - self.returned > 2 * max(self.work, self.interval) + self.timeout)
+    def _run(self):
+        cost = last = 0.0
+        while not self._stop.is_set() and not exit_program.is_set():
+            with self.cond:
+                now = time.perf_counter()
+                if self.wanted and not self.needed and self._idle(now): self.wanted = (); self.ring.clear()  # nobody is reading: wait for the next frame() call
+                names, due = self.wanted, None
+                if names and self.needed: due = now; self.needed = False
+                elif names:
+                    expected = self.returned + self.work - cost - self.interval / 2  # the reader's next call, less the grab
+                    due = max(last + self.interval, expected) if expected > last else last + max(self.interval, self.work)  # late reader: refresh at its pace
+            if due is not None and due <= now:
+                last = time.perf_counter()
+                try:
+                    frame = self.capture.grab([get_region(CAPTURE_REGIONS[n]) for n in names]); cost = time.perf_counter() - last
+                    with self.cond:
+                        if names == self.wanted: self.seq += 1; self.grabs += 1; frame.seq = self.seq; frame.grabbed = time.perf_counter(); self.ring.append(frame); self.cond.notify_all()
+                except Exception as e: print(f"[ERROR] Capture thread failed to grab {names}: {e}"); self._stop.wait(1)
+                continue
+            if self._wake.wait(None if due is None else due - now): self._wake.clear()  # a frame was asked for or taken: reschedule
+    def frame(self, names):
+        boxes = [get_region(CAPTURE_REGIONS[n]) for n in names]; seen = getattr(self._seen, "seq", 0)
+        if not scan_active: return self.capture.grab(boxes)
+        asked = time.perf_counter()
+        def newest(): return next((f for f in reversed(self.ring) if f.seq > seen and f.grabbed >= asked - self.interval and all(f.covers(b) for b in boxes)), None)
+        try:
+            with self.cond:
+                now = asked
+                if not self._idle(now): self.work = now - self.returned  # the reader's own time between frames, learned while it keeps reading
+                if self.wanted != names: self.ring.clear()
+                if self.wanted != names or not newest(): self.wanted = names; self.needed = True; self._wake.set()
+                self.reading += 1
+                try: frame = self.cond.wait_for(newest, self.timeout)
+                finally: self.reading -= 1
+                if frame: self._seen.seq = frame.seq; return frame
+            return self.capture.grab(boxes)
+        finally: self.returned = time.perf_counter(); self._wake.set()
+    def stop(self): self._stop.set(); self._wake.set(); self.thread.join(timeout=2)
+
+PIPELINE = None
+
+def start_frame_pipeline():
+    # Replayed sessions follow CLOCK (which may be virtual), so they are always read synchronously by the scan thread.
+    global PIPELINE; stop_frame_pipeline(); capture = get_capture()
+    if settings.get("capture_thread", True) and not hasattr(capture.backend, "grab_frame"):
+        PIPELINE = FramePipeline(capture, int(settings.get("capture_fps", 30)), int(settings.get("frame_ring_size", 8)))
+        print(f"[INFO] Capture thread running at up to {settings.get('capture_fps', 30)} fps ({PIPELINE.ring.maxlen}-frame ring).")
+    return PIPELINE
+
+def stop_frame_pipeline():
+    global PIPELINE
+    if PIPELINE: pipeline, PIPELINE = PIPELINE, None; pipeline.stop()
+
+def grab_regions(*names): return PIPELINE.frame(names) if PIPELINE else get_capture().grab([get_region(CAPTURE_REGIONS[n]) for n in names])
+
+def grab_screen(): return get_capture().grab_screen()
+
+# --- Change Detection & Adaptive Polling ---
+class ChangeDetector:
+    # Cheap "did this region change" test: an area-averaged grayscale thumbnail of the region is compared with the one
+    # last reported as changed, and any thumbnail pixel moving by more than the threshold counts. Comparing against the
+    # last changed thumbnail (not the previous frame) keeps slow fades from slipping through in small steps.
+    def __init__(self, side=64, threshold=6): self.side = side; self.threshold = threshold; self.last = {}
+    def changed(self, key, frame, box):
+        try: gray = cv2.cvtColor(np.asarray(frame.crop(box)), cv2.COLOR_RGB2GRAY)
+        except ValueError: return True
+        thumb = cv2.resize(gray, (min(self.side, gray.shape[1]), min(self.side, gray.shape[0])), interpolation=cv2.INTER_AREA).astype(np.int16)
+        prev = self.last.get(key)
+        if prev is not None and prev.shape == thumb.shape and int(np.abs(thumb - prev).max()) <= self.threshold: return False
+        self.last[key] = thumb; return True
+    def reset(self, key=None):
+        if key is None: self.last.clear()
+        else: self.last.pop(key, None)
+
+class AdaptivePoller:
+    # Polls at min_interval right after a change and backs off geometrically towards max_interval while idle.
+    def __init__(self, min_interval, max_interval, backoff=1.5): self.min_interval = min_interval; self.max_interval = max(min_interval, max_interval); self.backoff = backoff; self.interval = min_interval
+    def next(self, changed):
+        self.interval = self.min_interval if changed else min(self.max_interval, self.interval * self.backoff); return self.interval
+    def reset(self): self.interval = self.min_interval
+
+def make_change_detector(): return ChangeDetector(int(settings.get("change_thumb_side", 64)), int(settings.get("change_threshold", 6)))
+
+def make_poller(max_interval=None):
+    min_interval = settings.get("poll_min_ms", 50) / 1000
+    return AdaptivePoller(min_interval, settings.get("poll_max_ms", 300) / 1000 if max_interval is None else max_interval, float(settings.get("poll_backoff", 1.5)))
+
+def poll_until(region, check, timeout, max_interval, abort=None):
+    # Runs check(frame) on fresh grabs of one capture region until it returns something truthy, the timeout passes or
+    # abort() says stop. Frames that did not change since the last checked one are not checked again.
+    detector, poller = make_change_detector(), make_poller(max_interval); box = get_region(CAPTURE_REGIONS[region]); deadline = CLOCK.time() + timeout
+    while CLOCK.time() < deadline and not exit_program.is_set() and not (abort and abort()):
+        frame = grab_regions(region); changed = detector.changed(region, frame, box)
+        if changed:
+            result = check(frame)
+            if result: return result
+        CLOCK.sleep(poller.next(changed))
+    return None
+
+def library_paths(settings_data, rare_photos):
+    # (header/button template paths, [(name, form, path)] form photos, photo region size).
+    photo_size = (settings_data["photo_bottomright_x"] - settings_data["photo_topleft_x"], settings_data["photo_bottomright_y"] - settings_data["photo_topleft_y"])
+    template_paths = [settings_data[k] for k in ("ITEMS_HEADER_PATH", "ACE_DISC_PATH", "USE_IMAGE_PATH", "NO_BUTTON_IMAGE_PATH") if settings_data.get(k)]
+    return template_paths, [(name, form, path) for name, photos in rare_photos.items() for form, path in photos.items() if path], photo_size
+
+# --- Template Pack ---
+TEMPLATE_PACK_MAGIC = b"BOTPACK1"
+TEMPLATE_PACK_ARRAYS = ("gray", "photo", "coarse", "ssim_mu", "ssim_b2")
+
+class TemplatePack:
+    # One read-only, memory-mapped file with every preprocessed template: grayscale image and, for form photos, the
+    # region-sized copy, coarse vector, pHash and blurred SSIM terms. Layout: 64-byte aligned arrays, then a JSON index
+    # (by path, with name/form for photos), then its offset and length and the magic. Packs are written under a new
+    # generation name and never modified, so running bots (and other processes sharing the mapped pages) keep theirs.
+    def __init__(self, path):
+        with open(path, "rb") as f: self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[-8:] != TEMPLATE_PACK_MAGIC: raise ValueError(f"'{path}' is not a template pack")
+        start, length = int.from_bytes(self.mm[-24:-16], "little"), int.from_bytes(self.mm[-16:-8], "little")
+        self.path = path; self.index = json.loads(self.mm[start:start + length]); self.entries = {e["path"]: e for e in self.index["entries"]}
+    def __len__(self): return len(self.entries)
+    def array(self, ref):
+        offset, shape, dtype = ref; return np.frombuffer(self.mm, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+    def fresh(self, path):
+        entry = self.entries.get(path)
+        try: return entry if entry and tuple(entry["stamp"]) == TemplateStore._stamp(path) else None
+        except OSError: return None
+    def covers(self, template_paths, photos, photo_size, side):
+        if self.index["photo_size"] != list(photo_size) or self.index["side"] != side: return False
+        packed = {(e["name"], e["form"], e["path"]) for e in self.index["entries"] if e["name"] is not None}
+        return packed == set(photos) and all(self.fresh(p) for p in template_paths + [p for _, _, p in photos] if os.path.exists(p))
+    def views(self):
+        size, side = tuple(self.index["photo_size"]), self.index["side"]
+        return [dict({k: self.array(e[k]) if e.get(k) else None for k in TEMPLATE_PACK_ARRAYS}, path=e["path"], stamp=tuple(e["stamp"]), size=size, side=side)
+                for e in self.index["entries"] if self.fresh(e["path"])]
+    def hashes(self): return {e["path"]: e["phash"] for e in self.index["entries"] if e.get("phash") is not None and self.fresh(e["path"])}
+
+def write_template_pack(pack_dir, template_paths, photos, photo_size, side, previous=None):
+    # Streams a new pack generation to disk; entries that are still fresh in `previous` (same sizes) are copied from it.
+    os.makedirs(pack_dir, exist_ok=True); path = os.path.join(pack_dir, f"pack_{time.time_ns():020d}.bin")
+    reuse = previous if previous and previous.index["photo_size"] == list(photo_size) and previous.index["side"] == side else None
+    entries = []; reused = 0
+    with open(path + ".tmp", "wb") as f:
+        def put(array):
+            array = np.ascontiguousarray(array); offset = f.tell(); f.write(array.tobytes()); f.write(b"\0" * (-f.tell() % 64))
+            return [offset, list(array.shape), array.dtype.str]
+        for name, form, src in [(None, None, p) for p in dict.fromkeys(template_paths)] + list(photos):
+            try:
+                stamp = TemplateStore._stamp(src); old = reuse.fresh(src) if reuse else None
+                if old and (name is None or old.get("photo")): arrays = {k: reuse.array(old[k]) for k in TEMPLATE_PACK_ARRAYS if old.get(k)}; hashed = old.get("phash"); reused += 1
+                else:
+                    gray = decode_gray(src); arrays = {"gray": gray}; hashed = None
+                    if name is not None:
+                        photo = cv2.resize(gray, tuple(photo_size)); stats = SsimStats(photo); hashed = phash(photo)
+                        arrays.update(photo=photo, coarse=coarse_vector(photo, side), ssim_mu=stats.mu, ssim_b2=stats.b2)
+            except Exception as e: print(f"[WARNING] Could not pack template '{src}': {e}"); continue
+            entries.append(dict({k: put(a) for k, a in arrays.items()}, path=src, stamp=list(stamp), name=name, form=form, phash=hashed))
+        index = json.dumps({"photo_size": list(photo_size), "side": side, "entries": entries}).encode("utf-8"); start = f.tell()
+        f.write(index); f.write(start.to_bytes(8, "little") + len(index).to_bytes(8, "little") + TEMPLATE_PACK_MAGIC)
+    os.replace(path + ".tmp", path)
+    print(f"[INFO] Wrote template pack '{os.path.basename(path)}': {len(entries)} templates ({reused} reused).")
+    return path
+
+PACK_LOCK = threading.Lock()
+
+def refresh_template_pack(pack_dir, template_paths, photos, photo_size, side, write=True):
+    # Maps the newest pack generation, first writing a new one when templates were added, removed or changed. Only the GUI
+    # process writes and prunes generations (PACK_LOCK orders its threads); instance workers pass write=False and map the
+    # newest readable one as it is, decoding whatever it lacks, so separate processes never delete each other's packs.
+    with PACK_LOCK:
+        generations = sorted(glob.glob(os.path.join(pack_dir, "pack_*.bin"))); current = None
+        for path in reversed(generations):
+            try: current = TemplatePack(path); break
+            except Exception as e: print(f"[WARNING] Ignoring unreadable template pack '{path}': {e}")
+        if not write:
+            if current is None: raise FileNotFoundError(f"no template pack in '{pack_dir}'")
+            return current
+        if current and current.covers(template_paths, photos, photo_size, side): return current
+        current = TemplatePack(write_template_pack(pack_dir, template_paths, photos, photo_size, side, current))
+        for old in generations:  # still mapped elsewhere (a running instance on Windows) means it stays until next time
+            try: os.remove(old)
+            except OSError: pass
+        return current
+
+def load_bot_data_from_gui_file(instance=None, overrides=None):
+    # overrides: settings applied on top of the stored ones before anything is started (e.g. by the replay harness).
+    global settings; revision = app_data_revision(); settings_data, names_data, name_order = load_app_data(); settings = settings_data.copy()
+    if instance: apply_instance(settings, instance)
+    if overrides: settings.update(overrides)
+    rare_photos = rare_photos_of(names_data, name_order); print(f"[INFO] Loaded: {len(name_order)} names, {sum(len(v) for v in rare_photos.values())} photos.")
+    template_paths, photos, photo_size = library_paths(settings, rare_photos); side = int(settings.get("cascade_size", 48))
+    TEMPLATES.ssim_cache_size = int(settings.get("ssim_cache_size", 32)); SCALES.configure(template_scales(settings), int(settings.get("scale_miss_limit", 12))); WINDOWS.configure(int(settings.get("search_window_margin", 40)), int(settings.get("search_window_widen_every", 4))); start = time.perf_counter(); hashes = {}; mapped = ""
+    try: pack = refresh_template_pack(settings.get("template_pack_dir") or DEFAULTS["template_pack_dir"], template_paths, photos, photo_size, side, write=instance is None); TEMPLATES.adopt(pack.views()); hashes = pack.hashes(); mapped = f", {len(pack)} mapped from '{os.path.basename(pack.path)}'"
+    except Exception as e: print(f"[WARNING] Template pack unavailable, decoding templates instead: {e}")
+    loaded = TEMPLATES.preload(template_paths, [p for _, _, p in photos], photo_size, side)
+    print(f"[INFO] Template store ready: {loaded} templates{mapped} in {(time.perf_counter() - start) * 1000:.0f} ms.")
+    global DECISIONS; DECISIONS = compile_decisions(settings, names_data, name_order, revision, photo_size, hashes); print(f"[INFO] Decision table: {DECISIONS.summary()}.")
+    global OCR
+    if OCR: OCR.shutdown(); OCR = None
+    print(f"[INFO] OCR engine: {'glyph atlas + ' if get_ocr().atlas else ''}{OCR.name} with {OCR.workers} worker(s), cache of {OCR.cache_size} crops.")
+    stop_webhooks(); stop_input()
+    try: get_input().start(); print(f"[INFO] Input: {type(INPUT).__name__}.")
+    except Exception as e: print(f"[ERROR] Could not start the '{settings.get('input_backend')}' input driver: {e}")
+    stop_detector(); get_detector()
+    global CAPTURE, RECORDER, DATASET; CAPTURE = None; print(f"[INFO] Screen capture: {type(get_capture().backend).__name__} ({CAPTURE.mode} mode).")
+    stop_recorder(); stop_dataset()
+    if settings.get("record_dataset"): DATASET = DatasetRecorder(settings.get("dataset_dir") or DEFAULTS["dataset_dir"], int(settings.get("dataset_shard_frames", 500)), float(settings.get("dataset_val_fraction", 0.1)), int(settings.get("dataset_dedup_distance", 4)), settings.get("dataset_format", "png")); print(f"[INFO] Recording training data to '{DATASET.session_dir}'.")
+    if settings.get("record_frames"): RECORDER = FrameRecorder(settings.get("record_dir") or DEFAULTS["record_dir"], roi_only=settings.get("record_roi_only", True)); print(f"[INFO] Recording frames to '{RECORDER.session_dir}'.")
+
+HEADER_THRESHOLD = 0.90; BUTTON_THRESHOLD = 0.8
+
+def template_scales(settings_data):
+    if not settings_data.get("scale_search", True): return [1.0]
+    low, high, steps = float(settings_data.get("scale_min", 0.6)), float(settings_data.get("scale_max", 1.6)), max(2, int(settings_data.get("scale_steps", 21)))
+    return sorted({1.0, *(round(float(s), 3) for s in np.geomspace(low, high, steps))})
+
+class ScaleMatcher:
+    # The scale at which each template matches, per (template, search area size), so a resized window or changed DPI
+    # does not make every template miss. A pyramid search over `scales` finds it; matching then runs at that one scale,
+    # and only after `miss_limit` consecutive misses there is the pyramid searched again. A search that finds nothing
+    # keeps the old scale and doubles the misses needed before the next one (up to `max_backoff` times miss_limit),
+    # so a template that stays absent (the header while searching, a button not shown yet) costs ever rarer searches;
+    # the next hit resets the wait to miss_limit.
+    def __init__(self, scales=(1.0,), miss_limit=30, max_backoff=64): self._state = {}; self._lock = threading.Lock(); self.max_backoff = max_backoff; self.configure(scales, miss_limit)
+    def configure(self, scales, miss_limit):
+        with self._lock: self.scales = sorted(scales, key=lambda s: abs(np.log(s))); self.miss_limit = max(1, miss_limit); self._state.clear()
+    def match_at(self, scene_gray, path, scale):
+        templ = TEMPLATES.scaled(path, scale)
+        if templ.shape[0] > scene_gray.shape[0] or templ.shape[1] > scene_gray.shape[1]: return -1.0, (0, 0), templ.shape
+        _, score, _, loc = cv2.minMaxLoc(cv2.matchTemplate(scene_gray, templ, cv2.TM_CCOEFF_NORMED)); return float(score), loc, templ.shape
+    def learned(self, path):
+        # The scale last settled on for this template in any search area (1.0 before it has been seen).
+        with self._lock: return next((state[0] for (p, _), state in self._state.items() if p == path and state[0] is not None), 1.0)
+    def match(self, scene_gray, path, threshold, geometry=None):
+        # (score, top-left of the match, template (h, w) at the scale used). geometry defaults to the scene size.
+        key = (path, geometry or scene_gray.shape[:2])
+        with self._lock: scale, misses, limit = self._state.get(key, (None, 0, self.miss_limit))
+        if scale is not None:
+            result = self.match_at(scene_gray, path, scale); hit = result[0] >= threshold
+            if hit or misses + 1 < limit or len(self.scales) < 2:
+                with self._lock: self._state[key] = (scale, 0, self.miss_limit) if hit else (scale, misses + 1, limit)
+                return result
+        with TRACER.span("scale_search", "vision", template=os.path.basename(path)) as span:
+            best_scale, best = max(((s, self.match_at(scene_gray, path, s)) for s in self.scales), key=lambda r: r[1][0]); span["scale"] = best_scale; span["score"] = round(best[0], 4)
+        found = best[0] >= threshold
+        if found and best_scale != (scale or 1.0): print(f"[INFO] '{os.path.basename(path)}' matches at scale {best_scale:.2f} (score {best[0]:.3f}).")
+        with self._lock: self._state[key] = (best_scale, 0, self.miss_limit) if found else (scale or 1.0, 0, min(limit * 2, self.miss_limit * self.max_backoff))
+        return best if found or scale is None else result
+
+SCALES = ScaleMatcher(template_scales(DEFAULTS), DEFAULTS["scale_miss_limit"])
+
+class SearchWindows:
+    # Last hit of each template inside its configured region. Searches run in a window `margin` pixels around it; every
+    # `widen_every` consecutive misses there (e.g. while waiting for a button to appear) one search covers the whole
+    # region instead, and a hit anywhere moves the window.
+    def __init__(self, margin=40, widen_every=4): self.margin = margin; self.widen_every = max(1, widen_every); self._hits = {}; self._lock = threading.Lock()
+    def configure(self, margin, widen_every):
+        with self._lock: self.margin = margin; self.widen_every = max(1, widen_every); self._hits.clear()
+    def region(self, key, scan_region):
+        with self._lock: entry = self._hits.get((key, scan_region))
+        if not entry or (entry[1] + 1) % self.widen_every == 0: return scan_region
+        (x1, y1, x2, y2), m = entry[0], self.margin
+        return (max(scan_region[0], x1 - m), max(scan_region[1], y1 - m), min(scan_region[2], x2 + m), min(scan_region[3], y2 + m))
+    def update(self, key, scan_region, box):
+        with self._lock:
+            entry = self._hits.get((key, scan_region))
+            if box: self._hits[(key, scan_region)] = (box, 0)
+            elif entry: self._hits[(key, scan_region)] = (entry[0], entry[1] + 1)
+
+WINDOWS = SearchWindows(DEFAULTS["search_window_margin"], DEFAULTS["search_window_widen_every"])
+
+# --- Learned Detector (optional) ---
+DETECTOR_BACKENDS = ["template", "onnx"]
+DETECTOR_CLASSES = {"ITEMS_HEADER_PATH": "header", "ACE_DISC_PATH": "ace_disc", "USE_IMAGE_PATH": "use_button", "NO_BUTTON_IMAGE_PATH": "no_button"}  # template setting -> class
+SPRITE_CLASS = "sprite"
+DETECTOR_REGIONS = ("header", "photo", "action")
+
+def detector_class_names(session, model_path):
+    # Ultralytics exports write {index: name} into the model metadata; otherwise classes.txt beside the model, one per line.
+    names = session.get_modelmeta().custom_metadata_map.get("names")
+    if names: names = ast.literal_eval(names); return [names[i] for i in sorted(names)]
+    with open(os.path.join(os.path.dirname(model_path), "classes.txt"), encoding="utf-8") as f: return [line.strip() for line in f if line.strip()]
+
+def letterbox(image, size):
+    # Fits the image into size x size keeping its aspect ratio, padded with YOLO's grey: (CHW uint8, gain, pad x, pad y).
+    w, h = image.size; gain = min(size / w, size / h); nw, nh = max(1, round(w * gain)), max(1, round(h * gain)); px, py = (size - nw) // 2, (size - nh) // 2
+    canvas = np.full((size, size, 3), 114, np.uint8); canvas[py:py + nh, px:px + nw] = cv2.resize(np.asarray(image.convert("RGB")), (nw, nh), interpolation=cv2.INTER_AREA if gain < 1 else cv2.INTER_LINEAR)
+    return canvas.transpose(2, 0, 1), gain, px, py
+
+def frame_covers(frame, box): return frame.covers(box) if hasattr(frame, "covers") else box[2] <= frame.size[0] and box[3] <= frame.size[1]
+
+class OnnxDetector:
+    # A YOLO model trained with Train_YOLO_Models.ipynb and exported with `yolo export format=onnx` (add dynamic=True to
+    # batch), run by ONNX Runtime on the CPU. Every scan region a frame covers is letterboxed into one batch, so the
+    # header, buttons and sprite come out of a single inference per frame, and the result is kept until another frame
+    # is asked about. Int8 models (bench.py quantize) load the same way; the runtime picks the quantized kernels.
+    def __init__(self, model_path, conf=0.5, iou=0.45, threads=0):
+        import onnxruntime as ort
+        options = ort.SessionOptions(); options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads: options.intra_op_num_threads = threads
+        self.path = model_path; self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"]); inp = self.session.get_inputs()[0]
+        self.input_name = inp.name; self.size = inp.shape[2] if isinstance(inp.shape[2], int) else 640
+        self.batch = inp.shape[0] if isinstance(inp.shape[0], int) else None  # None: dynamic batch axis
+        self.dtype = np.float16 if inp.type == "tensor(float16)" else np.float32
+        self.names = detector_class_names(self.session, model_path); self.conf, self.iou = conf, iou; self._lock = threading.Lock(); self._last = (None, [])
+    def has(self, name): return name in self.names
+    def infer(self, images):
+        # Raw YOLO output (n, 4 + classes, anchors) for a list of CHW uint8 images, in batches the model accepts.
+        batch = (np.stack(images).astype(np.float32) * (1 / 255)).astype(self.dtype, copy=False); step = self.batch or len(batch)
+        return np.concatenate([self.session.run(None, {self.input_name: batch[i:i + step]})[0] for i in range(0, len(batch), step)])
+    def decode(self, pred, roi, gain, px, py):
+        # Rows of (cx, cy, w, h, class scores...) in letterbox pixels -> [(class, score, screen box)] after per-class NMS.
+        scores = pred[:, 4:]; cls = scores.argmax(1); conf = scores[np.arange(len(cls)), cls]; keep = conf >= self.conf
+        if not keep.any(): return []
+        cx, cy, w, h = pred[keep, :4].T; cls, conf = cls[keep], conf[keep]
+        kept = cv2.dnn.NMSBoxesBatched(np.column_stack([cx - w / 2, cy - h / 2, w, h]).tolist(), conf.tolist(), cls.tolist(), self.conf, self.iou)
+        found = []
+        for i in np.asarray(kept, dtype=int).reshape(-1):
+            x1, y1, x2, y2 = ((cx[i] - w[i] / 2 - px) / gain, (cy[i] - h[i] / 2 - py) / gain, (cx[i] + w[i] / 2 - px) / gain, (cy[i] + h[i] / 2 - py) / gain)
+            box = (int(max(roi[0], roi[0] + x1)), int(max(roi[1], roi[1] + y1)), int(min(roi[2], roi[0] + x2)), int(min(roi[3], roi[1] + y2)))
+            if box[2] > box[0] and box[3] > box[1]: found.append((self.names[cls[i]] if cls[i] < len(self.names) else str(cls[i]), float(conf[i]), box))
         return found
-    except Exception as e: print(f"[ERROR] Items header detect error: {e}"); return False
+    def detect(self, frame, rois):
+        # [(class name, score, screen box)] over the given screen boxes of frame, one batched inference for all of them.
+        crops = [letterbox(frame.crop(roi), self.size) for roi in rois]; found = []
+        with TRACER.span("detector", "vision", rois=len(rois)) as span:
+            for roi, (_, gain, px, py), pred in zip(rois, crops, self.infer([c[0] for c in crops]) if crops else []): found += self.decode(pred.T, roi, gain, px, py)
+            span["detections"] = len(found)
+        return found
+    def frame_detections(self, frame):
+        with self._lock:
+            if self._last[0] is not frame: self._last = (frame, self.detect(frame, [box for box in dict.fromkeys(get_region(CAPTURE_REGIONS[n]) for n in DETECTOR_REGIONS) if frame_covers(frame, box)]))
+            return self._last[1]
+
+DETECTOR = None
+
+def get_detector():
+    # The ONNX detector when detector_backend is "onnx" and the model loads; None means template matching.
+    global DETECTOR
+    if DETECTOR is None and settings.get("detector_backend", "template") == "onnx":
+        path = settings.get("detector_model_path") or DEFAULTS["detector_model_path"]
+        try: DETECTOR = OnnxDetector(path, float(settings.get("detector_conf", 0.5)), float(settings.get("detector_iou", 0.45)), int(settings.get("detector_threads", 0))); print(f"[INFO] Detector: '{os.path.basename(path)}' ({', '.join(DETECTOR.names)}) at {DETECTOR.size}px.")
+        except Exception as e: DETECTOR = False; print(f"[WARNING] Could not load the ONNX detector '{path}', using template matching: {e}")
+    return DETECTOR or None
+
+def stop_detector():
+    global DETECTOR; DETECTOR = None
+
+# --- Training Data ---
+DATASET_CLASSES = list(DETECTOR_CLASSES.values()) + [SPRITE_CLASS]  # classes.txt order, so exported models keep these ids
+
+def yolo_row(cls, box, tile_box):
+    # "class cx cy w h" normalised to the tile, or None when the box does not overlap it.
+    tx1, ty1, tx2, ty2 = tile_box; x1, y1, x2, y2 = max(box[0], tx1), max(box[1], ty1), min(box[2], tx2), min(box[3], ty2)
+    if x2 <= x1 or y2 <= y1: return None
+    tw, th = tx2 - tx1, ty2 - ty1; return f"{DATASET_CLASSES.index(cls)} {((x1 + x2) / 2 - tx1) / tw:.6f} {((y1 + y2) / 2 - ty1) / th:.6f} {(x2 - x1) / tw:.6f} {(y2 - y1) / th:.6f}"
+
+def template_boxes(img, tile_box):
+    # Every header/button template found in a recorded tile, at the scale the bot learned for it: [(class, screen box)].
+    # Run by the dataset writer so each image is labelled with everything visible, not just what its own checks looked for.
+    gray = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2GRAY); found = []
+    for key, cls in DETECTOR_CLASSES.items():
+        path = settings.get(key); region = get_region("header" if key == "ITEMS_HEADER_PATH" else "action_scan"); threshold = HEADER_THRESHOLD if key == "ITEMS_HEADER_PATH" else BUTTON_THRESHOLD
+        x1, y1, x2, y2 = max(region[0], tile_box[0]), max(region[1], tile_box[1]), min(region[2], tile_box[2]), min(region[3], tile_box[3])
+        if not path or x2 <= x1 or y2 <= y1: continue
+        score, (x, y), (th, tw) = SCALES.match_at(gray[y1 - tile_box[1]:y2 - tile_box[1], x1 - tile_box[0]:x2 - tile_box[0]], path, SCALES.learned(path))
+        if score >= threshold: found.append((cls, (x1 + x, y1 + y, x1 + x + tw, y1 + y + th)))
+    return found
+
+class NearHashSet:
+    # 64-bit hashes answering "is one within max_distance bits of h?" without comparing against all of them: the bits are
+    # cut into max_distance + 1 bands and two hashes that close agree exactly on at least one band, so only hashes sharing
+    # a band value with h are compared.
+    def __init__(self, max_distance):
+        n = min(64, max(0, max_distance) + 1); edges = [64 * i // n for i in range(n + 1)]; self.max_distance = max_distance; self.size = 0
+        self.bands = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]; self.buckets = [collections.defaultdict(list) for _ in self.bands]
+    def add(self, h):
+        for (shift, mask), bucket in zip(self.bands, self.buckets): bucket[(h >> shift) & mask].append(h)
+        self.size += 1
+    def __contains__(self, h):
+        return any(bin(h ^ s).count("1") <= self.max_distance for (shift, mask), bucket in zip(self.bands, self.buckets) for s in bucket.get((h >> shift) & mask, ()))
+    def __len__(self): return self.size
+
+class DatasetRecorder:
+    # Builds a YOLO dataset for Train_YOLO_Models.ipynb from the encounters the bot plays. Checks on the scan thread only
+    # note the boxes they matched on their frame (label_frame), which queues it. The writer thread waits `settle`
+    # seconds so the other checks on that frame are in, then labels each tile with every template it contains too.
+    # Tiles within `dedup_distance` pHash bits of a sample still held back (for `hold` seconds, long enough for a form
+    # match to follow the header) merge their labels into it, and ones matching an already written sample are skipped,
+    # so the same screen is stored once with all its labels. Samples are streamed into zip shards of `shard_size`
+    # images laid out as {train,validation}/{images,labels} with classes.txt; unzipping every shard into one folder
+    # gives the notebook's data/ directory. A shard is written as .part and renamed when complete; frames are dropped
+    # (and counted) rather than blocking when the writer lags. The sprite box is the whole photo region: the bot compares
+    # form photos against that region and never locates the sprite inside it.
+    def __init__(self, root_dir, shard_size=500, val_fraction=0.1, dedup_distance=4, fmt="png", settle=0.5, hold=12.0, max_pending=64):
+        self.session = time.strftime("session_%Y%m%d_%H%M%S"); self.session_dir = os.path.join(root_dir, self.session); os.makedirs(self.session_dir, exist_ok=True)
+        self.shard_size, self.val_fraction, self.dedup_distance, self.fmt, self.settle, self.hold = max(1, shard_size), val_fraction, dedup_distance, fmt, settle, hold
+        self.queue = queue.Queue(maxsize=max_pending); self.held = []; self.written = NearHashSet(dedup_distance); self.shard = None; self.shards = 0; self.meta = []; self.counts = collections.Counter()
+        self.thread = threading.Thread(target=self._writer, daemon=True, name="dataset"); self.thread.start()
+    def add(self, frame):
+        try: self.queue.put_nowait((time.perf_counter(), frame))
+        except queue.Full: self.counts["dropped"] += 1
+    def _open_shard(self):
+        self.shard_path = os.path.join(self.session_dir, f"shard_{self.shards:04d}.zip"); self.shard = zipfile.ZipFile(self.shard_path + ".part", "w", zipfile.ZIP_DEFLATED)
+        self.shard.writestr("classes.txt", "\n".join(DATASET_CLASSES) + "\n"); self.meta = []
+    def _close_shard(self):
+        if not self.shard: return
+        self.shard.writestr(f"meta/{self.session}_{self.shards:04d}.jsonl", "".join(json.dumps(m) + "\n" for m in self.meta)); self.shard.close()
+        os.replace(self.shard_path + ".part", self.shard_path); self.shard = None; self.shards += 1
+    def _near(self, a, b): return bin(a ^ b).count("1") <= self.dedup_distance
+    def _add_tiles(self, frame):
+        noted, meta = list(frame.labels), dict(frame.meta)
+        for tile_box, img in frame.tiles:
+            rows = {row: None for row in (yolo_row(cls, box, tile_box) for cls, box in noted + template_boxes(img, tile_box)) if row}
+            if not rows: continue
+            h = phash(np.asarray(img.convert("L"))); sample = next((s for s in self.held if self._near(h, s["hash"])), None)
+            if sample: sample["rows"].update(rows); sample["meta"].update(meta); self.counts["merged"] += 1
+            elif h in self.written: self.counts["duplicates"] += 1
+            else: self.held.append({"hash": h, "img": img, "box": tile_box, "rows": rows, "meta": meta, "t": frame.timestamp, "held": time.perf_counter()})
+    def _write(self, sample):
+        h, rows = sample["hash"], list(sample["rows"]); self.written.add(h); split = "validation" if (h % 1000) < self.val_fraction * 1000 else "train"
+        stem = f"{self.session}_{self.counts['frames']:07d}"; data = BytesIO()
+        if self.fmt == "jpeg": sample["img"].save(data, "JPEG", quality=95)
+        else: sample["img"].save(data, "PNG", compress_level=6)
+        if not self.shard: self._open_shard()
+        self.shard.writestr(f"{split}/images/{stem}.{'jpg' if self.fmt == 'jpeg' else 'png'}", data.getvalue(), compress_type=zipfile.ZIP_STORED)
+        self.shard.writestr(f"{split}/labels/{stem}.txt", "\n".join(rows) + "\n")
+        self.meta.append(dict(sample["meta"], image=stem, split=split, t=sample["t"], box=list(sample["box"]), classes=sorted({DATASET_CLASSES[int(row.split()[0])] for row in rows})))
+        self.counts["frames"] += 1; self.counts[split] += 1
+        if len(self.meta) >= self.shard_size: self._close_shard()
+    def _flush(self, everything=False):
+        now = time.perf_counter()
+        while self.held and (everything or now - self.held[0]["held"] >= self.hold or len(self.held) > self.queue.maxsize):
+            try: self._write(self.held.pop(0))
+            except Exception as e: print(f"[ERROR] Dataset recorder failed to write a frame: {e}")
+    def _writer(self):
+        while True:
+            try: item = self.queue.get(timeout=1.0)
+            except queue.Empty: self._flush(); continue
+            if item is None: break
+            queued, frame = item; time.sleep(max(0.0, queued + self.settle - time.perf_counter()))
+            try: self._add_tiles(frame)
+            except Exception as e: print(f"[ERROR] Dataset recorder failed to label a frame: {e}")
+            self._flush()
+        self._flush(everything=True)
+        try: self._close_shard()
+        except Exception as e: print(f"[ERROR] Dataset recorder failed to finish '{self.shard_path}': {e}")
+    def close(self):
+        self.queue.put(None); self.thread.join(timeout=30)
+        c = self.counts; print(f"[INFO] Dataset: {c['frames']} images ({c['train']} train, {c['validation']} validation) in {self.shards} shard(s) under '{self.session_dir}' ({c['merged']} repeats merged, {c['duplicates']} duplicates skipped, {c['dropped']} dropped).")
+
+DATASET = None
+
+def stop_dataset():
+    global DATASET
+    if DATASET: recorder, DATASET = DATASET, None; recorder.close()
 
-def ocr_text(screen_image):
-    ocr_region = (settings["ocr_topleft_x"], settings["ocr_topleft_y"], settings["ocr_bottomright_x"], settings["ocr_bottomright_y"])
+def label_frame(frame, cls=None, box=None, **meta):
+    # Notes a box a check matched on this frame (and facts such as the OCR name or form) for the dataset recorder;
+    # the first box queues the frame. Frames that are not CapturedFrames (GUI test grabs) are never recorded.
+    if DATASET is None or not hasattr(frame, "labels"): return
+    frame.meta.update(meta)
+    if cls in DATASET_CLASSES and box:
+        if not frame.labels: DATASET.add(frame)
+        frame.labels.append((cls, box))
+
+def detector_class(template_path): return next((name for key, name in DETECTOR_CLASSES.items() if settings.get(key) == template_path), None)
+
+def detector_hit(frame, name, region):
+    # Best (score, box) for class `name` centred inside region from the frame's detector pass, (0.0, None) when it is
+    # absent, or None when the detector is off or does not know the class (the caller then matches templates).
+    detector = get_detector()
+    if detector is None or not detector.has(name): return None
+    try: hits = [(score, box) for cls, score, box in detector.frame_detections(frame) if cls == name and region[0] <= (box[0] + box[2]) / 2 <= region[2] and region[1] <= (box[1] + box[3]) / 2 <= region[3]]
+    except Exception as e: print(f"[ERROR] Detector failed, matching templates instead: {e}"); return None
+    return max(hits, default=(0.0, None))
+
+def header_score(screen_image):
+    screen_gray = cv2.cvtColor(np.array(screen_image.crop(get_region("header"))), cv2.COLOR_RGB2GRAY)
+    with TRACER.span("header_match", "vision") as span: score, (x, y), (th, tw) = SCALES.match(screen_gray, settings["ITEMS_HEADER_PATH"], HEADER_THRESHOLD); span["score"] = round(score, 4)
+    if score > HEADER_THRESHOLD: x1, y1 = get_region("header")[:2]; label_frame(screen_image, "header", (x1 + x, y1 + y, x1 + x + tw, y1 + y + th))
+    VISION["header"] = f"{score:.3f}"; return score
+
+def items_header_detected(screen_image):
     try:
-        gray = cv2.cvtColor(np.array(screen_image.crop(ocr_region)), cv2.COLOR_BGR2GRAY)
-        _, thresh = cv2.threshold(gray, 180, 255, cv2.THRESH_BINARY_INV)
-        text = pytesseract.image_to_string(thresh, config=r'--oem 3 --psm 7').replace('_', '').strip()
+        hit = detector_hit(screen_image, "header", get_region("header"))
+        if hit: VISION["header"] = f"detector {hit[0]:.3f}"; return hit[1] is not None
+        return header_score(screen_image) > HEADER_THRESHOLD
+    except Exception as e: print(f"[ERROR] Items header detect error: {e}"); return False
+
+GLYPH_CELL = 16
+
+def nameplate_threshold(crop):
+    # Same preprocessing the OCR has always used: grayscale, then text brighter than 180 becomes black on white.
+    return cv2.threshold(cv2.cvtColor(np.array(crop), cv2.COLOR_BGR2GRAY), 180, 255, cv2.THRESH_BINARY_INV)[1]
+
+def segment_glyphs(thresh):
+    # Connected components of the ink (the minority colour), left to right; components stacked in the same columns
+    # (i/j dots, accents) are merged into one glyph. Returns the label image and (x, y, w, h, component ids) per glyph.
+    ink = (thresh == 0) if np.count_nonzero(thresh == 0) <= thresh.size / 2 else (thresh != 0)
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(ink.astype(np.uint8), connectivity=8)
+    glyphs = []
+    for i in sorted(range(1, n), key=lambda i: stats[i, 0]):
+        x, y, w, h, area = (int(v) for v in stats[i])
+        if area < 2: continue
+        if glyphs:
+            gx, gy, gw, gh, ids = glyphs[-1]
+            if min(gx + gw, x + w) - max(gx, x) >= 0.5 * min(gw, w):
+                nx, ny = min(gx, x), min(gy, y); glyphs[-1] = (nx, ny, max(gx + gw, x + w) - nx, max(gy + gh, y + h) - ny, ids + [i]); continue
+        glyphs.append((x, y, w, h, [i]))
+    return labels, glyphs
+
+def glyph_vectors(labels, glyphs):
+    # Each glyph is centred in a cell spanning the full line height (so case and baseline position survive), resized to
+    # GLYPH_CELL x GLYPH_CELL and normalized to zero mean / unit norm for correlation matching.
+    top = min(g[1] for g in glyphs); bottom = max(g[1] + g[3] for g in glyphs); line_h = bottom - top; vectors = []
+    for x, y, w, h, ids in glyphs:
+        mask = np.isin(labels[top:bottom, x:x + w], ids).astype(np.float32); cell = np.zeros((line_h, max(w, line_h)), np.float32)
+        off = (cell.shape[1] - w) // 2; cell[:, off:off + w] = mask
+        vec = cv2.resize(cell, (GLYPH_CELL, GLYPH_CELL), interpolation=cv2.INTER_AREA).ravel(); vec -= vec.mean(); norm = np.linalg.norm(vec)
+        vectors.append(vec / norm if norm > 0 else vec)
+    return np.stack(vectors), line_h
+
+class GlyphAtlas:
+    # Nameplate OCR by template-matching segmented glyphs against labelled prototypes (built with build_glyph_atlas.py).
+    def __init__(self, vectors, labels, space_ratio=0.4): self.vectors = np.asarray(vectors, np.float32); self.labels = [str(l) for l in labels]; self.space_ratio = float(space_ratio)
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data: return cls(data["vectors"], data["labels"], data["space_ratio"])
+    def save(self, path): np.savez_compressed(path, vectors=self.vectors, labels=np.array(self.labels), space_ratio=np.float32(self.space_ratio))
+    def read(self, thresh):
+        labels, glyphs = segment_glyphs(thresh)
+        if not glyphs: return "", 0.0
+        vectors, line_h = glyph_vectors(labels, glyphs); scores = vectors @ self.vectors.T; best = scores.argmax(axis=1); text = ""
+        for i, (x, y, w, h, _) in enumerate(glyphs):
+            if i and x - (glyphs[i - 1][0] + glyphs[i - 1][2]) > self.space_ratio * line_h: text += " "
+            text += self.labels[best[i]]
+        return text, float(scores.max(axis=1).min())
+
+class OcrEngine:
+    # Long-lived OCR workers plus an LRU cache keyed by a hash of the thresholded crop. With tesserocr installed each
+    # worker thread keeps its own in-process Tesseract API (no process spawn per read); otherwise reads go through
+    # pytesseract. A glyph atlas, when given, answers first and Tesseract is only asked when its confidence is low.
+    # Concurrent requests for the same crop share one in-flight read.
+    def __init__(self, engine="auto", workers=2, cache_size=256, tessdata=None, atlas=None, min_confidence=0.85):
+        self.tesserocr = None; self.atlas = atlas; self.min_confidence = min_confidence
+        if engine in ("auto", "tesserocr"):
+            try: import tesserocr; self.tesserocr = tesserocr
+            except ImportError:
+                if engine == "tesserocr": print("[WARNING] tesserocr is not installed, falling back to pytesseract.")
+        self.tessdata = tessdata; self.workers = max(1, workers); self.cache_size = cache_size; self.cache = collections.OrderedDict(); self.inflight = {}; self.hits = self.misses = 0
+        self._lock = threading.Lock(); self._local = threading.local(); self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr")
+    @property
+    def name(self): return "tesserocr" if self.tesserocr else "pytesseract"
+    def _api(self):
+        if not hasattr(self._local, "api"):
+            kwargs = {"path": self.tessdata} if self.tessdata else {}
+            self._local.api = self.tesserocr.PyTessBaseAPI(psm=self.tesserocr.PSM.SINGLE_LINE, oem=self.tesserocr.OEM.DEFAULT, **kwargs)
+        return self._local.api
+    def _read(self, thresh):
+        if self.atlas:
+            with TRACER.span("ocr", "vision", engine="glyph") as span:
+                text, confidence = self.atlas.read(thresh); span.update(text=text, confidence=round(confidence, 3))
+            if text and confidence >= self.min_confidence: return text
+        with TRACER.span("ocr", "vision", engine=self.name) as span:
+            if self.tesserocr: api = self._api(); api.SetImage(Image.fromarray(thresh)); text = api.GetUTF8Text()
+            else: text = pytesseract.image_to_string(thresh, config=r'--oem 3 --psm 7')
+            span["text"] = text = text.replace('_', '').strip()
         return text
+    def submit(self, thresh):
+        key = hashlib.blake2b(thresh.tobytes() + str(thresh.shape).encode(), digest_size=16).digest()
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key); self.hits += 1; done = Future(); done.set_result(self.cache[key]); return done
+            if key in self.inflight: return self.inflight[key]
+            self.misses += 1; future = self.inflight[key] = self.pool.submit(self._read, thresh)
+        future.add_done_callback(lambda f: self._store(key, f))
+        return future
+    def _store(self, key, future):
+        with self._lock:
+            self.inflight.pop(key, None)
+            if future.cancelled() or future.exception(): return
+            self.cache[key] = future.result()
+            while len(self.cache) > self.cache_size: self.cache.popitem(last=False)
+    def shutdown(self): self.pool.shutdown(wait=False, cancel_futures=True)
+
+OCR = None
+
+def get_ocr():
+    global OCR
+    if OCR is None:
+        tesseract = settings.get("TESSERACT_PATH") or ""; tessdata = os.path.join(os.path.dirname(tesseract), "tessdata") if tesseract else ""
+        atlas_path = settings.get("glyph_atlas_path") or ""; atlas = None
+        if atlas_path and os.path.exists(atlas_path):
+            try: atlas = GlyphAtlas.load(atlas_path)
+            except Exception as e: print(f"[WARNING] Could not load glyph atlas '{atlas_path}': {e}")
+        OCR = OcrEngine(settings.get("ocr_engine", "auto"), int(settings.get("ocr_workers", 2)), int(settings.get("ocr_cache_size", 256)), tessdata if os.path.isdir(tessdata) else None, atlas, float(settings.get("glyph_min_confidence", 0.85)))
+        if not OCR.tesserocr and settings.get("ocr_engine", "auto") == "auto": print(f"[WARNING] tesserocr is not installed: every uncached read{' the glyph atlas is unsure of' if atlas else ''} starts a tesseract process through pytesseract. It is optional and has no Windows wheels on PyPI, see the note at the end of requr.txt.")
+    return OCR
+
+def ocr_threshold(screen_image): return nameplate_threshold(screen_image.crop(get_region("ocr")))
+
+def ocr_text_async(screen_image):
+    try: return get_ocr().submit(ocr_threshold(screen_image))
+    except Exception as e: failed = Future(); failed.set_exception(e); return failed
+
+def ocr_result(future):
+    try: return future.result()
     except Exception as e: print(f"[ERROR] OCR failed: {e}"); return ""
 
+def ocr_text(screen_image): return ocr_result(ocr_text_async(screen_image))
+
+# --- Webhooks ---
+def encode_attachment(image, fmt="png", scale=1.0, quality=85, region="screen"):
+    if region and region != "screen": image = image.crop(get_region(CAPTURE_REGIONS[region]))
+    if scale < 1: image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+    buffered = BytesIO()
+    if fmt == "jpeg": image.convert("RGB").save(buffered, format="JPEG", quality=quality); return "screenshot.jpg", "image/jpeg", buffered.getvalue()
+    image.save(buffered, format="PNG"); return "screenshot.png", "image/png", buffered.getvalue()
+
+class WebhookDispatcher:
+    # Delivers webhook messages from a background thread so a slow endpoint never stalls the scan thread. Each message
+    # is encoded once and posted to every URL concurrently over one pooled requests.Session. Connection errors, 429 and
+    # 5xx responses are retried with exponential backoff (honouring Retry-After); when the queue is full, new messages
+    # are dropped rather than blocking the caller, and close() only signals the thread, so it never waits on delivery.
+    def __init__(self, max_pending=16, retries=3, backoff=1.0, timeout=10, workers=4):
+        self.session = requests.Session(); adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter); self.session.mount("https://", adapter)
+        self.retries = retries; self.backoff = backoff; self.timeout = timeout; self.stats = collections.Counter(); self._lock = threading.Lock(); self._closing = threading.Event(); self._stopping = threading.Event()
+        self.queue = queue.Queue(maxsize=max_pending); self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webhook_post")
+        self.thread = threading.Thread(target=self._run, name="webhook", daemon=True); self.thread.start()
+    def _count(self, key):
+        with self._lock: self.stats[key] += 1
+    def send(self, urls, message, image, **attachment):
+        urls = [url for url in urls if url]
+        if not urls or self._stopping.is_set(): return False
+        try: self.queue.put_nowait((urls, message, image, attachment)); return True
+        except queue.Full: self._count("dropped"); print(f"[WARNING] Webhook queue full, dropped message: {message}"); return False
+    def _run(self):
+        while True:
+            try: item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopping.is_set(): break
+                continue
+            try:
+                if item is None: break
+                urls, message, image, attachment = item
+                with TRACER.span("webhook_encode", "io", format=attachment.get("fmt", "png")) as span: name, mime, data = encode_attachment(image, **attachment); span["bytes"] = len(data)
+                for future in [self.pool.submit(self._post, url, message, name, mime, data) for url in urls]: future.result()
+            except Exception as e: print(f"[ERROR] Webhook dispatch failed: {e}")
+            finally: self.queue.task_done()
+        self.pool.shutdown(wait=True); self.session.close()
+    def _post(self, url, message, name, mime, data):
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2 ** attempt
+            try:
+                with TRACER.span("webhook_post", "io", attempt=attempt) as span:
+                    response = self.session.post(url, data={"content": message}, files={"file": (name, data, mime)}, timeout=self.timeout); span["status"] = response.status_code
+                if response.status_code < 400: self._count("sent"); return True
+                error = f"HTTP {response.status_code}"
+                if response.status_code != 429 and response.status_code < 500: break
+                try: delay = max(delay, float(response.headers.get("Retry-After", 0)))
+                except ValueError: pass
+            except requests.RequestException as e: error = e
+            if attempt < self.retries and not self._closing.wait(delay): continue
+            break
+        self._count("failed"); print(f"[ERROR] Webhook failed to {url}: {error}"); return False
+    def flush(self): self.queue.join()
+    def close(self, abort_retries=False):
+        # Messages already queued are still delivered; abort_retries only cuts short the backoff waits.
+        if abort_retries: self._closing.set()
+        self._stopping.set()
+        try: self.queue.put_nowait(None)  # wakes an idle thread; a busy one sees _stopping once the queue is drained
+        except queue.Full: pass
+
+WEBHOOKS = None
+
+def get_webhooks():
+    global WEBHOOKS
+    if WEBHOOKS is None: WEBHOOKS = WebhookDispatcher(int(settings.get("webhook_queue_size", 16)), int(settings.get("webhook_retries", 3)))
+    return WEBHOOKS
+
+def stop_webhooks():
+    global WEBHOOKS
+    if WEBHOOKS: dispatcher, WEBHOOKS = WEBHOOKS, None; dispatcher.close()
+
 def send_webhook_with_image_pil(message, pil_image):
-    for url in settings["WEBHOOK_URLS"]:
-        if not url: continue
-        try:
-            buffered = BytesIO(); pil_image.save(buffered, format="PNG"); buffered.seek(0)
-            requests.post(url, data={"content": message}, files={'file': ('screenshot.png', buffered, 'image/png')}, timeout=10)
-        except Exception as e: print(f"[ERROR] Webhook failed to {url}: {e}")
+    get_webhooks().send(settings["WEBHOOK_URLS"], message, pil_image, fmt=settings.get("webhook_format", "png"), scale=float(settings.get("webhook_scale", 1.0)),
+                        quality=int(settings.get("webhook_jpeg_quality", 85)), region=settings.get("webhook_region", "screen"))
+
+# --- Input Drivers ---
+INPUT_BACKENDS = ["ahk", "ahk_script", "pyautogui", "record"]
+INPUT_DRIVER_SCRIPT = os.path.join(SCRIPT_DIR, "input_driver.ahk")
+STOCK_CLICK_SCRIPT = "roblox_activate_click.ahk"  # the driver's own "click" does what this script does, without a new process
+
+class PyAutoGuiInput:
+    # In-process input through pyautogui (Win32 on Windows, Xlib on Linux/X11): nothing is spawned per click.
+    def start(self): pass
+    def move(self, x, y, duration): pyautogui.moveTo(x, y, duration=duration, tween=pyautogui.easeInOutQuad)
+    def click(self, script_path=None, check=False):
+        # One jitter per click: pressing and releasing at different points would be a tiny drag, not a click.
+        x, y = pyautogui.position(); x += random.randint(-3, 3); y += random.randint(-3, 3)
+        pyautogui.mouseDown(x, y); CLOCK.sleep(random.uniform(0.05, 0.16)); pyautogui.mouseUp(x, y)
+    def close(self): pass
+
+class AhkScriptInput(PyAutoGuiInput):
+    # The original behaviour: one AutoHotkey process per click, running the configured script.
+    def click(self, script_path=None, check=False): subprocess.run([settings["AHK_PATH"], script_path], check=check, capture_output=True, text=True)
+
+class AhkInput(PyAutoGuiInput):
+    # One long-lived AutoHotkey process running input_driver.ahk, fed one command per line over stdin; it answers "ok"
+    # when the command is done. A driver that died is restarted once per command before giving up. A configured script
+    # other than the stock click script is handed to the driver with "run <path>" so a customised script still runs.
+    def __init__(self, ahk_path, script=INPUT_DRIVER_SCRIPT): self.cmd = [ahk_path, script]; self.proc = None; self._lock = threading.Lock()
+    def _send(self, command):
+        with self._lock:
+            for _ in range(2):
+                if self.proc is None or self.proc.poll() is not None:
+                    self.proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+                try: self.proc.stdin.write(command + "\n"); self.proc.stdin.flush(); reply = self.proc.stdout.readline().strip()
+                except OSError: reply = ""
+                if reply == "ok" or reply.startswith("fail"): return reply
+                self.proc.kill(); self.proc = None
+            raise RuntimeError(f"AutoHotkey input driver did not acknowledge '{command}'")
+    def start(self): self._send("ping")  # pay the interpreter startup before the first encounter, not during it
+    def click(self, script_path=None, check=False):
+        if not script_path or os.path.basename(script_path).lower() == STOCK_CLICK_SCRIPT: self._send("click"); return
+        reply = self._send(f"run {os.path.abspath(script_path)}")
+        if check and reply != "ok": raise RuntimeError(f"AutoHotkey script '{os.path.basename(script_path)}' {reply.replace('fail', 'exited with code', 1)}")
+    def close(self):
+        with self._lock:
+            if self.proc is None: return
+            try: self.proc.stdin.write("exit\n"); self.proc.stdin.close(); self.proc.wait(timeout=2)
+            except (OSError, subprocess.TimeoutExpired): self.proc.kill()
+            self.proc = None
+
+class RecordingInput:
+    # Drives nothing and keeps every call as (kind, time, ...). Used by the replay harness and for dry runs.
+    def __init__(self): self.events = []
+    def start(self): pass
+    def move(self, x, y, duration): self.events.append(("move", CLOCK.time(), x, y))
+    def click(self, script_path=None, check=False): self.events.append(("click", CLOCK.time(), os.path.basename(script_path or "")))
+    def close(self): pass
+
+def make_input_driver(name):
+    if name == "record": return RecordingInput()
+    if pyautogui is None: print(f"[WARNING] pyautogui is unavailable, input will only be recorded."); return RecordingInput()
+    if name == "ahk": return AhkInput(settings["AHK_PATH"])
+    if name == "ahk_script": return AhkScriptInput()
+    if name != "pyautogui": print(f"[WARNING] Unknown input backend '{name}', using pyautogui.")
+    return PyAutoGuiInput()
+
+INPUT = None
+
+def required_input_paths(settings_data):
+    # Setting keys that must point at existing files for the configured input backend.
+    # The "ahk" driver clicks by itself when a script is left empty, but runs (so needs) any script that is set.
+    backend = settings_data.get("input_backend", "ahk")
+    if backend == "ahk": return ["AHK_PATH"] + [key for key in ("AHK_SCRIPT", "AHK_RUNAWAY_SCRIPT") if settings_data.get(key)]
+    return {"ahk_script": ["AHK_PATH", "AHK_SCRIPT", "AHK_RUNAWAY_SCRIPT"]}.get(backend, [])
+
+def get_input():
+    global INPUT
+    if INPUT is None: INPUT = make_input_driver(settings.get("input_backend", "ahk"))
+    return INPUT
+
+def stop_input():
+    global INPUT
+    if INPUT: driver, INPUT = INPUT, None; driver.close()
 
 def move_mouse_humanlike(x, y, p_j=5, b_d=0.2, d_j=0.2):
-    pyautogui.moveTo(x+random.randint(-p_j,p_j), y+random.randint(-p_j,p_j), duration=b_d+random.uniform(0,d_j), tween=pyautogui.easeInOutQuad)
-    time.sleep(random.uniform(0.05, 0.12))
+    with TRACER.span("mouse_tween", "input"):
+        get_input().move(x+random.randint(-p_j,p_j), y+random.randint(-p_j,p_j), b_d+random.uniform(0,d_j))
+        CLOCK.sleep(random.uniform(0.05, 0.12))
+
+def input_click(script_path, check=False):
+    with TRACER.span("click", "input", backend=type(get_input()).__name__, script=os.path.basename(script_path or "")): get_input().click(script_path, check)
+
+def click_at(x, y, script_path, check=False):
+    # Move and click as one step: with several instances on one desktop the pair must not interleave with another's.
+    with INPUT_LOCK: move_mouse_humanlike(x, y); input_click(script_path, check)
 
 def ahk_run_away():
     try:
-        move_mouse_humanlike(settings["mouse_x"], settings["mouse_y"]); print(f"[ACTION] Running away via AHK script.")
-        subprocess.run([settings["AHK_PATH"], settings["AHK_RUNAWAY_SCRIPT"]], check=True, capture_output=True, text=True)
-    except Exception as e: print(f"[ERROR] Could not run Run Away AHK script: {e}")
+        print(f"[ACTION] Running away."); click_at(settings["mouse_x"], settings["mouse_y"], settings["AHK_RUNAWAY_SCRIPT"], check=True)
+    except Exception as e: print(f"[ERROR] Could not run away: {e}")
+
+def template_match(scene_img, template_path, scan_region=None, threshold=BUTTON_THRESHOLD, geometry=None):
+    # Best TM_CCOEFF_NORMED score of the template (at its learned scale) inside scan_region and the matched screen box.
+    search_area_img, offset_x, offset_y = scene_img, 0, 0
+    if scan_region: search_area_img = scene_img.crop(scan_region); offset_x, offset_y = scan_region[0], scan_region[1]
+    scene_cv = cv2.cvtColor(np.array(search_area_img), cv2.COLOR_RGB2GRAY)
+    max_val, (x, y), (th, tw) = SCALES.match(scene_cv, template_path, threshold, geometry); VISION["action"] = f"{os.path.basename(template_path)} {max_val:.3f}"
+    return max_val, (offset_x + x, offset_y + y, offset_x + x + tw, offset_y + y + th)
+
+def template_score(scene_img, template_path, scan_region=None, threshold=BUTTON_THRESHOLD):
+    # Score and the screen position of the match's centre.
+    max_val, (x1, y1, x2, y2) = template_match(scene_img, template_path, scan_region, threshold); return max_val, ((x1 + x2) // 2, (y1 + y2) // 2)
 
 def find_image_on_screen(scene_img, template_path, threshold=0.8, scan_region=None):
+    # Searches the tracked window around the template's last hit (see SearchWindows) rather than all of scan_region.
     try:
-        search_area_img, offset_x, offset_y = scene_img, 0, 0
-        if scan_region: search_area_img = scene_img.crop(scan_region); offset_x, offset_y = scan_region[0], scan_region[1]
-        scene_cv = cv2.cvtColor(np.array(search_area_img), cv2.COLOR_RGB2GRAY)
-        template_cv = cv2.cvtColor(np.array(Image.open(template_path).convert("RGB")), cv2.COLOR_RGB2GRAY)
-        res = cv2.matchTemplate(scene_cv, template_cv, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        scan_region = scan_region or (0, 0) + scene_img.size; hit = detector_hit(scene_img, detector_class(template_path), scan_region)
+        if hit:
+            score, box = hit; VISION["action"] = f"{os.path.basename(template_path)} detector {score:.3f}"
+            if box: print(f"[INFO] Detector found {os.path.basename(template_path)} with score {score:.3f}"); return (box[0] + box[2]) // 2, (box[1] + box[3]) // 2
+            return None
+        window = WINDOWS.region(template_path, scan_region)
+        max_val, box = template_match(scene_img, template_path, window, threshold, geometry=(scan_region[3] - scan_region[1], scan_region[2] - scan_region[0]))
+        WINDOWS.update(template_path, scan_region, box if max_val >= threshold else None)
         if max_val >= threshold:
-            print(f"[INFO] Image match for {os.path.basename(template_path)} with score {max_val:.3f}")
-            return offset_x + max_loc[0] + template_cv.shape[1] // 2, offset_y + max_loc[1] + template_cv.shape[0] // 2
+            print(f"[INFO] Image match for {os.path.basename(template_path)} with score {max_val:.3f}"); label_frame(scene_img, detector_class(template_path), box)
+            return (box[0] + box[2]) // 2, (box[1] + box[3]) // 2
     except Exception as e: print(f"[ERROR] Image detection failed: {e}")
     return None
 
+CALIBRATION_BUTTONS = {"ACE_DISC_PATH": ("ace_disc_x", "ace_disc_y"), "USE_IMAGE_PATH": ("use_disk_x", "use_disk_y"), "NO_BUTTON_IMAGE_PATH": ("no_button_x", "no_button_y")}
+
+def region_keys(prefix): return (f"{prefix}_topleft_x", f"{prefix}_topleft_y", f"{prefix}_bottomright_x", f"{prefix}_bottomright_y")
+
+def calibrate_regions(screen_image, settings_data):
+    # Locates the header and button templates anywhere on a full frame, at any scale, and returns (setting updates,
+    # report lines): a tight header region; the OCR and photo regions moved and scaled with the header since the last
+    # calibration ("header_anchor"); each found button's click point; and, once all three buttons have been seen (they
+    # appear on different screens, so over several runs), an action region around them.
+    gray = cv2.cvtColor(np.array(screen_image), cv2.COLOR_RGB2GRAY); half = cv2.resize(gray, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA); width, height = screen_image.size; m = int(settings_data.get("calibration_margin", 12))
+    updates, report, boxes = {}, [], dict(settings_data.get("calibrated_boxes") or {})
+    def pad(box): return (max(0, box[0] - m), max(0, box[1] - m), min(width, box[2] + m), min(height, box[3] + m))
+    def locate(key, threshold):
+        path = settings_data.get(key)
+        if not path or not os.path.exists(path): report.append(f"{key}: no template"); return None
+        scale = max(SCALES.scales, key=lambda s: SCALES.match_at(half, path, s / 2)[0])  # pick the scale at half resolution
+        score, (x, y), (h, w) = SCALES.match_at(gray, path, scale)
+        report.append(f"{os.path.basename(path)}: {'found' if score >= threshold else 'not found'} (score {score:.3f}) at {x}, {y}, {w}x{h}")
+        return (x, y, x + w, y + h) if score >= threshold else None
+    header = locate("ITEMS_HEADER_PATH", HEADER_THRESHOLD)
+    if header:
+        updates.update(zip(region_keys("header"), pad(header))); anchor = settings_data.get("header_anchor")
+        if anchor:
+            s = (header[2] - header[0]) / max(1, anchor[2] - anchor[0])
+            for prefix in ("ocr", "photo"):
+                x1, y1, x2, y2 = (settings_data[k] for k in region_keys(prefix))
+                moved = (round(header[0] + (x1 - anchor[0]) * s), round(header[1] + (y1 - anchor[1]) * s), round(header[0] + (x2 - anchor[0]) * s), round(header[1] + (y2 - anchor[1]) * s))
+                updates.update(zip(region_keys(prefix), moved))
+            report.append(f"OCR and photo regions moved with the header (scale {s:.2f}).")
+        else: report.append("OCR and photo regions kept; they will follow the header from now on.")
+        updates["header_anchor"] = list(header)
+    for key, (xk, yk) in CALIBRATION_BUTTONS.items():
+        box = locate(key, BUTTON_THRESHOLD)
+        if box: boxes[key] = list(box); updates[xk], updates[yk] = (box[0] + box[2]) // 2, (box[1] + box[3]) // 2
+    if all(k in boxes for k in CALIBRATION_BUTTONS):
+        union = (min(b[0] for b in boxes.values()), min(b[1] for b in boxes.values()), max(b[2] for b in boxes.values()), max(b[3] for b in boxes.values()))
+        updates.update(zip(region_keys("action_scan"), pad(union))); report.append(f"Action region set to {pad(union)}.")
+    else: report.append(f"Action region unchanged: run again while {', '.join(os.path.basename(settings_data.get(k) or k) for k in CALIBRATION_BUTTONS if k not in boxes)} is on screen.")
+    updates["calibrated_boxes"] = boxes
+    return updates, report
+
+def photo_crop_gray(scene_img): return cv2.cvtColor(np.array(scene_img.crop(get_region("photo"))), cv2.COLOR_RGB2GRAY)
+
+def photo_score(scene_cropped, template_path):
+    stats = TEMPLATES.ssim_stats(template_path, (scene_cropped.shape[1], scene_cropped.shape[0]))
+    with TRACER.span("ssim", "vision", template=os.path.basename(template_path)) as span: score = fast_ssim(stats, scene_cropped); span["score"] = round(score, 4)
+    VISION["photo"] = f"{os.path.basename(template_path)} {score:.3f}"; return score
+
 def compare_photos(scene_img, template_path):
-    photo_region = (settings['photo_topleft_x'], settings['photo_topleft_y'], settings['photo_bottomright_x'], settings['photo_bottomright_y'])
     try:
-        scene_gray = cv2.cvtColor(np.array(scene_img), cv2.COLOR_RGB2GRAY)
-        template_gray = cv2.cvtColor(np.array(Image.open(template_path).convert("RGB")), cv2.COLOR_RGB2GRAY)
-        scene_cropped = scene_gray[photo_region[1]:photo_region[3], photo_region[0]:photo_region[2]]
-        if scene_cropped.size > 0:
-            resized_template = cv2.resize(template_gray, (scene_cropped.shape[1], scene_cropped.shape[0]))
-            score = ssim(resized_template, scene_cropped)
-            return score
-        return 0
+        scene_cropped = photo_crop_gray(scene_img)
+        return photo_score(scene_cropped, template_path) if scene_cropped.size > 0 else 0
     except Exception as e: print(f"[ERROR] Photo comparison failed: {e}"); return 0
 
+def match_forms(scene_img, candidates, threshold):
+    # Coarse-to-fine: correlate downsampled copies of every candidate in one matrix product, then confirm only the
+    # top-k at full resolution (best first), stopping at the first one that clears the threshold.
+    try:
+        scene_cropped = photo_crop_gray(scene_img)
+        if scene_cropped.size == 0 or not candidates: return None, 0
+        size, side = (scene_cropped.shape[1], scene_cropped.shape[0]), int(settings.get("cascade_size", 48))
+        with TRACER.span("coarse_match", "vision", candidates=len(candidates)):
+            coarse = np.stack([TEMPLATES.coarse(path, size, side) for _, path in candidates]) @ coarse_vector(scene_cropped, side)
+            order = np.argsort(-coarse)[:max(1, int(settings.get("cascade_top_k", 3)))]
+        best = 0
+        for i in order:
+            photo_name, photo_path = candidates[i]; score = photo_score(scene_cropped, photo_path); best = max(best, score)
+            print(f"  - Checking '{photo_name}', Coarse: {coarse[i]:.3f}, Score: {score:.3f}")
+            if score >= threshold: return photo_name, score
+        return None, best
+    except Exception as e: print(f"[ERROR] Photo comparison failed: {e}"); return None, 0
+
 def handle_search_state(screen_image):
     if items_header_detected(screen_image):
-        print("[INFO] Encounter detected. Moving to analysis."); return BotState.ANALYZING, None
+        print("[INFO] Encounter detected. Moving to analysis."); TRACER.begin_encounter(); return BotState.ANALYZING, None
     return BotState.SEARCHING, None
 
+def identify_by_hash(scene_img, table):
+    # Shortlist (name, form) pairs by pHash distance over the whole library, then confirm the closest ones with SSIM.
+    try:
+        scene_cropped = photo_crop_gray(scene_img)
+        if scene_cropped.size == 0: return None
+        with TRACER.span("phash_lookup", "vision") as span: shortlist = table.index.lookup(phash(scene_cropped), int(settings.get("phash_max_distance", 10)), int(settings.get("phash_shortlist", 5))); span["candidates"] = len(shortlist)
+        for (name, form, path), distance in shortlist:
+            score = photo_score(scene_cropped, path); print(f"  - Hash candidate '{name}' / '{form}', Distance: {distance}, Score: {score:.3f}")
+            if score >= settings["photo_match_threshold"]: return name, form
+    except Exception as e: print(f"[ERROR] Hash identification failed: {e}")
+    return None
+
+def act_on_form(table, matched_name, photo_name):
+    print(f"[SUCCESS] Matched form '{photo_name}' for '{matched_name}'.")
+    send_webhook_with_image_pil(f"Found '{matched_name}' (Form: {photo_name})!", grab_screen())
+    action = table.action(photo_name)
+    if action: return action, None
+    print("[WARNING] Rare form not in any list. Defaulting to run away."); return BotState.ACTION_RUN, None
+
 def handle_analyzing_state(screen_image):
-    name = ocr_text(screen_image)
+    table = DECISIONS  # one table for the whole encounter, even if a reload swaps it meanwhile
+    ocr_future = ocr_text_async(screen_image)  # runs on an OCR worker while the photo hash lookup happens here
+    hit = identify_by_hash(screen_image, table)
+    if hit: ocr_future.cancel(); print(f"[SUCCESS] Rare Loomian '{hit[0]}' identified from its photo."); label_frame(screen_image, SPRITE_CLASS, get_region("photo"), name=hit[0], form=hit[1]); return act_on_form(table, *hit)
+    name = VISION["ocr"] = ocr_result(ocr_future)
     print(f"[SCAN] OCR Result: '{name}'")
     if not name: return BotState.SEARCHING, None
-    matched_name = next((n for n in RARE_NAMES if n.lower() == name.lower()), None)
+    matched_name = table.match_name(name)
     if not matched_name: print(f"[INFO] Common Loomian '{name}' found."); return BotState.ACTION_RUN, None
     print(f"[SUCCESS] Rare Loomian '{matched_name}' found! Checking forms...")
-    timeout = time.time() + 10
-    while time.time() < timeout:
-        if not scan_active or exit_program.is_set(): return BotState.SEARCHING, None
-        current_frame = ImageGrab.grab()
-        for photo_name, photo_path in RARE_PHOTOS.get(matched_name, {}).items():
-            score = compare_photos(current_frame, photo_path)
-            print(f"  - Checking '{photo_name}', Score: {score:.3f}")
-            if score >= settings["photo_match_threshold"]:
-                print(f"[SUCCESS] Matched form '{photo_name}' for '{matched_name}'.")
-                send_webhook_with_image_pil(f"Found '{matched_name}' (Form: {photo_name})!", current_frame)
-                special_forms = {f.lower() for f in settings.get("special_capture_forms", [])}
-                run_away_forms = {f.lower() for f in settings.get("run_away_forms", [])}
-                if photo_name.lower() in special_forms: return BotState.ACTION_CAPTURE, None
-                elif photo_name.lower() in run_away_forms: return BotState.ACTION_RUN, None
-                else: print("[WARNING] Rare form not in any list. Defaulting to run away."); return BotState.ACTION_RUN, None
-        time.sleep(0.5)
+    candidates = table.candidates(matched_name)
+    def form_on(frame):
+        form = match_forms(frame, candidates, settings["photo_match_threshold"])[0]
+        if form: label_frame(frame, SPRITE_CLASS, get_region("photo"), ocr=name, name=matched_name, form=form)
+        return form
+    photo_name = poll_until("photo", form_on, 10, 0.5, abort=lambda: not scan_active)
+    if photo_name: return act_on_form(table, matched_name, photo_name)
+    if not scan_active or exit_program.is_set(): return BotState.SEARCHING, None
     print(f"[WARNING] Timeout: No matching form found for '{matched_name}'.")
-    send_webhook_with_image_pil(f"Found rare Loomian '{matched_name}' but form is unknown!", screen_image)
+    send_webhook_with_image_pil(f"Found rare Loomian '{matched_name}' but form is unknown!", grab_screen())
     return BotState.ACTION_RUN, None
 
 def handle_capture_state():
     print("[ACTION] Initiating capture sequence.")
-    action_scan_region = (settings["action_scan_topleft_x"], settings["action_scan_topleft_y"], settings["action_scan_bottomright_x"], settings["action_scan_bottomright_y"])
-    move_mouse_humanlike(settings['capture_x'], settings['capture_y']); subprocess.run([settings["AHK_PATH"], settings["AHK_SCRIPT"]], capture_output=True, text=True)
-    timeout = time.time() + 10
-    while time.time() < timeout and not exit_program.is_set():
-        if find_image_on_screen(ImageGrab.grab(), settings["ACE_DISC_PATH"], 0.8, scan_region=action_scan_region):
-            move_mouse_humanlike(settings['ace_disc_x'], settings['ace_disc_y']); subprocess.run([settings["AHK_PATH"], settings["AHK_SCRIPT"]], capture_output=True, text=True); break
-        time.sleep(0.5)
-    else: print("[ERROR] Capture failed: Ace Disc not found in specified area."); return BotState.COOLDOWN, 5
-    timeout = time.time() + 10
-    while time.time() < timeout and not exit_program.is_set():
-        if find_image_on_screen(ImageGrab.grab(), settings["USE_IMAGE_PATH"], 0.8, scan_region=action_scan_region):
-            move_mouse_humanlike(settings['use_disk_x'], settings['use_disk_y']); subprocess.run([settings["AHK_PATH"], settings["AHK_SCRIPT"]], capture_output=True, text=True); break
-        time.sleep(0.2)
-    else: print("[ERROR] Capture failed: Use Button not found in specified area."); return BotState.COOLDOWN, 5
-    print("[ACTION] Waiting for capture result..."); capture_success = False; timeout = time.time() + 25
-    while time.time() < timeout and not exit_program.is_set():
-        if find_image_on_screen(ImageGrab.grab(), settings["NO_BUTTON_IMAGE_PATH"], 0.8, scan_region=action_scan_region):
-            move_mouse_humanlike(settings['no_button_x'], settings['no_button_y']); subprocess.run([settings["AHK_PATH"], settings["AHK_SCRIPT"]], capture_output=True, text=True)
-            print("[SUCCESS] Loomian captured successfully!"); send_webhook_with_image_pil("Loomian was captured successfully.", ImageGrab.grab()); capture_success = True; break
-        time.sleep(0.5)
-    if not capture_success: print("[ERROR] Capture Failed: Loomian broke free or timeout occurred."); send_webhook_with_image_pil("Capture Failed: Loomian broke free or timeout.", ImageGrab.grab())
+    action_scan_region = get_region("action_scan")
+    click_at(settings['capture_x'], settings['capture_y'], settings["AHK_SCRIPT"])
+    def button(path): return lambda frame: find_image_on_screen(frame, path, BUTTON_THRESHOLD, scan_region=action_scan_region)
+    if not poll_until("action", button(settings["ACE_DISC_PATH"]), 10, 0.5): print("[ERROR] Capture failed: Ace Disc not found in specified area."); return BotState.COOLDOWN, 5
+    click_at(settings['ace_disc_x'], settings['ace_disc_y'], settings["AHK_SCRIPT"])
+    if not poll_until("action", button(settings["USE_IMAGE_PATH"]), 10, 0.2): print("[ERROR] Capture failed: Use Button not found in specified area."); return BotState.COOLDOWN, 5
+    click_at(settings['use_disk_x'], settings['use_disk_y'], settings["AHK_SCRIPT"])
+    print("[ACTION] Waiting for capture result...")
+    if poll_until("action", button(settings["NO_BUTTON_IMAGE_PATH"]), 25, 0.5):
+        click_at(settings['no_button_x'], settings['no_button_y'], settings["AHK_SCRIPT"])
+        print("[SUCCESS] Loomian captured successfully!"); send_webhook_with_image_pil("Loomian was captured successfully.", grab_screen())
+    else: print("[ERROR] Capture Failed: Loomian broke free or timeout occurred."); send_webhook_with_image_pil("Capture Failed: Loomian broke free or timeout.", grab_screen())
     return BotState.COOLDOWN, 5
 
 def scan_loop():
+    # While searching, header frames that did not change since the last checked one skip template matching, and the
+    # poll interval backs off while the screen is idle. Any other state polls at the fast rate.
     global scan_active; state = BotState.SEARCHING; cooldown_end_time = 0
+    detector, poller = make_change_detector(), make_poller(); header_box = get_region("header"); start_frame_pipeline(); start_decision_reloader()
     while not exit_program.is_set():
-        if not scan_active: time.sleep(0.1); continue
+        if not scan_active: CLOCK.sleep(0.1); continue
         if state == BotState.COOLDOWN:
-            if time.time() >= cooldown_end_time: state = BotState.SEARCHING
-            else: time.sleep(0.2); continue
+            if CLOCK.time() >= cooldown_end_time: state = BotState.SEARCHING
+            else: CLOCK.sleep(0.2); continue
         try:
-            screen_image = ImageGrab.grab(); next_state, cooldown_seconds = None, None
-            if state == BotState.SEARCHING: next_state, _ = handle_search_state(screen_image)
-            elif state == BotState.ANALYZING: next_state, _ = handle_analyzing_state(screen_image)
-            elif state == BotState.ACTION_RUN: ahk_run_away(); next_state, cooldown_seconds = BotState.COOLDOWN, 3
-            elif state == BotState.ACTION_CAPTURE: next_state, cooldown_seconds = handle_capture_state()
+            next_state, cooldown_seconds, delay = None, None, poller.min_interval; TRACER.next_tick()
+            with TRACER.span("tick", "tick", state=state.name) as span:
+                if state == BotState.SEARCHING:
+                    frame = grab_regions("header"); changed = span["changed"] = detector.changed("header", frame, header_box); delay = poller.next(changed)
+                    if changed: next_state, _ = handle_search_state(frame)
+                elif state == BotState.ANALYZING: next_state, _ = handle_analyzing_state(grab_regions("ocr", "photo"))
+                elif state == BotState.ACTION_RUN: ahk_run_away(); next_state, cooldown_seconds = BotState.COOLDOWN, 3
+                elif state == BotState.ACTION_CAPTURE: next_state, cooldown_seconds = handle_capture_state()
+            if state in (BotState.ANALYZING, BotState.ACTION_RUN, BotState.ACTION_CAPTURE) and next_state in (BotState.SEARCHING, BotState.COOLDOWN): TRACER.end_encounter(state.name); BOT_STATUS["decisions"][state.name] += 1
+            if next_state and next_state != state and next_state != BotState.SEARCHING: detector.reset(); poller.reset()  # re-check the header after every encounter
             if next_state: state = next_state
-            if cooldown_seconds: cooldown_end_time = time.time() + cooldown_seconds
-        except Exception as e: print(f"[FATAL_ERROR] Unhandled exception in scan_loop: {e}"); state = BotState.COOLDOWN; cooldown_end_time = time.time() + 5
-        time.sleep(0.2)
+            BOT_STATUS.update(state=state.name, encounters=TRACER.encounter)
+            if cooldown_seconds: cooldown_end_time = CLOCK.time() + cooldown_seconds
+        except Exception as e: print(f"[FATAL_ERROR] Unhandled exception in scan_loop: {e}"); state = BotState.COOLDOWN; cooldown_end_time = CLOCK.time() + 5; delay = 0.2; detector.reset()
+        CLOCK.sleep(delay)
+    stop_frame_pipeline(); stop_decision_reloader()
 
 def keybind_listener(app_instance):
     global scan_active
@@ -352,6 +1798,211 @@ def keybind_listener(app_instance):
     except Exception as e:
         print(f"[ERROR] Could not register hotkey. It may be in use. Error: {e}")
 
+# --- Multi-Instance Supervisor ---
+def parse_instances(lines):
+    # "name dx dy" per line: the game window's offset from the window the regions and click points were set up on.
+    instances = []
+    for line in lines:
+        try: *name, dx, dy = line.split(); offset = (int(dx), int(dy))
+        except ValueError: raise ValueError(f"Game Instances line '{line}' is not 'name dx dy' with whole-number offsets.") from None
+        instances.append({"name": " ".join(name) or f"instance {len(instances) + 1}", "offset": offset})
+    return instances
+
+def apply_instance(settings_data, instance):
+    # Shifts every screen coordinate by the instance's window offset; recordings go to a per-instance folder.
+    dx, dy = instance["offset"]
+    for key, value in settings_data.items():
+        if isinstance(value, int) and not isinstance(value, bool) and key.endswith(("_x", "_y")): settings_data[key] = value + (dx if key.endswith("_x") else dy)
+    settings_data["record_dir"] = os.path.join(settings_data.get("record_dir") or DEFAULTS["record_dir"], instance["name"].replace(" ", "_"))
+
+class InstanceLogWriter:
+    def __init__(self, events, index): self.events = events; self.index = index
+    def write(self, msg):
+        if msg.strip(): self.events.put(("log", self.index, msg.strip()))
+    def flush(self): pass
+
+def instance_worker(index, instance, app_data_file, input_lock, events, run_event, stop_event):
+    # Entry point of one supervised, headless bot process bound to one game window (see InstanceSupervisor).
+    global APP_DATA_FILE, INPUT_LOCK, scan_active
+    sys.stdout = InstanceLogWriter(events, index); APP_DATA_FILE = app_data_file; INPUT_LOCK = input_lock
+    try:
+        load_bot_data_from_gui_file(instance); pytesseract.pytesseract.tesseract_cmd = settings.get("TESSERACT_PATH")
+        scanner = threading.Thread(target=scan_loop, name="scan_loop", daemon=True); scanner.start()
+        while scanner.is_alive() and not stop_event.is_set():
+            scan_active = run_event.is_set()
+            events.put(("status", index, dict(BOT_STATUS, decisions=dict(BOT_STATUS["decisions"]), pid=os.getpid(), active=scan_active)))
+            stop_event.wait(0.5)
+        exit_program.set(); scanner.join(timeout=5)
+    except Exception as e: print(f"[FATAL_ERROR] Instance '{instance['name']}' failed: {e}")
+    finally: stop_recorder(); stop_dataset(); stop_webhooks(); stop_input(); events.put(("exit", index, None))
+
+class InstanceSupervisor:
+    # Runs one headless bot process per configured game window, serialises their mouse input with one lock, and collects
+    # their logs and status. The workers only map the template pack this process has just refreshed (never writing or
+    # pruning one themselves), so they share its pages.
+    def __init__(self, instances, app_data_file):
+        ctx = multiprocessing.get_context("spawn"); self.instances = instances; self.started = time.time()
+        self.events = ctx.Queue(); self.input_lock = ctx.Lock(); self.run_event = ctx.Event(); self.stop_event = ctx.Event()
+        self.status = [{"state": "STARTING"} for _ in instances]
+        self.processes = [ctx.Process(target=instance_worker, name=f"bot-{inst['name']}", daemon=True,
+                                      args=(i, inst, app_data_file, self.input_lock, self.events, self.run_event, self.stop_event)) for i, inst in enumerate(instances)]
+        for p in self.processes: p.start()
+    def set_active(self, active): self.run_event.set() if active else self.run_event.clear()
+    def poll(self):
+        # Drains worker events; returns their log lines tagged with the instance name.
+        logs = []
+        while True:
+            try: kind, index, payload = self.events.get_nowait()
+            except queue.Empty: break
+            if kind == "log": logs.append(f"{payload}  [{self.instances[index]['name']}]")
+            elif kind == "status": self.status[index] = payload
+            elif kind == "exit": self.status[index] = dict(self.status[index], state="EXITED")
+        return logs
+    def rows(self):
+        hours = max(time.time() - self.started, 1) / 3600
+        for inst, p, st in zip(self.instances, self.processes, self.status):
+            decisions = st.get("decisions", {}); state = st.get("state", "") if p.is_alive() else f"EXITED ({p.exitcode})"
+            yield (inst["name"], "%d, %d" % inst["offset"], p.pid or "", state if st.get("active", True) else f"{state} (paused)", st.get("encounters", 0),
+                   f"{st.get('encounters', 0) / hours:.0f}", decisions.get("ACTION_CAPTURE", 0), decisions.get("ACTION_RUN", 0))
+    def stop(self, timeout=10):
+        self.stop_event.set(); deadline = time.time() + timeout
+        for p in self.processes: p.join(max(0, deadline - time.time()))
+        for p in self.processes:
+            if p.is_alive(): p.terminate()
+        return self.poll()
+
+# --- Logging ---
+LOG_TAGS = {"FATAL_ERROR": logging.CRITICAL, "ERROR": logging.ERROR, "WARNING": logging.WARNING, "SUCCESS": logging.INFO, "ACTION": logging.INFO,
+            "STATUS": logging.INFO, "INFO": logging.INFO, "SCAN": logging.DEBUG}
+
+def make_log_record(line):
+    # "[TAG] message" lines become logging records carrying the tag; untagged detail lines ("  - Checking ...") are DEBUG.
+    tag = next((t for t in LOG_TAGS if line.startswith(f"[{t}]") or line.startswith(f"============== [{t}]")), "")
+    record = logging.makeLogRecord({"name": "bot", "msg": line, "levelno": LOG_TAGS.get(tag, logging.DEBUG), "levelname": logging.getLevelName(LOG_TAGS.get(tag, logging.DEBUG))})
+    record.tag = tag; return record
+
+def gzip_rotator(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out: shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+class LogPipeline:
+    # Bot output as logging records: the GUI drains a bounded backlog in batches, and a QueueListener thread writes every
+    # record to bot.log, rotated at max_bytes into gzip-compressed backups. Both queues are bounded; what overflows is
+    # dropped and counted, so a stalled GUI or disk never grows memory.
+    def __init__(self, log_dir, max_bytes, backups, backlog=5000):
+        os.makedirs(log_dir, exist_ok=True); self.path = os.path.join(log_dir, "bot.log"); self.dropped = collections.Counter()
+        handler = logging.handlers.RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.namer = lambda name: name + ".gz"; handler.rotator = gzip_rotator
+        handler.setFormatter(logging.Formatter("%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s", "%Y-%m-%d %H:%M:%S"))
+        self.pending = collections.deque(maxlen=backlog); self.file_queue = queue.Queue(maxsize=20000)
+        self.listener = logging.handlers.QueueListener(self.file_queue, handler); self.listener.start()
+    def emit(self, line):
+        record = make_log_record(line)
+        if len(self.pending) == self.pending.maxlen: self.dropped["view"] += 1
+        self.pending.append(record)
+        try: self.file_queue.put_nowait(record)
+        except queue.Full: self.dropped["file"] += 1
+    def drain(self, limit):
+        records = []
+        while self.pending and len(records) < limit: records.append(self.pending.popleft())
+        return records
+    def close(self):
+        self.listener.stop()
+        for handler in self.listener.handlers: handler.close()
+
+class LogWriter:
+    # sys.stdout replacement feeding print() output into a LogPipeline, one record per non-empty line.
+    def __init__(self, pipeline): self.pipeline = pipeline
+    def write(self, msg):
+        for line in msg.splitlines():
+            if line.strip(): self.pipeline.emit(line.strip())
+    def flush(self): pass
+
+# --- Live Vision ---
+class LiveVisionRenderer:
+    # Renders the scan regions with the latest VISION values into one reduced-size panel image at a low frame rate, on
+    # its own thread and with its own grabs (not recorded or traced), so neither the scan thread nor Tk does the work.
+    # It idles while `active` is clear, which the live-vision tab does whenever it is not on screen.
+    def __init__(self, fps=4, scale=0.5):
+        self.interval = 1 / max(0.5, fps); self.scale = scale; self.active = threading.Event(); self._stop = threading.Event(); self.latest = (0, None)
+        self.thread = threading.Thread(target=self._run, name="live_vision", daemon=True); self.thread.start()
+    def _run(self):
+        seq = 0
+        while not self._stop.is_set():
+            if not self.active.wait(0.5): continue
+            start = time.perf_counter()
+            try: seq += 1; self.latest = (seq, self.render())
+            except Exception as e: print(f"[WARNING] Live vision could not render: {e}"); self._stop.wait(2)
+            self._stop.wait(max(0, self.interval - (time.perf_counter() - start)))
+    def render(self):
+        boxes = {name: get_region(prefix) for name, prefix in CAPTURE_REGIONS.items()}; backend = get_capture().backend
+        if hasattr(backend, "grab_frame"): frame = backend.grab_frame()
+        else:
+            union = (min(b[0] for b in boxes.values()), min(b[1] for b in boxes.values()), max(b[2] for b in boxes.values()), max(b[3] for b in boxes.values()))
+            frame = CapturedFrame([(union, backend.grab(union))])
+        tiles = []
+        for name, box in boxes.items():
+            try: img = frame.crop(box)
+            except ValueError: img = Image.new("RGB", (160, 90), (48, 48, 48))  # e.g. a recording of other regions
+            img = img.resize((max(1, round(img.width * self.scale)), max(1, round(img.height * self.scale))), Image.BILINEAR); img.thumbnail((480, 320))
+            tiles.append((f"{name}: {VISION.get(name, '-')}", img))
+        caption = 16; cell_w = max(220, max(img.width for _, img in tiles)); cell_h = max(img.height for _, img in tiles) + caption
+        panel = Image.new("RGB", (cell_w * 2, cell_h * 2 + caption), (24, 24, 24)); draw = ImageDraw.Draw(panel)
+        draw.text((4, 2), f"State: {BOT_STATUS['state']}   Encounters: {BOT_STATUS['encounters']}", fill=(255, 255, 255))
+        for i, (label, img) in enumerate(tiles):
+            x, y = (i % 2) * cell_w, (i // 2) * cell_h + caption
+            draw.text((x + 4, y + 2), label, fill=(120, 220, 255)); panel.paste(img, (x, y + caption))
+        return panel
+    def stop(self): self._stop.set(); self.active.set(); self.thread.join(timeout=2)
+
+LIVE_VISION = None
+
+def start_live_vision():
+    global LIVE_VISION; stop_live_vision()
+    if settings.get("show_live_vision", True): LIVE_VISION = LiveVisionRenderer(float(settings.get("live_vision_fps", 4)), float(settings.get("live_vision_scale", 0.5)))
+    return LIVE_VISION
+
+def stop_live_vision():
+    global LIVE_VISION
+    if LIVE_VISION: renderer, LIVE_VISION = LIVE_VISION, None; renderer.stop()
+
+# --- Diagnostics ---
+BUTTON_TEMPLATES = [("Ace Disc", "ACE_DISC_PATH"), ("Use Button", "USE_IMAGE_PATH"), ("No Button", "NO_BUTTON_IMAGE_PATH")]
+DIAGNOSTICS = None
+
+def get_diagnostics():
+    # Worker pool for the GUI's test buttons, so screen grabs, OCR and matching never run on the Tk thread.
+    global DIAGNOSTICS
+    if DIAGNOSTICS is None: DIAGNOSTICS = ThreadPoolExecutor(max_workers=4, thread_name_prefix="diagnostics")
+    return DIAGNOSTICS
+
+def diagnostic_checks(screen_image, rare_photos):
+    # Every check the bot makes on a frame, as (check, target, threshold, fn); fn returns (shown value, passed).
+    photo_threshold = float(settings.get("photo_match_threshold", 0.85)); action_region = get_region("action_scan")
+    def header(): score = header_score(screen_image); return f"{score:.3f}", score > HEADER_THRESHOLD
+    def ocr():
+        text = get_ocr().submit(ocr_threshold(screen_image)).result(); rare = any(n.lower() == text.lower() for n in rare_photos)
+        return f"'{text}'" + (" (rare)" if rare else ""), bool(text)
+    def button(path): score = template_score(screen_image, path, action_region)[0]; return f"{score:.3f}", score >= BUTTON_THRESHOLD
+    def photo(path): score = compare_photos(screen_image, path); return f"{score:.3f}", score >= photo_threshold
+    checks = [("Header", os.path.basename(settings["ITEMS_HEADER_PATH"]), HEADER_THRESHOLD, header), ("OCR", "nameplate", "", ocr)]
+    checks += [("Button", label, BUTTON_THRESHOLD, lambda p=settings[key]: button(p)) for label, key in BUTTON_TEMPLATES if settings.get(key)]
+    if get_detector():
+        def detector(): found = get_detector().detect(screen_image, [get_region(CAPTURE_REGIONS[n]) for n in DETECTOR_REGIONS]); return ", ".join(f"{cls} {score:.2f}" for cls, score, _ in found) or "nothing", bool(found)
+        checks.append(("Detector", os.path.basename(get_detector().path), get_detector().conf, detector))
+    checks += [("Photo", f"{name} / {form}", photo_threshold, lambda p=path: photo(p)) for name, photos in rare_photos.items() for form, path in photos.items() if path]
+    return checks
+
+def run_check(fn):
+    start = time.perf_counter()
+    try: value, passed = fn()
+    except Exception as e: value, passed = f"error: {e}", False
+    return value, passed, (time.perf_counter() - start) * 1000
+
+def submit_diagnostics(screen_image, rare_photos):
+    # Runs every check on one frame in parallel; returns [(check, target, threshold, Future of (value, passed, ms))].
+    pool = get_diagnostics(); return [(check, target, threshold, pool.submit(run_check, fn)) for check, target, threshold, fn in diagnostic_checks(screen_image, rare_photos)]
+
 # ===================================================================================
 # SECTION 3: TKINTER GUI CLASSES
 # ===================================================================================
@@ -366,6 +2017,7 @@ class SettingsTab(bstrap.Frame):
         left_col = bstrap.Frame(self.scrollable_frame); left_col.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
         right_col = bstrap.Frame(self.scrollable_frame); right_col.grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
         bstrap.Button(left_col, text="▶️ Launch Visual Setup Wizard", command=self.run_setup_wizard, bootstyle="success").pack(fill='x', padx=10, pady=10)
+        self.calibrate_button = bstrap.Button(left_col, text="Auto-Calibrate Regions", command=self.auto_calibrate, bootstyle="success-outline"); self.calibrate_button.pack(fill='x', padx=10, pady=(0, 10))
         locations_lf = bstrap.LabelFrame(left_col, text="Mouse Click Locations", padding=10); locations_lf.pack(fill="x", padx=10, pady=10); locations_lf.columnconfigure(1, weight=1)
         click_coords = [("Run Away Click:", "mouse_x", "mouse_y"), ("Items Button Click:", "capture_x", "capture_y"), ("Disk Item Click:", "ace_disc_x", "ace_disc_y"), ("Use Disk Click:", "use_disk_x", "use_disk_y"), ("'No' Nickname Click:", "no_button_x", "no_button_y")]
         for i, (label, xk, yk) in enumerate(click_coords):
@@ -395,25 +2047,42 @@ class SettingsTab(bstrap.Frame):
         test_buttons_frame = bstrap.Frame(left_col); test_buttons_frame.pack(fill='x', padx=10, pady=(0, 10)); test_buttons_frame.columnconfigure((0,1), weight=1)
         bstrap.Button(test_buttons_frame, text="Test Header Detection", command=self.test_header_detection, bootstyle="info-outline").grid(row=0, column=0, sticky='ew', padx=(0,5))
         bstrap.Button(test_buttons_frame, text="Test OCR", command=self.test_ocr, bootstyle="info-outline").grid(row=0, column=1, sticky='ew', padx=(5,0))
+        self.diagnose_button = bstrap.Button(test_buttons_frame, text="Diagnose All (one frame)", command=self.diagnose_all, bootstyle="info"); self.diagnose_button.grid(row=1, column=0, columnspan=2, sticky='ew', pady=(5,0))
         paths_lf = bstrap.LabelFrame(right_col, text="Paths & Scripts", padding=10); paths_lf.pack(fill="x", padx=10, pady=10); paths_content = bstrap.Frame(paths_lf); paths_content.pack(fill="x", padx=10, pady=5); paths_content.columnconfigure(1, weight=1)
         script_paths = [("AHK Path", "AHK_PATH", [("Executable", "*.exe")]), ("AHK Capture Script", "AHK_SCRIPT", [("AHK Script", "*.ahk")]), ("AHK Run Away Script", "AHK_RUNAWAY_SCRIPT", [("AHK Script", "*.ahk")])]
         for i, (label, key, ftypes) in enumerate(script_paths):
             bstrap.Label(paths_content, text=label).grid(row=i, column=0, sticky="w", padx=(0,10), pady=4); entry = bstrap.Entry(paths_content); entry.grid(row=i, column=1, sticky="ew"); entry.insert(0, self.settings.get(key, "")); btn = bstrap.Button(paths_content, text="Browse...", command=lambda e=entry, t=label, ft=ftypes: self.browse_path(e, title=t, filetypes=ft), bootstyle="secondary-outline"); btn.grid(row=i, column=2, sticky="ew", padx=(5,0)); self.entries[key] = entry
         bstrap.Button(paths_content, text="Test Run Away Script", command=self.test_run_away, bootstyle="info-outline").grid(row=len(script_paths), column=1, columnspan=2, sticky='ew', pady=5)
+        bstrap.Label(paths_content, text=f"With the 'ahk' input backend an empty script or {STOCK_CLICK_SCRIPT} uses the built-in driver click; any other script is run through the driver.", bootstyle="secondary", wraplength=420).grid(row=len(script_paths)+1, column=0, columnspan=3, sticky="w", pady=(0,4))
         config_lf = bstrap.LabelFrame(right_col, text="Configuration", padding=10); config_lf.pack(fill="x", padx=10, pady=10); config_content = bstrap.Frame(config_lf); config_content.pack(fill="x", padx=10, pady=5); config_content.columnconfigure(1, weight=1)
         bstrap.Label(config_content, text="Pause Hotkey").grid(row=0, column=0, sticky="w", padx=(0,10), pady=4)
         self.hotkey_var = tk.StringVar(value=self.settings.get("pause_hotkey", "F9")); self.hotkey_button = bstrap.Button(config_content, textvariable=self.hotkey_var, command=self.record_hotkey, bootstyle="secondary"); self.hotkey_button.grid(row=0, column=1, sticky="w"); self.entries["pause_hotkey"] = self.hotkey_var
         bstrap.Label(config_content, text="Match Threshold (0-1)").grid(row=1, column=0, sticky="w", padx=(0,10), pady=4); thresh_entry = bstrap.Entry(config_content); thresh_entry.grid(row=1, column=1, sticky="w"); thresh_entry.insert(0, str(self.settings.get("photo_match_threshold", 0.85))); self.entries["photo_match_threshold"] = thresh_entry
+        bstrap.Label(config_content, text="Capture Backend").grid(row=2, column=0, sticky="w", padx=(0,10), pady=4); self.capture_backend_var = tk.StringVar(value=self.settings.get("capture_backend", "pil")); ttk.Combobox(config_content, textvariable=self.capture_backend_var, values=CAPTURE_BACKENDS, state="readonly", width=10).grid(row=2, column=1, sticky="w"); self.entries["capture_backend"] = self.capture_backend_var
+        bstrap.Label(config_content, text="Capture Mode").grid(row=3, column=0, sticky="w", padx=(0,10), pady=4); self.capture_mode_var = tk.StringVar(value=self.settings.get("capture_mode", "union")); ttk.Combobox(config_content, textvariable=self.capture_mode_var, values=["union", "regions"], state="readonly", width=10).grid(row=3, column=1, sticky="w"); self.entries["capture_mode"] = self.capture_mode_var
+        bstrap.Label(config_content, text="Replay Frames Path").grid(row=4, column=0, sticky="w", padx=(0,10), pady=4); replay_entry = bstrap.Entry(config_content); replay_entry.grid(row=4, column=1, sticky="ew"); replay_entry.insert(0, self.settings.get("capture_replay_path", "")); self.entries["capture_replay_path"] = replay_entry
+        self.record_frames_var = tk.BooleanVar(value=self.settings.get("record_frames", False)); bstrap.Checkbutton(config_content, text="Record frames while running", variable=self.record_frames_var).grid(row=5, column=0, columnspan=2, sticky="w", pady=4); self.entries["record_frames"] = self.record_frames_var
+        self.record_roi_var = tk.BooleanVar(value=self.settings.get("record_roi_only", True)); bstrap.Checkbutton(config_content, text="Record scan regions only", variable=self.record_roi_var).grid(row=6, column=0, columnspan=2, sticky="w", pady=4); self.entries["record_roi_only"] = self.record_roi_var
+        self.capture_thread_var = tk.BooleanVar(value=self.settings.get("capture_thread", True)); bstrap.Checkbutton(config_content, text="Capture on a background thread", variable=self.capture_thread_var).grid(row=7, column=0, columnspan=2, sticky="w", pady=4); self.entries["capture_thread"] = self.capture_thread_var
+        bstrap.Label(config_content, text="Input Backend").grid(row=8, column=0, sticky="w", padx=(0,10), pady=4); self.input_backend_var = tk.StringVar(value=self.settings.get("input_backend", "ahk")); ttk.Combobox(config_content, textvariable=self.input_backend_var, values=INPUT_BACKENDS, state="readonly", width=10).grid(row=8, column=1, sticky="w"); self.entries["input_backend"] = self.input_backend_var
+        self.live_vision_var = tk.BooleanVar(value=self.settings.get("show_live_vision", True)); bstrap.Checkbutton(config_content, text="Show live vision while running", variable=self.live_vision_var).grid(row=9, column=0, columnspan=2, sticky="w", pady=4); self.entries["show_live_vision"] = self.live_vision_var
+        bstrap.Label(config_content, text="Detector Backend").grid(row=10, column=0, sticky="w", padx=(0,10), pady=4); self.detector_backend_var = tk.StringVar(value=self.settings.get("detector_backend", "template")); ttk.Combobox(config_content, textvariable=self.detector_backend_var, values=DETECTOR_BACKENDS, state="readonly", width=10).grid(row=10, column=1, sticky="w"); self.entries["detector_backend"] = self.detector_backend_var
+        self.record_dataset_var = tk.BooleanVar(value=self.settings.get("record_dataset", False)); bstrap.Checkbutton(config_content, text="Record YOLO training data", variable=self.record_dataset_var).grid(row=11, column=0, columnspan=2, sticky="w", pady=4); self.entries["record_dataset"] = self.record_dataset_var
         webhook_lf = bstrap.LabelFrame(right_col, text="Webhook URLs", padding=10); webhook_lf.pack(fill="x", padx=10, pady=10); webhook_text = ScrolledText(webhook_lf, height=3, wrap="none", autohide=True); webhook_text.pack(fill="both", expand=True, padx=5, pady=5); urls = self.settings.get("WEBHOOK_URLS", []); webhook_text.insert("1.0", "\n".join(urls) if urls else ""); self.entries["WEBHOOK_URLS"] = webhook_text
+        attach_row = bstrap.Frame(webhook_lf); attach_row.pack(fill="x", padx=5, pady=(0,5))
+        bstrap.Label(attach_row, text="Attach").pack(side="left", padx=(0,5)); self.webhook_region_var = tk.StringVar(value=self.settings.get("webhook_region", "screen")); ttk.Combobox(attach_row, textvariable=self.webhook_region_var, values=["screen"] + list(CAPTURE_REGIONS), state="readonly", width=8).pack(side="left"); self.entries["webhook_region"] = self.webhook_region_var
+        self.webhook_format_var = tk.StringVar(value=self.settings.get("webhook_format", "png")); ttk.Combobox(attach_row, textvariable=self.webhook_format_var, values=["png", "jpeg"], state="readonly", width=6).pack(side="left", padx=5); self.entries["webhook_format"] = self.webhook_format_var
+        bstrap.Label(attach_row, text="Scale").pack(side="left", padx=(5,5)); scale_entry = bstrap.Entry(attach_row, width=5); scale_entry.pack(side="left"); scale_entry.insert(0, str(self.settings.get("webhook_scale", 1.0))); self.entries["webhook_scale"] = scale_entry
+        instances_lf = bstrap.LabelFrame(right_col, text="Game Instances (name dx dy per line, empty = single)", padding=10); instances_lf.pack(fill="x", padx=10, pady=10); instances_text = ScrolledText(instances_lf, height=3, wrap="none", autohide=True); instances_text.pack(fill="both", expand=True, padx=5, pady=5); instances_text.insert("1.0", "\n".join(self.settings.get("instances", []))); self.entries["instances"] = instances_text
         
         forms_container = bstrap.Frame(right_col); forms_container.pack(fill="x", padx=10, pady=10); forms_container.columnconfigure((0,1), weight=1)
         capture_forms_lf = bstrap.LabelFrame(forms_container, text="Special Capture Forms"); capture_forms_lf.grid(row=0, column=0, sticky="ns", padx=(0,5)); self.create_form_list_ui(capture_forms_lf, "special_capture_forms")
         run_away_forms_lf = bstrap.LabelFrame(forms_container, text="Run Away Forms"); run_away_forms_lf.grid(row=0, column=1, sticky="ns", padx=(5,0)); self.create_form_list_ui(run_away_forms_lf, "run_away_forms")
         bot_resources_lf = bstrap.LabelFrame(self.scrollable_frame, text="Bot Resources", padding=10); bot_resources_lf.grid(row=1, column=0, columnspan=2, padx=20, pady=10, sticky="ew"); bot_resources_lf.columnconfigure(1, weight=1)
-        bot_resources = [("Tesseract Path", "TESSERACT_PATH", "tesseract.exe", "Select Tesseract Executable", [("Executables", "*.exe")]), ("Items Header Image", "ITEMS_HEADER_PATH", "items_header.png", "Select Items Header Image", [("Images", "*.png")]), ("Ace Disc Image", "ACE_DISC_PATH", "ace_disc.png", "Select Ace Disc Image", [("Images", "*.png")]), ("Use Button Image", "USE_IMAGE_PATH", "use_button.png", "Select Use Button Image", [("Images", "*.png")]), ("No Button Image", "NO_BUTTON_IMAGE_PATH", "no_button.png", "Select No Button Image", [("Images", "*.png")])]
+        bot_resources = [("Tesseract Path", "TESSERACT_PATH", "tesseract.exe", "Select Tesseract Executable", [("Executables", "*.exe")]), ("Items Header Image", "ITEMS_HEADER_PATH", "items_header.png", "Select Items Header Image", [("Images", "*.png")]), ("Ace Disc Image", "ACE_DISC_PATH", "ace_disc.png", "Select Ace Disc Image", [("Images", "*.png")]), ("Use Button Image", "USE_IMAGE_PATH", "use_button.png", "Select Use Button Image", [("Images", "*.png")]), ("No Button Image", "NO_BUTTON_IMAGE_PATH", "no_button.png", "Select No Button Image", [("Images", "*.png")]), ("Detector Model (ONNX)", "detector_model_path", "detector.onnx", "Select Exported ONNX Detector", [("ONNX models", "*.onnx")])]
         for i, (label, key, filename, title, filetypes) in enumerate(bot_resources):
             bstrap.Label(bot_resources_lf, text=label).grid(row=i, column=0, sticky="w", padx=(10,10), pady=4); entry = bstrap.Entry(bot_resources_lf); entry.grid(row=i, column=1, sticky="ew", padx=(0,5)); entry.insert(0, self.settings.get(key, ""))
-            browse_command = lambda e=entry, fn=filename, t=title, ft=ftypes: self.browse_and_import_asset(e, fn, t, ft)
+            browse_command = lambda e=entry, fn=filename, t=title, ft=filetypes: self.browse_and_import_asset(e, fn, t, ft)
             if key == 'TESSERACT_PATH': browse_command = lambda e=entry: self.browse_path(e, title=title, filetypes=filetypes)
             btn = bstrap.Button(bot_resources_lf, text="Browse...", command=browse_command, bootstyle="secondary-outline"); btn.grid(row=i, column=2, sticky="ew", padx=(0,10)); self.entries[key] = entry
             if "Image" in label: bstrap.Button(bot_resources_lf, text="Preview", command=lambda e=entry: self.preview_image(e.get()), bootstyle="info-outline").grid(row=i, column=3, sticky="ew", padx=(0,10))
@@ -438,6 +2107,7 @@ class SettingsTab(bstrap.Frame):
                     except (ValueError, TypeError):
                         try: self.settings[key] = float(widget.get())
                         except (ValueError, TypeError): self.settings[key] = widget.get()
+        parse_instances(self.settings.get("instances", []))  # a malformed line fails the save here, not on Start
     def run_setup_wizard(self):
         all_steps = [
             {'key': 'run_away', 'label': 'Run Away Click Point', 'mode': 'point', 'prompt': "Click the 'Run Away' button location and press SPACE"},
@@ -459,31 +2129,60 @@ class SettingsTab(bstrap.Frame):
             area_key_map = { 'scan_header_area': ('header_topleft_x', 'header_topleft_y', 'header_bottomright_x', 'header_bottomright_y'), 'scan_ocr_area': ('ocr_topleft_x', 'ocr_topleft_y', 'ocr_bottomright_x', 'ocr_bottomright_y'), 'scan_photo_area': ('photo_topleft_x', 'photo_topleft_y', 'photo_bottomright_x', 'photo_bottomright_y'), 'scan_action_area': ('action_scan_topleft_x', 'action_scan_topleft_y', 'action_scan_bottomright_x', 'action_scan_bottomright_y') }
             for key, (xk, yk) in click_key_map.items():
                 if key in results: x, y = results[key]; self.entries[xk].delete(0, tk.END); self.entries[xk].insert(0, str(x)); self.entries[yk].delete(0, tk.END); self.entries[yk].insert(0, str(y))
+            if any(k in results for k in ('scan_header_area', 'scan_ocr_area', 'scan_photo_area')): self.settings.pop("header_anchor", None)  # hand-drawn regions are the new baseline
             for key, (x1k, y1k, x2k, y2k) in area_key_map.items():
                 if key in results: x1, y1, x2, y2 = results[key]; self.entries[x1k].delete(0, tk.END); self.entries[x1k].insert(0, str(x1)); self.entries[y1k].delete(0, tk.END); self.entries[y1k].insert(0, str(y1)); self.entries[x2k].delete(0, tk.END); self.entries[x2k].insert(0, str(x2)); self.entries[y2k].delete(0, tk.END); self.entries[y2k].insert(0, str(y2))
             messagebox.showinfo("Setup Complete", "Selected locations have been configured.", parent=self)
         if steps_to_run: SetupWizard(self.winfo_toplevel(), steps_to_run, wizard_callback)
+    def auto_calibrate(self):
+        try: self.apply_changes(); snapshot = dict(self.settings)
+        except Exception as e: messagebox.showerror("Calibration Error", f"Could not start calibration: {e}", parent=self); return
+        self.calibrate_button.configure(state="disabled")
+        def done(future):
+            self.calibrate_button.configure(state="normal")
+            try: updates, report = future.result()
+            except Exception as e: messagebox.showerror("Calibration Error", f"Calibration failed: {e}", parent=self); return
+            for key, value in updates.items():
+                if key in self.entries: self.entries[key].delete(0, tk.END); self.entries[key].insert(0, str(value))
+                else: self.settings[key] = value
+            messagebox.showinfo("Calibration Result", "\n".join(report) + "\n\nSave to keep the new regions.", parent=self)
+        when_done(self, get_diagnostics().submit(lambda: calibrate_regions(ImageGrab.grab(), snapshot)), done)
     def test_header_detection(self):
         try:
             self.apply_changes(); global settings; settings = self.settings
             if not os.path.exists(settings["ITEMS_HEADER_PATH"]): messagebox.showerror("Test Error", "Items Header Image path is invalid.", parent=self); return
-            found = items_header_detected(ImageGrab.grab())
-            if found: messagebox.showinfo("Header Test Result", "Success: Item Header was found in the specified area.", parent=self)
-            else: messagebox.showwarning("Header Test Result", "Failure: Item Header was NOT found in the specified area.", parent=self)
-        except Exception as e: messagebox.showerror("Test Error", f"Failed to execute header test: {e}", parent=self)
+        except Exception as e: messagebox.showerror("Test Error", f"Failed to execute header test: {e}", parent=self); return
+        def show(score):
+            if score > HEADER_THRESHOLD: messagebox.showinfo("Header Test Result", f"Success: Item Header was found in the specified area (score {score:.3f}).", parent=self)
+            else: messagebox.showwarning("Header Test Result", f"Failure: Item Header was NOT found in the specified area (score {score:.3f}).", parent=self)
+        run_in_background(self, "Test Error", lambda: header_score(ImageGrab.grab()), show)
     def test_ocr(self):
         try:
             self.apply_changes(); global settings; settings = self.settings
             tesseract_path = settings.get("TESSERACT_PATH", "");
             if not tesseract_path or not os.path.exists(tesseract_path): messagebox.showerror("OCR Test Error", "Tesseract path is not configured or is invalid.", parent=self); return
             pytesseract.pytesseract.tesseract_cmd = tesseract_path
-            text = ocr_text(ImageGrab.grab()); messagebox.showinfo("OCR Test Result", f"Detected text: '{text}'", parent=self)
-        except Exception as e: messagebox.showerror("OCR Test Error", f"Could not perform OCR test: {e}", parent=self)
+        except Exception as e: messagebox.showerror("OCR Test Error", f"Could not perform OCR test: {e}", parent=self); return
+        run_in_background(self, "OCR Test Error", lambda: get_ocr().submit(ocr_threshold(ImageGrab.grab())).result(), lambda text: messagebox.showinfo("OCR Test Result", f"Detected text: '{text}'", parent=self))
+    def diagnose_all(self):
+        # One grab, then header, OCR, every button template and every form photo against it on the diagnostics pool.
+        try:
+            self.apply_changes(); global settings; settings = self.settings
+            if settings.get("TESSERACT_PATH") and os.path.exists(settings["TESSERACT_PATH"]): pytesseract.pytesseract.tesseract_cmd = settings["TESSERACT_PATH"]
+            names_tab = self.winfo_toplevel().names_tab; rare_photos = rare_photos_of(names_tab.data, names_tab.name_order)
+        except Exception as e: messagebox.showerror("Diagnostics Error", f"Could not start diagnostics: {e}", parent=self); return
+        self.diagnose_button.configure(state="disabled"); start = time.perf_counter()
+        def finished(checks): self.diagnose_button.configure(state="normal"); DiagnosticsDialog(self, checks, time.perf_counter() - start)
+        def grabbed(future):
+            try: checks = submit_diagnostics(future.result(), rare_photos)
+            except Exception as e: self.diagnose_button.configure(state="normal"); messagebox.showerror("Diagnostics Error", f"Could not run diagnostics: {e}", parent=self); return
+            when_done(self, [c[3] for c in checks], lambda _: finished(checks))
+        when_done(self, get_diagnostics().submit(ImageGrab.grab), grabbed)
     def test_run_away(self):
         try:
             self.apply_changes(); global settings; settings = self.settings
-            if not os.path.exists(settings['AHK_PATH']) or not os.path.exists(settings['AHK_RUNAWAY_SCRIPT']): messagebox.showerror("Test Error", "AHK path or Run Away script path is invalid.", parent=self); return
-            threading.Thread(target=ahk_run_away, daemon=True).start(); messagebox.showinfo("Test", "Run Away script has been executed.", parent=self)
+            if not all(os.path.exists(settings[k]) for k in required_input_paths(settings)): messagebox.showerror("Test Error", "AHK path or Run Away script path is invalid.", parent=self); return
+            stop_input(); threading.Thread(target=ahk_run_away, daemon=True).start(); messagebox.showinfo("Test", "Run Away click has been sent.", parent=self)
         except Exception as e: messagebox.showerror("Test Error", f"Failed to execute test: {e}", parent=self)
     def browse_and_import_asset(self, entry_widget, target_filename, dialog_title, filetypes):
         source_path = filedialog.askopenfilename(title=dialog_title, filetypes=filetypes);
@@ -509,16 +2208,17 @@ class SettingsTab(bstrap.Frame):
 class NamesPhotosTab(bstrap.Frame):
     def __init__(self, parent, main_app_instance, names_data_dict, name_order_list):
         super().__init__(parent); self.app = main_app_instance; self.data = names_data_dict; self.name_order = name_order_list
+        self.thumbs = ThumbnailCache(self.app.settings.get("thumb_cache_dir") or DEFAULTS["thumb_cache_dir"]); self._jobs = {}; self._pending_rows = collections.deque(); self._preview_path = None
         self.current_image = None; self.filtered_name_order = []; self.columnconfigure(0, weight=1, minsize=200); self.columnconfigure(1, weight=3); self.rowconfigure(0, weight=1)
         names_frame = bstrap.LabelFrame(self, text="Names", padding=5); names_frame.grid(row=0, column=0, padx=(10,5), pady=10, sticky="nsew"); names_frame.rowconfigure(1, weight=1); names_frame.columnconfigure(0, weight=1)
-        self.name_search_var = tk.StringVar(); name_search_entry = bstrap.Entry(names_frame, textvariable=self.name_search_var); name_search_entry.grid(row=0, column=0, sticky="ew", padx=5, pady=5); add_placeholder(name_search_entry, "Search names..."); self.name_search_var.trace_add("write", self.update_name_search)
+        self.name_search_var = tk.StringVar(); name_search_entry = bstrap.Entry(names_frame, textvariable=self.name_search_var); name_search_entry.grid(row=0, column=0, sticky="ew", padx=5, pady=5); add_placeholder(name_search_entry, "Search names..."); self.name_search_var.trace_add("write", lambda *a: self.debounce("names", self.update_name_search))
         listbox_frame = bstrap.Frame(names_frame); listbox_frame.grid(row=1, column=0, sticky="nsew", padx=5, pady=(0,5)); listbox_frame.rowconfigure(0, weight=1); listbox_frame.columnconfigure(0, weight=1)
         self.name_list = tk.Listbox(listbox_frame, width=30, exportselection=False); self.name_list.grid(row=0, column=0, sticky="nsew"); self.name_list.bind("<<ListboxSelect>>", self.on_select_name)
         name_scroll = bstrap.Scrollbar(listbox_frame, orient="vertical", command=self.name_list.yview, bootstyle="round"); name_scroll.grid(row=0, column=1, sticky="ns"); self.name_list.config(yscrollcommand=name_scroll.set)
         self.create_toolbar(names_frame, [("➕", self.add_name), ("✏️", self.rename_name), ("🗑️", self.delete_name), ("⬆️", lambda: self.move_name(-1)), ("⬇️", lambda: self.move_name(1))]).grid(row=2, column=0, sticky="ew", padx=5, pady=5)
         photos_and_preview = bstrap.Frame(self); photos_and_preview.grid(row=0, column=1, padx=(0,10), pady=10, sticky="nsew"); photos_and_preview.columnconfigure(0, weight=2); photos_and_preview.columnconfigure(1, weight=1); photos_and_preview.rowconfigure(0, weight=1)
         photos_frame = bstrap.LabelFrame(photos_and_preview, text="Photos"); photos_frame.grid(row=0, column=0, sticky="nsew", padx=(0,5)); photos_frame.rowconfigure(1, weight=1); photos_frame.columnconfigure(0, weight=1)
-        self.photo_search_var = tk.StringVar(); photo_search_entry = bstrap.Entry(photos_frame, textvariable=self.photo_search_var); photo_search_entry.grid(row=0, column=0, columnspan=2, sticky="ew", padx=5, pady=5); add_placeholder(photo_search_entry, "Search photos..."); self.photo_search_var.trace_add("write", lambda *a: self.on_select_name())
+        self.photo_search_var = tk.StringVar(); photo_search_entry = bstrap.Entry(photos_frame, textvariable=self.photo_search_var); photo_search_entry.grid(row=0, column=0, columnspan=2, sticky="ew", padx=5, pady=5); add_placeholder(photo_search_entry, "Search photos..."); self.photo_search_var.trace_add("write", lambda *a: self.debounce("photos", self.on_select_name))
         self.photo_tree = bstrap.Treeview(photos_frame, columns=("Photo Name", "File"), show="headings", selectmode="browse"); self.photo_tree.grid(row=1, column=0, sticky="nsew", padx=(5,0), pady=5); self.photo_tree.heading("Photo Name", text="Photo Name"); self.photo_tree.heading("File", text="File Path"); self.photo_tree.column("Photo Name", width=150); self.photo_tree.bind("<<TreeviewSelect>>", self.on_select_photo)
         style = bstrap.Style(); self.photo_tree.tag_configure('special', foreground=style.colors.success); self.photo_tree.tag_configure('runaway', foreground=style.colors.warning)
         photo_scroll = bstrap.Scrollbar(photos_frame, orient="vertical", command=self.photo_tree.yview, bootstyle="round"); photo_scroll.grid(row=1, column=1, sticky="ns", pady=5); self.photo_tree.config(yscrollcommand=photo_scroll.set)
@@ -527,16 +2227,40 @@ class NamesPhotosTab(bstrap.Frame):
         self.action_preview_label = bstrap.Label(preview_lf, text="", font="-size 10 -weight bold"); self.action_preview_label.pack(pady=(10, 0))
         bstrap.Button(preview_lf, text="Test Match vs. Screen", bootstyle="info-outline", command=self.test_match).pack(fill='x', padx=5, pady=10)
         self.filtered_name_order = self.name_order[:]; self.refresh_name_list(); self.bind_all("<Control-n>", lambda e: self.add_name()); self.bind_all("<Control-p>", lambda e: self.add_photo())
-        self.name_list.bind("<Button-3>", self.show_name_context_menu); self.photo_tree.bind("<Button-3>", self.show_photo_context_menu)
+        self.name_list.bind("<Button-3>", self.show_name_context_menu); self.photo_tree.bind("<Button-3>", self.show_photo_context_menu); self._pack_job = None
+    def debounce(self, key, callback, delay=150):
+        # Typing in a search box refilters once the keystrokes pause instead of on every one.
+        if self._jobs.get(key): self.after_cancel(self._jobs[key])
+        self._jobs[key] = self.after(delay, lambda: (self._jobs.pop(key, None), callback()))
+    def schedule_pack_rebuild(self):
+        # Debounced: a burst of photo edits triggers one background pack write, which only processes new or changed photos.
+        if self._pack_job: self.after_cancel(self._pack_job)
+        self._pack_job = self.after(1500, self._rebuild_pack)
+    def _rebuild_pack(self):
+        self._pack_job = None; s = self.app.settings
+        rare_photos = {name: {p_name: p_path for p_name, p_path in self.data[name].get("photos", {}).values()} for name in self.name_order if name in self.data}
+        template_paths, photos, photo_size = library_paths(s, rare_photos); pack_dir = s.get("template_pack_dir") or DEFAULTS["template_pack_dir"]
+        def run():
+            try: refresh_template_pack(pack_dir, template_paths, photos, photo_size, int(s.get("cascade_size", 48)))
+            except Exception as e: print(f"[ERROR] Template pack rebuild failed: {e}")
+        threading.Thread(target=run, name="template_pack", daemon=True).start()
     def create_toolbar(self, parent, buttons): toolbar = bstrap.Frame(parent); [bstrap.Button(toolbar, text=text, command=command, width=3, bootstyle="secondary-outline").pack(side="left", padx=2, fill='x', expand=True) for text, command in buttons]; return toolbar
     def update_name_search(self, *args): search = self.name_search_var.get().strip().lower(); self.filtered_name_order = self.name_order[:] if not search or search == "search names..." else [n for n in self.name_order if search in n.lower()]; self.refresh_name_list()
     def refresh_name_list(self):
-        last_sel = self.get_selected_name(); self.name_list.delete(0, tk.END)
-        for name in self.filtered_name_order: self.name_list.insert(tk.END, name)
+        # Only the rows that differ are deleted or inserted (from the end, so earlier indices stay valid): narrowing the
+        # search or renaming one name touches a few ranges instead of refilling thousands of rows.
+        last_sel = self.get_selected_name(); shown = list(self.name_list.get(0, tk.END))
+        for op, i1, i2, j1, j2 in reversed(difflib.SequenceMatcher(None, shown, self.filtered_name_order, autojunk=False).get_opcodes()):
+            if op in ("delete", "replace"): self.name_list.delete(i1, i2 - 1)
+            if op in ("insert", "replace"): self.name_list.insert(i1, *self.filtered_name_order[j1:j2])
+        self.name_list.selection_clear(0, tk.END)
         if last_sel and last_sel in self.filtered_name_order: idx = self.filtered_name_order.index(last_sel); self.name_list.selection_set(idx); self.name_list.activate(idx); self.name_list.see(idx)
         self.on_select_name()
     def on_select_name(self, event=None):
-        for item in self.photo_tree.get_children(): self.photo_tree.delete(item)
+        # The first screenful of rows is inserted now and the rest in chunks from the event loop, so selecting a name with
+        # thousands of photos (or typing in the search box) never blocks the GUI; select_photo() completes the list first.
+        if self._jobs.get("rows"): self.after_cancel(self._jobs.pop("rows"))
+        self.photo_tree.delete(*self.photo_tree.get_children()); self._pending_rows = collections.deque()
         self.clear_photo_preview(); name = self.get_selected_name();
         if not name: return
         photos_dict, photo_order = self.data[name].get("photos", {}), self.data[name].get("photo_order", [])
@@ -547,7 +2271,17 @@ class NamesPhotosTab(bstrap.Frame):
                 photo_name, photo_path = photos_dict[photo_id]
                 if not search_term or is_placeholder or search_term in photo_name.lower():
                     tag = 'special' if photo_name.lower() in special_forms else 'runaway' if photo_name.lower() in run_away_forms else ''
-                    self.photo_tree.insert("", tk.END, iid=photo_id, values=(photo_name, os.path.basename(photo_path or "N/A")), tags=(tag,))
+                    self._pending_rows.append((photo_id, photo_name, photo_path, tag))
+        self.thumbs.prefetch([row[2] for row in list(self._pending_rows)[:20]]); self.insert_rows(100)
+    def insert_rows(self, count):
+        for _ in range(min(count, len(self._pending_rows))):
+            photo_id, photo_name, photo_path, tag = self._pending_rows.popleft()
+            self.photo_tree.insert("", tk.END, iid=photo_id, values=(photo_name, os.path.basename(photo_path or "N/A")), tags=(tag,))
+        if self._pending_rows and not self._jobs.get("rows"): self._jobs["rows"] = self.after(1, self._insert_more_rows)
+    def _insert_more_rows(self): self._jobs.pop("rows", None); self.insert_rows(200)
+    def select_photo(self, photo_id):
+        self.insert_rows(len(self._pending_rows))
+        if self.photo_tree.exists(photo_id): self.photo_tree.selection_set(photo_id); self.photo_tree.focus(photo_id); self.photo_tree.see(photo_id)
     def on_select_photo(self, event=None):
         name, sel = self.get_selected_name(), self.photo_tree.selection();
         if not (name and sel): self.clear_photo_preview(); return
@@ -559,15 +2293,23 @@ class NamesPhotosTab(bstrap.Frame):
             if photo_name.lower() in special_forms: action_text, style = "Action: Special Capture", "success"
             elif photo_name.lower() in run_away_forms: action_text, style = "Action: Run Away", "warning"
             self.action_preview_label.config(text=action_text, bootstyle=style)
-    def clear_photo_preview(self): self.photo_label.config(image="", text="Select a photo to preview"); self.current_image = None; self.action_preview_label.config(text="", bootstyle="default")
+    def clear_photo_preview(self): self._preview_path = None; self.photo_label.config(image="", text="Select a photo to preview"); self.current_image = None; self.action_preview_label.config(text="", bootstyle="default")
     def show_photo_preview(self, path):
-        if path and os.path.exists(path):
-            try:
-                self.photo_label.update_idletasks(); w, h = max(self.photo_label.winfo_width() - 10, 200), max(self.photo_label.winfo_height() - 10, 200)
-                img = Image.open(path); img.thumbnail((w, h), Image.Resampling.LANCZOS); self.current_image = ImageTk.PhotoImage(img)
-                self.photo_label.config(image=self.current_image, text="")
-            except Exception as e: self.photo_label.config(image="", text=f"Cannot open image:\n{e}"); self.current_image = None
-        else: self.clear_photo_preview()
+        # Shows the cached thumbnail at once when it is in memory; otherwise the worker makes (or reads) it and the latest
+        # selection is shown when it arrives.
+        if not (path and os.path.exists(path)): self.clear_photo_preview(); return
+        self._preview_path = path; thumb = self.thumbs.get(path)
+        if thumb is not None: self._set_preview(thumb); return
+        self.photo_label.config(image="", text="Loading preview..."); self.current_image = None; self._wait_preview(path, self.thumbs.load(path))
+    def _wait_preview(self, path, future):
+        if path != self._preview_path: return
+        if not future.done(): self.after(30, self._wait_preview, path, future); return
+        try: self._set_preview(future.result())
+        except Exception as e: self.photo_label.config(image="", text=f"Cannot open image:\n{e}"); self.current_image = None
+    def _set_preview(self, thumb):
+        w, h = max(self.photo_label.winfo_width() - 10, 200), max(self.photo_label.winfo_height() - 10, 200)
+        if thumb.width > w or thumb.height > h: thumb = thumb.copy(); thumb.thumbnail((w, h), Image.Resampling.LANCZOS)
+        self.current_image = ImageTk.PhotoImage(thumb); self.photo_label.config(image=self.current_image, text="")
     def _validate_photo_name(self, photo_name):
         special_forms, run_away_forms = {f.lower() for f in self.app.settings.get("special_capture_forms", [])}, {f.lower() for f in self.app.settings.get("run_away_forms", [])}
         if photo_name.lower() not in special_forms and photo_name.lower() not in run_away_forms: messagebox.showerror("Invalid Photo Name", f"The photo name '{photo_name}' is not in the 'Special Capture' or 'Run Away' form lists.\n\nPlease add it to one of those lists in the General Settings tab before adding the photo."); return False
@@ -583,7 +2325,7 @@ class NamesPhotosTab(bstrap.Frame):
             photo_id = str(uuid.uuid4()); png_path = save_image_as_png(file_path, name, photo_name, photo_id)
             if png_path:
                 self.data[name]["photos"][photo_id] = (photo_name, png_path); self.data[name]["photo_order"].append(photo_id)
-                self.on_select_name(); self.photo_tree.selection_set(photo_id); self.photo_tree.focus(photo_id); self.photo_tree.see(photo_id)
+                self.on_select_name(); self.select_photo(photo_id); self.schedule_pack_rebuild()
     def rename_photo(self):
         name, sel = self.get_selected_name(), self.photo_tree.selection();
         if not (name and sel): return
@@ -597,7 +2339,7 @@ class NamesPhotosTab(bstrap.Frame):
             if new_path and old_path and new_path != old_path:
                 try: os.remove(old_path)
                 except OSError: pass
-            photos[photo_id] = (new_pname, new_path); self.on_select_name(); self.photo_tree.selection_set(photo_id)
+            photos[photo_id] = (new_pname, new_path); self.on_select_name(); self.select_photo(photo_id); self.schedule_pack_rebuild()
     def add_name(self):
         name = simpledialog.askstring("Add Name", "Enter a new name:", parent=self)
         if name and name.strip():
@@ -612,7 +2354,7 @@ class NamesPhotosTab(bstrap.Frame):
         if new_name and new_name.strip() and new_name.strip() != name:
             new_name = new_name.strip()
             if new_name in self.data: messagebox.showerror("Error", f"Name '{new_name}' already exists.", parent=self); return
-            idx = self.name_order.index(name); self.data[new_name] = self.data.pop(name); self.name_order[idx] = new_name; self.update_name_search()
+            idx = self.name_order.index(name); self.data[new_name] = self.data.pop(name); self.name_order[idx] = new_name; self.update_name_search(); self.schedule_pack_rebuild()
     def delete_name(self):
         name = self.get_selected_name();
         if not name or not messagebox.askyesno("Delete Name", f"Delete '{name}' and all its photos?", parent=self, icon='warning'): return
@@ -621,7 +2363,7 @@ class NamesPhotosTab(bstrap.Frame):
             if ppath and os.path.exists(ppath):
                 try: os.remove(ppath)
                 except OSError as e: print(f"Could not delete {ppath}: {e}")
-        del self.data[name]; self.name_order.remove(name); self.update_name_search()
+        del self.data[name]; self.name_order.remove(name); self.update_name_search(); self.schedule_pack_rebuild()
     def move_name(self, direction):
         name = self.get_selected_name();
         if not name or (self.name_search_var.get().strip() and self.name_search_var.get().strip() != "search names..."): return
@@ -638,7 +2380,7 @@ class NamesPhotosTab(bstrap.Frame):
         if ppath and os.path.exists(ppath):
             try: os.remove(ppath)
             except OSError: pass
-        del photos[photo_id]; photo_order.remove(photo_id); self.on_select_name()
+        del photos[photo_id]; photo_order.remove(photo_id); self.on_select_name(); self.schedule_pack_rebuild()
     def move_photo(self, direction):
         name, sel = self.get_selected_name(), self.photo_tree.selection();
         if not (name and sel): return
@@ -646,19 +2388,17 @@ class NamesPhotosTab(bstrap.Frame):
         if photo_id not in photo_order: return
         idx = photo_order.index(photo_id); new_idx = idx + direction
         if 0 <= new_idx < len(photo_order):
-            photo_order.insert(new_idx, photo_order.pop(idx)); self.on_select_name()
-            self.photo_tree.selection_set(photo_id); self.photo_tree.focus(photo_id); self.photo_tree.see(photo_id)
+            photo_order.insert(new_idx, photo_order.pop(idx)); self.on_select_name(); self.select_photo(photo_id)
     def get_selected_name(self): sel = self.name_list.curselection(); return self.name_list.get(sel[0]) if sel else None
     def test_match(self):
         name, sel = self.get_selected_name(), self.photo_tree.selection()
         if not (name and sel): messagebox.showwarning("Test Error", "Please select a photo to test.", parent=self); return
         photo_id = sel[0]; _, template_path = self.data[name]['photos'][photo_id]
         if not template_path or not os.path.exists(template_path): messagebox.showerror("Test Error", "Photo file path is missing or invalid.", parent=self); return
-        try:
-            self.app.settings_tab.apply_changes(); global settings; settings = self.app.settings
-            score = compare_photos(ImageGrab.grab(), template_path); threshold = float(settings.get("photo_match_threshold", 0.85))
-            messagebox.showinfo("Match Test Result", f"Comparison Score: {score:.4f}\nThreshold: {threshold}\n\nResult: {'MATCH' if score >= threshold else 'NO MATCH'}", parent=self)
-        except Exception as e: messagebox.showerror("Match Test Error", f"Could not perform match test: {e}", parent=self)
+        try: self.app.settings_tab.apply_changes(); global settings; settings = self.app.settings; threshold = float(settings.get("photo_match_threshold", 0.85))
+        except Exception as e: messagebox.showerror("Match Test Error", f"Could not perform match test: {e}", parent=self); return
+        run_in_background(self, "Match Test Error", lambda: compare_photos(ImageGrab.grab(), template_path),
+                          lambda score: messagebox.showinfo("Match Test Result", f"Comparison Score: {score:.4f}\nThreshold: {threshold}\n\nResult: {'MATCH' if score >= threshold else 'NO MATCH'}", parent=self))
     def show_name_context_menu(self, event):
         if not self.name_list.curselection(): self.name_list.selection_set(self.name_list.nearest(event.y))
         if not self.name_list.curselection(): return
@@ -684,15 +2424,66 @@ class BotControlTab(bstrap.Frame):
         self.start_button = bstrap.Button(control_frame, text="Start Bot", command=self.start_callback, bootstyle="success", width=15); self.start_button.pack(side="left", padx=5)
         self.stop_button = bstrap.Button(control_frame, text="Stop Bot", command=self.stop_callback, bootstyle="danger", width=15, state="disabled"); self.stop_button.pack(side="left", padx=5)
         self.status_label = bstrap.Label(control_frame, text="Status: Stopped", font="-weight bold", bootstyle="secondary"); self.status_label.pack(side="left", padx=20)
+        self.profile_var = tk.BooleanVar(value=False); bstrap.Checkbutton(control_frame, text="Sampling Profiler", variable=self.profile_var, command=self.toggle_profiler, bootstyle="round-toggle").pack(side="right", padx=5)
+        self.trace_var = tk.BooleanVar(value=False); bstrap.Checkbutton(control_frame, text="Trace Spans", variable=self.trace_var, command=self.toggle_tracing, bootstyle="round-toggle").pack(side="right", padx=5)
         log_frame = bstrap.LabelFrame(self, text="Live Bot Log", padding=5); log_frame.grid(row=1, column=0, sticky="nsew")
-        self.log_text = ScrolledText(log_frame, wrap=tk.WORD, state="disabled", autohide=True); self.log_text.pack(fill="both", expand=True)
+        self.log_text = ScrolledText(log_frame, wrap=tk.WORD, state="disabled", autohide=True); self.log_text.pack(fill="both", expand=True); self.max_log_lines = DEFAULTS["log_view_lines"]
         style = bstrap.Style.get_instance()
+        self.instances_lf = bstrap.LabelFrame(self, text="Instances", padding=5); self.instances_lf.grid(row=2, column=0, sticky="ew", pady=(10, 0)); self.instances_lf.grid_remove()
+        columns = {"name": 140, "offset": 90, "pid": 70, "state": 170, "encounters": 90, "per_hour": 80, "captures": 80, "runs": 70}
+        self.instances_tree = ttk.Treeview(self.instances_lf, columns=list(columns), show="headings", height=4); self.instances_tree.pack(fill="x")
+        for col, width in columns.items(): self.instances_tree.heading(col, text=col.replace("_", "/").title()); self.instances_tree.column(col, width=width, anchor="w")
         self.log_text.tag_config("SUCCESS", foreground=style.colors.success); self.log_text.tag_config("ERROR", foreground=style.colors.danger); self.log_text.tag_config("FATAL_ERROR", foreground=style.colors.danger, font="-weight bold"); self.log_text.tag_config("WARNING", foreground=style.colors.warning); self.log_text.tag_config("INFO", foreground=style.colors.info); self.log_text.tag_config("ACTION", foreground=style.colors.primary); self.log_text.tag_config("SCAN", foreground=style.colors.secondary); self.log_text.tag_config("STATUS", foreground=style.colors.fg, font="-weight bold")
-    def add_log(self, message):
-        self.log_text.text['state'] = 'normal'
-        tag_map = {"[SUCCESS]": "SUCCESS", "[ERROR]": "ERROR", "[FATAL_ERROR]": "FATAL_ERROR", "[WARNING]": "WARNING", "[INFO]": "INFO", "[ACTION]": "ACTION", "[SCAN]": "SCAN", "[STATUS]": "STATUS", "============== [STATUS]": "STATUS"}
-        tag_to_apply = next((tag for prefix, tag in tag_map.items() if message.startswith(prefix)), None)
-        self.log_text.insert(tk.END, message + '\n', tag_to_apply if tag_to_apply else ()); self.log_text.see(tk.END); self.log_text.text['state'] = 'disabled'
+    def toggle_tracing(self):
+        trace_dir = settings.get("trace_dir") or DEFAULTS["trace_dir"]
+        try:
+            if self.trace_var.get(): TRACER.start(trace_dir, int(float(settings.get("trace_jsonl_max_mb", 20)) * 1024 * 1024))
+            else: path = TRACER.stop(); path and self.add_log(f"[INFO] Chrome trace saved to '{path}' (open in chrome://tracing or ui.perfetto.dev).")
+        except Exception as e: self.trace_var.set(False); messagebox.showerror("Tracing Error", f"Could not toggle tracing: {e}", parent=self)
+    def toggle_profiler(self):
+        try:
+            if self.profile_var.get(): PROFILER.start(float(settings.get("profiler_interval_ms", 5)) / 1000.0)
+            else: path = PROFILER.stop(settings.get("trace_dir") or DEFAULTS["trace_dir"]); path and self.add_log(f"[INFO] Profile saved to '{path}'.")
+        except Exception as e: self.profile_var.set(False); messagebox.showerror("Profiler Error", f"Could not toggle the profiler: {e}", parent=self)
+    def show_instances(self, rows):
+        if rows is None: self.instances_lf.grid_remove(); return
+        self.instances_lf.grid(); tree = self.instances_tree; items = tree.get_children()
+        for i, row in enumerate(rows):
+            if i < len(items): tree.item(items[i], values=row)
+            else: tree.insert("", tk.END, values=row)
+    def add_log(self, message): self.add_records([make_log_record(message)])
+    def add_records(self, records):
+        # One insert per batch; the widget keeps the last max_log_lines lines and only follows the end when already there.
+        if not records: return
+        text = self.log_text.text; at_end = text.yview()[1] >= 0.999; chunks = []
+        for record in records: chunks += [record.getMessage() + "\n", record.tag or ()]
+        text['state'] = 'normal'; text.insert(tk.END, *chunks)
+        excess = int(text.index("end-1c").split(".")[0]) - 1 - self.max_log_lines
+        if excess > 0: text.delete("1.0", f"{excess + 1}.0")
+        text['state'] = 'disabled'
+        if at_end: text.see(tk.END)
+
+class LiveVisionTab(bstrap.Frame):
+    # Shows LIVE_VISION's latest panel. Tk only pastes a finished image; the renderer is switched off while this tab is
+    # hidden or the window is minimised.
+    def __init__(self, parent):
+        super().__init__(parent, padding=10); self.photo = None; self.shown = 0
+        self.label = bstrap.Label(self, text="Live vision appears here while the bot is running.", anchor="center"); self.label.pack(fill="both", expand=True)
+        self.after(250, self.refresh)
+    def refresh(self):
+        try:
+            renderer = LIVE_VISION
+            if renderer:
+                visible = bool(self.winfo_viewable()) and self.winfo_toplevel().state() != "iconic"
+                if visible: renderer.active.set()
+                else: renderer.active.clear()
+                seq, image = renderer.latest
+                if visible and image is not None and seq != self.shown:
+                    if self.photo is None or (self.photo.width(), self.photo.height()) != image.size: self.photo = ImageTk.PhotoImage(image); self.label.configure(image=self.photo, text="")
+                    else: self.photo.paste(image)
+                    self.shown = seq
+            elif self.photo is not None: self.photo = None; self.shown = 0; self.label.configure(image="", text="Live vision appears here while the bot is running.")
+        finally: self.after(int(1000 / max(0.5, float(settings.get("live_vision_fps", 4)))) if LIVE_VISION else 250, self.refresh)
 
 class MainApp(bstrap.Window):
     def __init__(self):
@@ -701,13 +2492,14 @@ class MainApp(bstrap.Window):
         try: super().__init__(themename=initial_theme)
         except tk.TclError: super().__init__(themename="darkly"); self.settings["theme"] = "darkly"; initial_theme = "darkly"
         self.title("Automation & Data Manager"); self.geometry("1200x800"); self.minsize(1000, 700)
-        self.protocol("WM_DELETE_WINDOW", self.on_closing); self.bot_threads, self.log_queue = [], queue.Queue()
+        self.protocol("WM_DELETE_WINDOW", self.on_closing); self.bot_threads, self.logs, self.supervisor = [], None, None
         main_frame = bstrap.Frame(self, padding=10); main_frame.pack(fill="both", expand=True)
         self.notebook = bstrap.Notebook(main_frame); self.notebook.pack(fill="both", expand=True, pady=(0, 10))
         self.bot_control_tab = BotControlTab(self.notebook, self.start_bot, self.stop_bot)
         self.settings_tab = SettingsTab(self.notebook, self.settings)
         self.names_tab = NamesPhotosTab(self.notebook, self, names_dict, name_order_list)
-        self.notebook.add(self.bot_control_tab, text="Bot Control"); self.notebook.add(self.settings_tab, text="General Settings"); self.notebook.add(self.names_tab, text="Names & Photos")
+        self.live_vision_tab = LiveVisionTab(self.notebook)
+        self.notebook.add(self.bot_control_tab, text="Bot Control"); self.notebook.add(self.live_vision_tab, text="Live Vision"); self.notebook.add(self.settings_tab, text="General Settings"); self.notebook.add(self.names_tab, text="Names & Photos")
         button_frame = bstrap.Frame(main_frame); button_frame.pack(fill="x", side="bottom")
         theme_frame = bstrap.Frame(button_frame); theme_frame.pack(side="left", padx=5); bstrap.Label(theme_frame, text="Theme:").pack(side="left")
         self.theme_var = tk.StringVar(value=initial_theme)
@@ -723,15 +2515,26 @@ class MainApp(bstrap.Window):
         try: self.save_all_data()
         except Exception as e: messagebox.showerror("Save Error", f"Could not save settings before starting: {e}"); return
         load_bot_data_from_gui_file()
-        missing_configs = [item for item, path in [("Tesseract executable path", settings.get("TESSERACT_PATH")), ("AHK Path", settings.get("AHK_PATH")), ("AHK Capture Script", settings.get("AHK_SCRIPT")), ("AHK Run Away Script", settings.get("AHK_RUNAWAY_SCRIPT")), ("Items Header Image", settings.get("ITEMS_HEADER_PATH")), ("Ace Disc Image", settings.get("ACE_DISC_PATH")), ("Use Button Image", settings.get("USE_IMAGE_PATH")), ("No Button Image", settings.get("NO_BUTTON_IMAGE_PATH"))] if not path or not os.path.exists(path)]
+        missing_configs = [item for item, path in [("Tesseract executable path", settings.get("TESSERACT_PATH")), *[(label, settings.get(key)) for label, key in [("AHK Path", "AHK_PATH"), ("AHK Capture Script", "AHK_SCRIPT"), ("AHK Run Away Script", "AHK_RUNAWAY_SCRIPT")] if key in required_input_paths(settings)], ("Items Header Image", settings.get("ITEMS_HEADER_PATH")), ("Ace Disc Image", settings.get("ACE_DISC_PATH")), ("Use Button Image", settings.get("USE_IMAGE_PATH")), ("No Button Image", settings.get("NO_BUTTON_IMAGE_PATH"))] if not path or not os.path.exists(path)]
         if missing_configs: messagebox.showerror("Missing Configuration", "The following required configurations are missing or invalid:\n\n" + "\n".join(f"  • {item}" for item in missing_configs) + "\n\nPlease configure them in the General Settings tab and save."); return
         pytesseract.pytesseract.tesseract_cmd = settings.get("TESSERACT_PATH")
         self.bot_control_tab.status_label.config(text="Status: Loading..."); self.bot_control_tab.add_log("[STATUS] --- BOT STARTING ---")
 
+        try: instances = parse_instances(settings.get("instances", []))
+        except ValueError as e: messagebox.showerror("Instances Error", str(e)); return
         exit_program.clear(); scan_active = False
-        self.stdout_original = sys.stdout; sys.stdout = self.QueueWriter(self.log_queue)
-        self.bot_threads = [threading.Thread(target=scan_loop, daemon=True), threading.Thread(target=keybind_listener, args=(self,), daemon=True)]
+        try: self.logs = LogPipeline(settings.get("log_dir") or DEFAULTS["log_dir"], int(float(settings.get("log_file_max_mb", 10)) * 1024 * 1024), int(settings.get("log_file_backups", 10)), int(settings.get("log_view_lines", 5000)))
+        except Exception as e: messagebox.showerror("Log Error", f"Could not open the log file: {e}"); return
+        self.bot_control_tab.max_log_lines = int(settings.get("log_view_lines", 5000)); self.bot_control_tab.add_log(f"[INFO] Logging to '{self.logs.path}'.")
+        self.stdout_original = sys.stdout; sys.stdout = LogWriter(self.logs)
+        if instances:
+            # One headless bot process per game window; this process only keeps the hotkeys and mirrors the pause state.
+            try: self.supervisor = InstanceSupervisor(instances, APP_DATA_FILE)
+            except Exception as e: sys.stdout = self.stdout_original; self.close_logs(); messagebox.showerror("Instances Error", f"Could not start the game instances: {e}"); return
+            stop_input(); self.bot_threads = [threading.Thread(target=keybind_listener, args=(self,), name="keybind_listener", daemon=True)]
+        else: self.bot_threads = [threading.Thread(target=scan_loop, name="scan_loop", daemon=True), threading.Thread(target=keybind_listener, args=(self,), name="keybind_listener", daemon=True)]
         for t in self.bot_threads: t.start()
+        start_live_vision()
         self.bot_control_tab.start_button.configure(state="disabled"); self.bot_control_tab.stop_button.configure(state="normal")
         self.bot_control_tab.status_label.configure(text="Status: Running (Paused)", bootstyle="warning")
         self.bot_control_tab.add_log(f"[INFO] Bot is running. Press '{settings.get('pause_hotkey', 'F9')}' to start/pause scanning.")
@@ -739,16 +2542,28 @@ class MainApp(bstrap.Window):
         if not self.bot_threads: return
         self.bot_control_tab.add_log("[STATUS] --- BOT STOPPING ---"); self.bot_control_tab.status_label.config(text="Status: Stopping...")
         global exit_program, scan_active
-        exit_program.set(); scan_active = False
+        exit_program.set(); scan_active = False; stop_live_vision(); stop_recorder(); stop_dataset(); stop_webhooks(); stop_input()
+        if self.supervisor:
+            for line in self.supervisor.stop(): self.logs.emit(line)
+            self.supervisor = None; self.bot_control_tab.show_instances(None)
         if hasattr(self, 'stdout_original'): sys.stdout = self.stdout_original
+        self.close_logs()
         self.bot_threads = []
         self.bot_control_tab.start_button.configure(state="normal"); self.bot_control_tab.stop_button.configure(state="disabled")
         self.bot_control_tab.status_label.configure(text="Status: Stopped", bootstyle="secondary"); self.bot_control_tab.add_log("[STATUS] Bot stopped.")
     def process_log_queue(self):
         try:
-            while True: self.bot_control_tab.add_log(self.log_queue.get_nowait().strip())
-        except queue.Empty: pass
+            if self.supervisor:
+                self.supervisor.set_active(scan_active)
+                for line in self.supervisor.poll(): self.logs.emit(line)
+                self.bot_control_tab.show_instances(list(self.supervisor.rows()))
+            if self.logs: self.bot_control_tab.add_records(self.logs.drain(500))
         finally: self.after(100, self.process_log_queue)
+    def close_logs(self):
+        # Shows what is still pending, then flushes the file sink.
+        if not self.logs: return
+        logs, self.logs = self.logs, None; self.bot_control_tab.add_records(logs.drain(len(logs.pending))); logs.close()
+        if sum(logs.dropped.values()): self.bot_control_tab.add_log(f"[WARNING] Log lines dropped under load: {dict(logs.dropped)}.")
     def on_closing(self):
         if self.bot_threads:
             if messagebox.askyesno("Exit", "The bot is running. Are you sure you want to exit?\nUnsaved data will be lost."): self.stop_bot(); self.destroy()
@@ -760,16 +2575,13 @@ class MainApp(bstrap.Window):
         print("\n" + "="*50); print("!! F12 FAILSAFE TRIGGERED - SHUTTING DOWN IMMEDIATELY !!"); print("="*50)
         global exit_program, scan_active
         exit_program.set(); scan_active = False
+        if self.supervisor: self.supervisor.stop_event.set()
+        if self.logs: self.logs.close()
         self.destroy()
     def change_theme(self, event=None):
         new_theme = self.theme_var.get(); self.style.theme_use(new_theme); self.settings["theme"] = new_theme
         try: self.save_all_data()
         except Exception as e: messagebox.showerror("Theme Save Error", f"Could not save new theme setting: {e}", parent=self)
-    class QueueWriter:
-        def __init__(self, q): self.queue = q
-        def write(self, msg):
-            if msg.strip(): self.queue.put(msg)
-        def flush(self): pass
 
 # ===================================================================================
 # --- Main Execution ---
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Builds the glyph atlas used by the built-in nameplate OCR (GlyphAtlas in botsruntest.py).
+#
+#   1. python build_glyph_atlas.py extract recordings/session_... nameplates/
+#        Cuts the OCR region out of every recorded frame (deduplicated) and writes nameplates/labels.tsv, pre-filled
+#        with Tesseract's reading when it is available. Check and correct the labels by hand.
+#   2. python build_glyph_atlas.py build nameplates/ [--out glyph_atlas.npz]
+#        Segments each labelled crop and keeps a few prototypes per character.
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+import botsruntest as bot
+
+LABELS_FILE = "labels.tsv"
+
+def read_labels(crops_dir):
+    with open(os.path.join(crops_dir, LABELS_FILE), encoding="utf-8", newline="") as f:
+        return [(row[0], row[1] if len(row) > 1 else "") for row in csv.reader(f, delimiter="\t") if row]
+
+def extract(args):
+    with open(os.path.join(args.recording, "index.jsonl"), encoding="utf-8") as f: entries = [json.loads(line) for line in f if line.strip()]
+    region = args.region or json.load(open(os.path.join(args.recording, "session.json"), encoding="utf-8"))["regions"]["ocr"]
+    os.makedirs(args.out, exist_ok=True); seen = set(); rows = []
+    for entry in entries:
+        frame = bot.CapturedFrame([(tuple(t["box"]), Image.open(os.path.join(args.recording, t["file"])).convert("RGB")) for t in entry["tiles"]], timestamp=entry["t"])
+        try: crop = frame.crop(tuple(region))
+        except ValueError: continue
+        thresh = bot.nameplate_threshold(crop); digest = hashlib.blake2b(thresh.tobytes(), digest_size=8).hexdigest()
+        if digest in seen or thresh.min() == thresh.max(): continue
+        seen.add(digest); name = f"crop_{entry['seq']:07d}.png"; crop.save(os.path.join(args.out, name))
+        try: guess = bot.pytesseract.image_to_string(thresh, config=r'--oem 3 --psm 7').replace('_', '').strip()
+        except Exception: guess = ""
+        rows.append((name, guess))
+    with open(os.path.join(args.out, LABELS_FILE), "w", encoding="utf-8", newline="") as f: csv.writer(f, delimiter="\t").writerows(rows)
+    print(f"Extracted {len(rows)} unique nameplate crops from {len(entries)} frames to '{args.out}'. Review {LABELS_FILE} before building.")
+
+def build(args):
+    prototypes, gaps, skipped = {}, ([], []), 0
+    for name, label in read_labels(args.crops):
+        chars = label.replace(" ", "")
+        if not chars: continue
+        labels, glyphs = bot.segment_glyphs(bot.nameplate_threshold(Image.open(os.path.join(args.crops, name)).convert("RGB")))
+        if len(glyphs) != len(chars): skipped += 1; continue
+        vectors, line_h = bot.glyph_vectors(labels, glyphs)
+        spaces = {int(n) for n in np.cumsum([len(w) for w in label.split()])[:-1]}  # glyph indexes that start a new word
+        for i, (char, vec) in enumerate(zip(chars, vectors)):
+            protos = prototypes.setdefault(char, [])
+            if len(protos) < args.max_per_char and (not protos or max(float(p @ vec) for p in protos) < 0.98): protos.append(vec)
+            if i: gaps[i in spaces].append((glyphs[i][0] - glyphs[i - 1][0] - glyphs[i - 1][2]) / line_h)
+    if not prototypes: sys.exit("No usable labelled crops (each label must have one character per segmented glyph).")
+    space_ratio = (max(gaps[0]) + min(gaps[1])) / 2 if gaps[0] and gaps[1] and max(gaps[0]) < min(gaps[1]) else args.space_ratio
+    labels = [c for c, protos in sorted(prototypes.items()) for _ in protos]; vectors = [v for _, protos in sorted(prototypes.items()) for v in protos]
+    bot.GlyphAtlas(vectors, labels, space_ratio).save(args.out)
+    print(f"Wrote '{args.out}': {len(prototypes)} characters, {len(vectors)} prototypes, space ratio {space_ratio:.2f} ({skipped} crops skipped: glyph count did not match the label).")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the nameplate glyph atlas from recorded crops.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("extract", help="cut labelled-to-be nameplate crops out of a recorded session")
+    p.add_argument("recording"); p.add_argument("out"); p.add_argument("--region", type=int, nargs=4, help="OCR region (defaults to the one saved with the session)")
+    p.set_defaults(func=extract)
+    p = sub.add_parser("build", help="build the atlas from a directory of crops with labels.tsv")
+    p.add_argument("crops"); p.add_argument("--out", default=bot.DEFAULTS["glyph_atlas_path"]); p.add_argument("--max-per-char", type=int, default=6)
+    p.add_argument("--space-ratio", type=float, default=0.4, help="word gap / line height, used when the labels do not determine it")
+    p.set_defaults(func=build)
+    args = parser.parse_args(); args.func(args)
+
+if __name__ == "__main__":
+    main()
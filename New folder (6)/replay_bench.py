@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Headless replay harness: feeds a FrameRecorder session through the bot's state handlers on a virtual clock,
+# with input going to the recording input driver and webhooks stubbed out, and reports per-encounter decision latency.
+#
+#   python replay_bench.py recordings/session_20250101_120000 [--app-data app_data.db] [--tesseract /usr/bin/tesseract]
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import botsruntest as bot
+
+class VirtualClock:
+    # Sleeps advance virtual time instantly; compute time between sleeps still counts, so latencies stay realistic.
+    def __init__(self, start, end): self._t = start; self._mark = time.perf_counter(); self.end = end
+    def time(self): return self._t + (time.perf_counter() - self._mark)
+    def sleep(self, seconds):
+        self._t = self.time() + seconds; self._mark = time.perf_counter()
+        if self._t > self.end: bot.exit_program.set()
+
+def percentile(values, pct):
+    ordered = sorted(values); return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def install_stubs(actions):
+    bot.send_webhook_with_image_pil = lambda message, image: actions.append(("webhook", bot.CLOCK.time(), message))
+
+def install_probes(encounters, stats):
+    search, analyze, capture = bot.handle_search_state, bot.handle_analyzing_state, bot.handle_capture_state
+    def timed(name, fn, *args):
+        start = time.perf_counter(); result = fn(*args); stats.setdefault(name, []).append((time.perf_counter() - start) * 1000); return result
+    def probe_search(frame):
+        result = timed("search", search, frame)
+        if result[0] == bot.BotState.ANALYZING: encounters.append({"start": frame.timestamp, "decision": None})
+        return result
+    def probe_analyze(frame):
+        result = timed("analyze", analyze, frame)
+        if encounters and encounters[-1]["decision"] is None and result[0] != bot.BotState.ANALYZING:
+            encounters[-1].update(decision=result[0].name, latency_ms=(bot.CLOCK.time() - encounters[-1]["start"]) * 1000)
+        return result
+    bot.handle_search_state, bot.handle_analyzing_state = probe_search, probe_analyze
+    bot.handle_capture_state = lambda: timed("capture", capture)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the bot and report decision latency.")
+    parser.add_argument("recording", help="FrameRecorder session directory (contains index.jsonl)")
+    parser.add_argument("--app-data", default=bot.APP_DATA_FILE, help="app data with the settings, names and photos to use (app_data.db, or a legacy .json file)")
+    parser.add_argument("--tesseract", default="", help="tesseract executable (defaults to TESSERACT_PATH, then PATH)")
+    parser.add_argument("--json", default="", help="also write the report to this file")
+    args = parser.parse_args()
+
+    bot.APP_DATA_FILE = os.path.abspath(args.app_data)
+    # Overridden before loading, so no recorder, dataset session or real input driver is ever started for a replay.
+    bot.load_bot_data_from_gui_file(overrides=dict(capture_backend="replay", capture_replay_path=args.recording, record_frames=False, record_dataset=False, input_backend="record"))
+    backend = bot.get_capture().backend
+    if backend.entries is None: sys.exit(f"'{args.recording}' is not a recorded session (no index.jsonl).")
+    tesseract = args.tesseract or bot.settings.get("TESSERACT_PATH")
+    if tesseract and os.path.exists(tesseract): bot.pytesseract.pytesseract.tesseract_cmd = tesseract
+
+    actions, encounters, stats = [], [], {}
+    bot.CLOCK = VirtualClock(backend.start_time, backend.end_time)
+    install_stubs(actions); install_probes(encounters, stats)
+    bot.exit_program.clear(); bot.scan_active = True
+    wall_start = time.perf_counter(); bot.scan_loop(); wall = time.perf_counter() - wall_start; actions += bot.get_input().events
+
+    decided = [e for e in encounters if e["decision"]]; latencies = [e["latency_ms"] for e in decided if e["decision"].startswith("ACTION")]
+    report = {
+        "frames": len(backend.entries), "recording_seconds": round(backend.end_time - backend.start_time, 3), "wall_seconds": round(wall, 3),
+        "encounters": len(encounters), "decisions": {d: sum(1 for e in decided if e["decision"] == d) for d in {e["decision"] for e in decided}},
+        "latency_ms": {"min": min(latencies), "median": statistics.median(latencies), "p95": percentile(latencies, 95), "max": max(latencies)} if latencies else {},
+        "handler_ms": {name: {"calls": len(v), "mean": statistics.fmean(v), "max": max(v)} for name, v in stats.items()},
+        "actions": {kind: sum(1 for a in actions if a[0] == kind) for kind in ("move", "click", "webhook")},
+    }
+    print(json.dumps(report, indent=4))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(dict(report, encounters=encounters), f, indent=4)
+
+if __name__ == "__main__":
+    main()
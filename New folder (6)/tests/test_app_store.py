@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+
+import botsruntest as bot
+from botsruntest import AppStore, from_stored_path, load_json_data, to_stored_path
+
+SAMPLE = os.path.join(bot.SCRIPT_DIR, "app_data.json")
+
+
+def sample_names():
+    names = {"Axolotl": {"photos": {"p1": ("Shiny", "photos_data/axolotl_shiny.png"), "p2": ("Normal", "photos_data/axolotl.png")}, "photo_order": ["p2", "p1"]},
+             "Bat": {"photos": {"p3": ("Normal", "photos_data/bat.png")}, "photo_order": ["p3"]}}
+    return {name: {"photos": {pid: (form, from_stored_path(path)) for pid, (form, path) in entry["photos"].items()}, "photo_order": entry["photo_order"]} for name, entry in names.items()}
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    # A copy of the shipped app_data.json (absolute Windows paths from the author's machine) with a few names added.
+    with open(SAMPLE, encoding="utf-8") as f: data = json.load(f)
+    data["names_data"] = {"data": sample_names(), "name_order": ["Bat", "Axolotl"]}
+    path = tmp_path / "app_data.json"; path.write_text(json.dumps(data), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def open_store(tmp_path):
+    stores = []
+    def open_(name="app_data.db"): stores.append(AppStore(str(tmp_path / name))); return stores[-1]
+    yield open_
+    for store in stores: store.conn.close()
+
+
+def stored_setting(store, key): return json.loads(store.conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()[0])
+
+
+def as_lists(names_data): return {name: {"photos": {pid: list(v) for pid, v in e["photos"].items()}, "photo_order": e["photo_order"]} for name, e in names_data.items()}
+
+
+def test_migrates_the_sibling_json_once(legacy, open_store):
+    expected_settings, expected_names, expected_order = load_json_data(str(legacy))
+    store = open_store(); settings_data, names_data, order = store.load()
+    assert order == expected_order == ["Bat", "Axolotl"] and as_lists(names_data) == as_lists(expected_names)
+    assert {k: v for k, v in settings_data.items() if k not in bot.PATH_SETTINGS} == {k: v for k, v in expected_settings.items() if k not in bot.PATH_SETTINGS}
+    assert store.conn.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone()[0] == str(legacy)
+    assert store.revision() == 1
+    store.conn.close(); legacy.write_text("{}", encoding="utf-8")
+    assert open_store().load()[2] == ["Bat", "Axolotl"]  # an existing database is never re-migrated
+
+
+def test_rescues_windows_paths_from_the_sample(legacy, open_store):
+    store = open_store()
+    assert stored_setting(store, "ITEMS_HEADER_PATH") == "bot_assets/items_header.png"
+    assert store.load()[0]["ITEMS_HEADER_PATH"] == os.path.join(bot.SCRIPT_DIR, "bot_assets", "items_header.png")
+    assert stored_setting(store, "AHK_PATH") == "C:\\Program Files\\AutoHotkey\\v2\\AutoHotkey64.exe"  # outside the bot folder: kept as is
+
+
+def test_windows_path_rescue():
+    assert to_stored_path("C:\\Users\\someone\\Desktop\\bot\\bot_assets\\ace_disc.png") == "bot_assets/ace_disc.png"
+    assert to_stored_path("D:/elsewhere/bot_assets/missing.png") == "D:/elsewhere/bot_assets/missing.png"
+    assert to_stored_path("\\\\server\\share\\tesseract.exe") == "\\\\server\\share\\tesseract.exe"
+    assert to_stored_path(os.path.join(bot.SCRIPT_DIR, "photos_data", "x.png")) == "photos_data/x.png"
+    assert from_stored_path("C:\\Program Files\\Tesseract-OCR\\tesseract.exe") == "C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
+
+
+def test_unchanged_save_writes_nothing(legacy, open_store):
+    store = open_store(); state = store.load(); revision = store.revision()
+    before = store.conn.total_changes
+    assert store.save(*state) == 0
+    assert store.conn.total_changes == before and store.revision() == revision
+
+
+def test_changes_write_only_their_rows_and_bump_the_revision(legacy, open_store):
+    store = open_store(); settings_data, names_data, order = store.load(); revision = store.revision()
+    settings_data["photo_match_threshold"] = 0.9; names_data["Axolotl"]["photo_order"] = ["p1", "p2"]
+    assert store.save(settings_data, names_data, order) == 3  # one setting, two photo positions
+    assert store.revision() == revision + 1
+    del names_data["Bat"]; order.remove("Bat")
+    assert store.save(settings_data, names_data, order) == 3  # the name, its photo and Axolotl's position
+    settings_data, names_data, order = store.load()
+    assert settings_data["photo_match_threshold"] == 0.9 and order == ["Axolotl"] and names_data["Axolotl"]["photo_order"] == ["p1", "p2"]
+    assert store.revision() == revision + 2
+
+
+def test_recovers_from_a_corrupt_database(legacy, open_store, tmp_path, capsys):
+    db = tmp_path / "app_data.db"; db.write_bytes(b"this is not a database" * 100)
+    store = open_store()
+    assert "corrupt" in capsys.readouterr().out
+    assert (tmp_path / "app_data.db.corrupt").read_bytes().startswith(b"this is not")
+    assert store.load()[2] == ["Bat", "Axolotl"]  # rebuilt from the sibling JSON
+
+
+def test_corrupt_database_without_json_starts_empty(open_store, tmp_path):
+    (tmp_path / "other.db").write_bytes(b"\0garbage" * 512)
+    settings_data, names_data, order = open_store("other.db").load()
+    assert settings_data == bot.DEFAULTS and names_data == {} and order == []
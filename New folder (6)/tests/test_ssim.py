@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from botsruntest import SsimStats, fast_ssim
+
+structural_similarity = pytest.importorskip("skimage.metrics").structural_similarity
+
+
+def sprite(seed=0, shape=(96, 128)):
+    # Smooth shapes plus texture, closer to a game sprite than white noise.
+    rng = np.random.default_rng(seed); yy, xx = np.mgrid[:shape[0], :shape[1]]
+    img = 90 + 60 * np.sin(xx / 9.0) * np.cos(yy / 13.0) + rng.normal(0, 12, shape)
+    img[20:60, 30:80] += 70
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def frames():
+    base, rng = sprite(), np.random.default_rng(1)
+    yield "identical", base, base.copy()
+    yield "noisy", base, np.clip(base + rng.normal(0, 20, base.shape), 0, 255).astype(np.uint8)
+    yield "shifted", base, np.roll(base, (3, 5), axis=(0, 1))
+    yield "inverted", base, 255 - base
+    yield "unrelated", base, sprite(seed=2)
+
+
+@pytest.mark.parametrize("name,template,frame", list(frames()), ids=lambda v: v if isinstance(v, str) else "")
+def test_fast_ssim_matches_skimage(name, template, frame):
+    expected = structural_similarity(template, frame, win_size=7, data_range=255)
+    assert fast_ssim(SsimStats(template), frame) == pytest.approx(expected, abs=1e-4)
+
+
+def test_precomputed_terms_give_the_same_score():
+    template, frame = sprite(), sprite(seed=3)
+    stats = SsimStats(template)
+    assert fast_ssim(SsimStats(template, mu=stats.mu, b2=stats.b2), frame) == fast_ssim(stats, frame)
+
+
+def test_stats_are_read_only():
+    stats = SsimStats(sprite())
+    with pytest.raises(ValueError):
+        stats.mu[0, 0] = 0
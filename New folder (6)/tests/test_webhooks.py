@@ -0,0 +1,100 @@
+import collections
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from botsruntest import WebhookDispatcher
+
+IMAGE = Image.new("RGB", (32, 24), (40, 90, 160))
+
+
+@pytest.fixture
+def endpoint():
+    # Local webhook endpoint. Each path answers from its script of (status, Retry-After) replies, then 204 for good;
+    # every request is logged as (path, time). A request waits while `gate` is clear.
+    scripts, hits, gate, arrived, lock = collections.defaultdict(list), [], threading.Event(), threading.Event(), threading.Lock()
+    gate.set()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with lock: hits.append((self.path, time.monotonic())); status, retry_after = scripts[self.path].pop(0) if scripts[self.path] else (204, None)
+            arrived.set(); gate.wait(10)
+            self.send_response(status)
+            if retry_after is not None: self.send_header("Retry-After", retry_after)
+            self.end_headers()
+        def log_message(self, *args): pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler); threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    yield collections.namedtuple("Endpoint", "base scripts hits gate arrived")(base, scripts, hits, gate, arrived)
+    gate.set(); server.shutdown(); server.server_close()
+
+
+def times(endpoint, path): return [t for p, t in endpoint.hits if p == path]
+
+
+def test_retries_5xx_and_429_until_delivered(endpoint):
+    endpoint.scripts["/a"] = [(503, None), (502, None)]; endpoint.scripts["/b"] = [(429, None)]
+    dispatcher = WebhookDispatcher(retries=3, backoff=0.01)
+    assert dispatcher.send([endpoint.base + "/a", endpoint.base + "/b"], "hello", IMAGE)
+    dispatcher.flush(); dispatcher.close()
+    assert len(times(endpoint, "/a")) == 3 and len(times(endpoint, "/b")) == 2
+    assert dispatcher.stats == {"sent": 2}
+
+
+def test_client_errors_are_not_retried(endpoint):
+    endpoint.scripts["/gone"] = [(404, None)]
+    dispatcher = WebhookDispatcher(retries=3, backoff=0.01)
+    dispatcher.send([endpoint.base + "/gone"], "hello", IMAGE); dispatcher.flush(); dispatcher.close()
+    assert len(times(endpoint, "/gone")) == 1 and dispatcher.stats == {"failed": 1}
+
+
+def test_gives_up_after_the_retry_budget(endpoint):
+    endpoint.scripts["/down"] = [(500, None)] * 10
+    dispatcher = WebhookDispatcher(retries=2, backoff=0.01)
+    dispatcher.send([endpoint.base + "/down"], "hello", IMAGE); dispatcher.flush(); dispatcher.close()
+    assert len(times(endpoint, "/down")) == 3 and dispatcher.stats == {"failed": 1}
+
+
+def test_waits_at_least_retry_after(endpoint):
+    endpoint.scripts["/slow"] = [(429, "0.4")]
+    dispatcher = WebhookDispatcher(retries=1, backoff=0.01)
+    dispatcher.send([endpoint.base + "/slow"], "hello", IMAGE); dispatcher.flush(); dispatcher.close()
+    first, second = times(endpoint, "/slow")
+    assert second - first >= 0.4 and dispatcher.stats == {"sent": 1}
+
+
+def test_unparseable_retry_after_falls_back_to_backoff(endpoint):
+    endpoint.scripts["/date"] = [(503, "Wed, 21 Oct 2015 07:28:00 GMT")]
+    dispatcher = WebhookDispatcher(retries=1, backoff=0.01)
+    dispatcher.send([endpoint.base + "/date"], "hello", IMAGE); dispatcher.flush(); dispatcher.close()
+    first, second = times(endpoint, "/date")
+    assert second - first < 1 and dispatcher.stats == {"sent": 1}
+
+
+def test_drops_new_messages_when_the_queue_is_full(endpoint):
+    endpoint.gate.clear()
+    dispatcher = WebhookDispatcher(max_pending=1, retries=0)
+    url = [endpoint.base + "/hook"]
+    assert dispatcher.send(url, "first", IMAGE) and endpoint.arrived.wait(5)  # the thread is now blocked posting it
+    start = time.monotonic()
+    assert dispatcher.send(url, "queued", IMAGE)
+    assert not dispatcher.send(url, "dropped", IMAGE)
+    assert time.monotonic() - start < 0.5  # send() never waits for room
+    endpoint.gate.set(); dispatcher.flush(); dispatcher.close()
+    assert len(times(endpoint, "/hook")) == 2 and dispatcher.stats == {"sent": 2, "dropped": 1}
+
+
+def test_close_does_not_wait_for_delivery(endpoint):
+    endpoint.gate.clear()
+    dispatcher = WebhookDispatcher(max_pending=2, retries=0)
+    dispatcher.send([endpoint.base + "/hook"], "first", IMAGE); endpoint.arrived.wait(5)
+    dispatcher.send([endpoint.base + "/hook"], "second", IMAGE); dispatcher.send([endpoint.base + "/hook"], "third", IMAGE)
+    start = time.monotonic(); dispatcher.close()
+    assert time.monotonic() - start < 0.5 and not dispatcher.send([endpoint.base + "/hook"], "late", IMAGE)
+    endpoint.gate.set(); dispatcher.thread.join(5)
+    assert not dispatcher.thread.is_alive() and dispatcher.stats["sent"] == 3